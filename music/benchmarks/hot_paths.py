@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for queue and helper hot paths, with stored baselines.
+
+Each case reports the best time per operation over several repeats. With
+--save the results become the baseline; otherwise they are compared with it
+and the script exits with status 1 when a case got slower by more than the
+threshold. Baselines only mean something on the machine that recorded them.
+
+Usage:
+    python benchmarks/hot_paths.py --save         # record baseline
+    python benchmarks/hot_paths.py                # compare, 25% threshold
+    python benchmarks/hot_paths.py -t 0.1 -k queue
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from utils.queue import MusicQueue, Track, MediaType
+from utils.helpers import clean_filename, format_duration
+from utils.yt import downloader
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Queue sizes: a typical chat and far past the per-chat limit
+SIZES = (Config.QUEUE_LIMIT, 10000)
+
+# Operations per timed batch
+BATCH = 100
+
+INPUTS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?t=42",
+    "https://soundcloud.com/artist/some-track",
+    "http://192.168.1.10:8000/music/song.mp3",
+    "never gonna give you up",
+    "lofi hip hop radio - beats to relax/study to",
+]
+
+INFO = {
+    'title': 'Rick Astley - Never Gonna Give You Up (Official Music Video)',
+    'duration': 213,
+    'webpage_url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'thumbnail': 'https://i.ytimg.com/vi/dQw4w9WgXcQ/maxresdefault.jpg',
+}
+
+def make_tracks(count: int) -> list:
+    """Build dummy tracks"""
+    return [
+        Track(f"Track {i}", 180 + i % 600, f"https://youtu.be/{i:011d}", "youtube", MediaType.AUDIO,
+              requested_by=f"user{i % 7}")
+        for i in range(count)
+    ]
+
+def filled(tracks: list) -> MusicQueue:
+    """Build an unlimited queue holding tracks"""
+    queue = MusicQueue(limit=None)
+    for track in tracks:
+        queue.add(track)
+    return queue
+
+def run_sync(coro):
+    """Drive a coroutine that never suspends"""
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("coroutine suspended")
+
+def measure(setup, op, batch: int, repeats: int) -> float:
+    """Best time per operation in microseconds, setup not included"""
+    best = float("inf")
+    for _ in range(repeats):
+        state = setup()
+        started = time.perf_counter()
+        for i in range(batch):
+            op(state, i)
+        best = min(best, (time.perf_counter() - started) / batch)
+    return best * 1e6
+
+def queue_cases(size: int):
+    """Queue operations at one size"""
+    tracks = make_tracks(size + BATCH)
+    head, extra = tracks[:size], tracks[size:]
+    yield f"queue.add[{size}]", lambda: filled(head), lambda q, i: q.add(extra[i])
+    yield f"queue.get_next[{size}]", lambda: filled(tracks), lambda q, i: q.get_next()
+    # The head pops the queue used to do, for comparison with get_next
+    yield f"queue.list_pop0[{size}]", lambda: list(tracks), lambda q, i: q.pop(0)
+    yield f"queue.remove_middle[{size}]", lambda: filled(tracks), lambda q, i: q.remove(len(q.queue) // 2)
+    yield f"queue.move_tail_to_head[{size}]", lambda: filled(head), lambda q, i: q.move(size - 1, 0)
+    yield f"queue.upcoming[{size}]", lambda: filled(head), lambda q, i: q.upcoming(2)
+    yield f"queue.shuffle[{size}]", lambda: filled(head), lambda q, i: q.shuffle()
+    yield f"queue.get_queue_text[{size}]", lambda: filled(head), lambda q, i: q.get_queue_text()
+
+def helper_cases():
+    """URL, formatting and track helpers"""
+    count = len(INPUTS)
+    titles = [INFO['title'] + ' <live>: "remix" / extended?' * n for n in range(1, 4)]
+    yield "is_url", lambda: None, lambda _, i: downloader.is_url(INPUTS[i % count])
+    yield "get_platform", lambda: None, lambda _, i: downloader.get_platform(INPUTS[i % count])
+    yield "clean_filename", lambda: None, lambda _, i: clean_filename(titles[i % 3])
+    yield "format_duration", lambda: None, lambda _, i: format_duration(i * 97)
+    yield "create_track_from_info", lambda: None, lambda _, i: run_sync(
+        downloader.create_track_from_info(INFO, MediaType.AUDIO, "user", 1, -100)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", action="store_true", help="store results as the new baseline")
+    parser.add_argument("-t", "--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("-r", "--repeats", type=int, default=5)
+    parser.add_argument("-k", "--filter", default="", help="only run cases containing this text")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args()
+
+    # Queues are built without limits and never cleared
+    Config.GLOBAL_QUEUE_LIMIT = sys.maxsize
+
+    cases = [case for size in SIZES for case in queue_cases(size)] + list(helper_cases())
+    # Cheap helpers need bigger batches to rise above timer noise
+    results = {
+        name: measure(setup, op, BATCH if name.startswith("queue.") else BATCH * 100, args.repeats)
+        for name, setup, op in cases if args.filter in name
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'case':<32}{'us/op':>12}{'baseline':>12}{'change':>10}")
+    for name, us in results.items():
+        base = baseline.get(name)
+        if base:
+            change = us / base - 1
+            flag = " !" if change > args.threshold else ""
+            if flag:
+                regressions.append(name)
+            print(f"{name:<32}{us:>12.3f}{base:>12.3f}{change:>+9.1%}{flag}")
+        else:
+            print(f"{name:<32}{us:>12.3f}{'-':>12}{'-':>10}")
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
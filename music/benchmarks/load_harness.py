@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the play, video and control handlers.
+
+The real handlers, queues, prefetcher, edit scheduler and assistant router
+run in-process against stand-ins for the outside world:
+
+    FakeClient / FakeMessage   Telegram, records sends and edits with API latency
+    FakeCalls                  PyTgCalls, join latency and stream end updates
+    fake downloader            search/info/download with delay and file size
+
+Every chat runs a session of commands drawn from a realistic mix with think
+time in between. Each --chats level runs in turn and reports per-command
+p50/p99 latency, throughput and event loop lag, so the level where /play
+starts to degrade stands out.
+
+Usage:
+    python benchmarks/load_harness.py --chats 100,500,2000 [--commands 10]
+        [--download-delay 0.3] [--join-latency 0.1] [--api-latency 0.03]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import logging
+from types import SimpleNamespace
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from utils import assistants
+from utils.assistants import router
+from utils.queue import MusicQueue, queues, get_queue
+from utils.tasks import playback_tasks
+from utils.editor import editor
+from utils.tracing import tracer
+from utils.yt import downloader
+from handlers import play, video, control
+
+# Relative weights of commands a chat sends
+COMMAND_MIX = {
+    'play': 45,
+    'video': 5,
+    'queue': 15,
+    'skip': 15,
+    'pause': 10,
+    'resume': 10,
+}
+
+HANDLERS = {
+    'play': play.play_command,
+    'video': video.video_command,
+    'queue': control.queue_command,
+    'skip': control.skip_command,
+    'pause': control.pause_command,
+    'resume': control.resume_command,
+}
+
+# Requester ids, ADMIN_ID is an admin in every chat
+ADMIN_ID = 1
+USER_IDS = range(2, 50)
+
+class Options:
+    """Simulated latencies, shared by the fakes"""
+    api_latency = 0.03
+    join_latency = 0.1
+    download_delay = 0.3
+    file_size = 64 * 1024
+    track_seconds = 5.0
+    catalog = 500
+
+def jitter(seconds: float) -> float:
+    """Latency with some spread"""
+    return random.uniform(seconds * 0.5, seconds * 1.5)
+
+class Recorder:
+    """Counts what the fakes were asked to do"""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def add(self, name: str):
+        """Count one call"""
+        self.counts[name] += 1
+
+recorder = Recorder()
+
+class FakeMessage:
+    """Message that answers like Telegram after API latency"""
+
+    _ids = 0
+
+    def __init__(self, client, chat_id: int, text: str = "", user_id: int = 0):
+        FakeMessage._ids += 1
+        self.id = FakeMessage._ids
+        self._client = client
+        self.chat = SimpleNamespace(id=chat_id)
+        self.from_user = SimpleNamespace(id=user_id, first_name=f"user{user_id}")
+        self.text = text
+        self.command = text.lstrip("/").split()
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        await asyncio.sleep(jitter(Options.api_latency))
+        recorder.add('sends')
+        return FakeMessage(self._client, self.chat.id, text)
+
+    async def edit_text(self, text: str, **kwargs) -> "FakeMessage":
+        await asyncio.sleep(jitter(Options.api_latency))
+        recorder.add('edits')
+        self.text = text
+        return self
+
+    async def edit_reply_markup(self, reply_markup=None) -> "FakeMessage":
+        return await self.edit_text(self.text)
+
+class FakeClient:
+    """Bot client, every chat has ADMIN_ID as its only admin"""
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> FakeMessage:
+        await asyncio.sleep(jitter(Options.api_latency))
+        recorder.add('sends')
+        return FakeMessage(self, chat_id, text)
+
+    async def get_chat_members(self, chat_id: int, filter=None):
+        await asyncio.sleep(jitter(Options.api_latency))
+        recorder.add('admin_fetches')
+        yield SimpleNamespace(user=SimpleNamespace(id=ADMIN_ID))
+
+class FakeCalls:
+    """PyTgCalls stand-in that ends streams after the scaled track length"""
+
+    def __init__(self, client: FakeClient):
+        self.client = client
+        self.timers = {}
+
+    def _schedule(self, chat_id: int):
+        """Send a stream end update when the track is over"""
+        self._cancel(chat_id)
+        track = get_queue(chat_id).current
+        seconds = Options.track_seconds if not track else min(track.duration, Options.track_seconds)
+        loop = asyncio.get_running_loop()
+        self.timers[chat_id] = loop.call_later(seconds, self._ended, chat_id)
+
+    def _ended(self, chat_id: int):
+        self.timers.pop(chat_id, None)
+        recorder.add('stream_ends')
+        asyncio.ensure_future(play.on_stream_end(self.client, chat_id))
+
+    def _cancel(self, chat_id: int):
+        timer = self.timers.pop(chat_id, None)
+        if timer:
+            timer.cancel()
+
+    async def join_group_call(self, chat_id: int, stream):
+        await asyncio.sleep(jitter(Options.join_latency))
+        recorder.add('joins')
+        self._schedule(chat_id)
+
+    async def change_stream(self, chat_id: int, stream):
+        await asyncio.sleep(jitter(Options.api_latency))
+        self._schedule(chat_id)
+
+    async def leave_group_call(self, chat_id: int):
+        await asyncio.sleep(jitter(Options.api_latency))
+        self._cancel(chat_id)
+
+    async def pause_stream(self, chat_id: int):
+        await asyncio.sleep(jitter(Options.api_latency))
+        self._cancel(chat_id)
+
+    async def resume_stream(self, chat_id: int):
+        await asyncio.sleep(jitter(Options.api_latency))
+        self._schedule(chat_id)
+
+class FakeAssistant:
+    """Assistant account backed by FakeCalls"""
+
+    client = None
+
+    def __init__(self, name: str, session_string: str):
+        self.name = name
+        self.call_py = FakeCalls(bot)
+        self.healthy = True
+        self.chats = set()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def is_member(self, chat_id: int) -> bool:
+        return True
+
+bot = FakeClient()
+
+def install_fake_downloader(directory: str):
+    """Replace network access of the shared downloader"""
+    paths = {}
+
+    def media_file(url: str, fmt: str) -> str:
+        key = (url, fmt)
+        if key not in paths:
+            path = os.path.join(directory, f"{len(paths)}.{fmt}")
+            with open(path, "wb") as f:
+                f.write(os.urandom(Options.file_size))
+            paths[key] = path
+        return paths[key]
+
+    async def search(query: str, limit: int = 5):
+        await asyncio.sleep(jitter(Options.download_delay / 3))
+        recorder.add('searches')
+        video_id = abs(hash(query)) % Options.catalog
+        return [{'link': f"https://www.youtube.com/watch?v={video_id:011d}"}]
+
+    async def get_info(url: str):
+        await asyncio.sleep(jitter(Options.download_delay / 3))
+        return {
+            'title': f"Track {url[-11:]}",
+            'duration': 180,
+            'webpage_url': url,
+            'thumbnail': '',
+        }
+
+    async def download(url: str, fmt: str, cancel_event=None):
+        await asyncio.sleep(jitter(Options.download_delay))
+        recorder.add('downloads')
+        return media_file(url, fmt)
+
+    async def download_audio(url: str, progress_callback=None, cancel_event=None):
+        return await download(url, 'mp3', cancel_event)
+
+    async def download_video(url: str, progress_callback=None, cancel_event=None):
+        return await download(url, 'mp4', cancel_event)
+
+    async def get_stream_url(url, media_type):
+        return None
+
+    downloader.search = search
+    downloader.get_info = get_info
+    downloader.download_audio = download_audio
+    downloader.download_video = download_video
+    downloader.get_stream_url = get_stream_url
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def watch_loop_lag(lags: list, interval: float = 0.05):
+    """Sample how late the event loop wakes up"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+async def chat_session(chat_id: int, commands: int, think: float, ramp: float, latencies: dict):
+    """One chat sending a series of commands"""
+    await asyncio.sleep(random.uniform(0, ramp))
+    names = list(COMMAND_MIX)
+    weights = list(COMMAND_MIX.values())
+
+    for _ in range(commands):
+        name = random.choices(names, weights)[0]
+        if name in ('play', 'video'):
+            text = f"/{name} song {random.randrange(Options.catalog)}"
+            user_id = random.choice(USER_IDS)
+        else:
+            text = f"/{name}"
+            user_id = ADMIN_ID
+
+        message = FakeMessage(bot, chat_id, text, user_id)
+        started = time.perf_counter()
+        await HANDLERS[name](bot, message)
+        latencies[name].append(time.perf_counter() - started)
+        await asyncio.sleep(random.expovariate(1 / think))
+
+def reset():
+    """Drop state left by the previous level"""
+    for chat_id in list(queues):
+        playback_tasks.cancel(chat_id)
+    for assistant in router.assistants:
+        for timer in assistant.call_py.timers.values():
+            timer.cancel()
+        assistant.call_py.timers.clear()
+        assistant.chats.clear()
+    router.assignments.clear()
+    queues.clear()
+    MusicQueue.total_queued = 0
+    MusicQueue.total_playing = 0
+    recorder.counts.clear()
+
+async def run_level(chats: int, args) -> dict:
+    """Run one concurrency level and collect results"""
+    reset()
+    latencies = defaultdict(list)
+    lags = []
+    lag_task = asyncio.create_task(watch_loop_lag(lags))
+    edits_before = editor.stats()
+
+    # Distinct chat ids per level so nothing carries over
+    base = -1000000000000 - chats * 10
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        chat_session(base - i, args.commands, args.think, args.ramp, latencies)
+        for i in range(chats)
+    ))
+    elapsed = time.perf_counter() - started
+    lag_task.cancel()
+
+    edits_after = editor.stats()
+    return {
+        'chats': chats,
+        'elapsed': elapsed,
+        'latencies': {name: sorted(values) for name, values in latencies.items()},
+        'lag': sorted(lags),
+        'counts': dict(recorder.counts),
+        'coalesced': edits_after['coalesced'] - edits_before['coalesced'],
+    }
+
+def report(result: dict):
+    """Print one level"""
+    total = sum(len(values) for values in result['latencies'].values())
+    lag = result['lag']
+    print(f"\n=== {result['chats']} chats: {total} commands in {result['elapsed']:.1f}s "
+          f"({total / result['elapsed']:.1f} cmd/s), loop lag p99 {percentile(lag, 0.99) * 1000:.1f}ms "
+          f"max {(lag[-1] if lag else 0) * 1000:.1f}ms")
+    print(f"{'command':<10}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in COMMAND_MIX:
+        values = result['latencies'].get(name, [])
+        if values:
+            print(f"{name:<10}{len(values):>8}{percentile(values, 0.5) * 1000:>10.1f}"
+                  f"{percentile(values, 0.99) * 1000:>10.1f}{values[-1] * 1000:>10.1f}")
+    counts = ", ".join(f"{name} {count}" for name, count in sorted(result['counts'].items()))
+    print(f"fakes: {counts}, edits coalesced {result['coalesced']}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", default="100,500,1000", help="comma-separated concurrency levels")
+    parser.add_argument("--commands", type=int, default=10, help="commands per chat")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between commands of a chat")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which chats start")
+    parser.add_argument("--assistants", type=int, default=4)
+    parser.add_argument("--api-latency", type=float, default=Options.api_latency)
+    parser.add_argument("--join-latency", type=float, default=Options.join_latency)
+    parser.add_argument("--download-delay", type=float, default=Options.download_delay)
+    parser.add_argument("--size", type=int, default=Options.file_size // 1024, help="downloaded file size in KB")
+    parser.add_argument("--track-seconds", type=float, default=Options.track_seconds,
+                        help="seconds a track plays before its stream end update")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    Options.api_latency = args.api_latency
+    Options.join_latency = args.join_latency
+    Options.download_delay = args.download_delay
+    Options.file_size = args.size * 1024
+    Options.track_seconds = args.track_seconds
+
+    logging.basicConfig(level=logging.ERROR)
+    Config.GLOBAL_QUEUE_LIMIT = sys.maxsize
+
+    with tempfile.TemporaryDirectory() as directory:
+        tracer.path = os.path.join(directory, "traces.jsonl")
+        install_fake_downloader(directory)
+        assistants.Assistant = FakeAssistant
+        for index in range(args.assistants):
+            router.add(f"load{index + 1}", "")
+
+        for chats in (int(level) for level in args.chats.split(",")):
+            report(await run_level(chats, args))
+        reset()
+
+if __name__ == "__main__":
+    asyncio.run(main())
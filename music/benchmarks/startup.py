@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Cold start time, from process spawn to the first handled update.
+
+Each run starts a fresh interpreter that imports main, builds MusicBot,
+runs MusicBot.start() against stand-in Telegram clients that take
+--login-latency seconds to connect, then handles a /queue update. The
+phases are reported as medians over the runs.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--login-latency 0.5] [--assistants 2] [--uvloop]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+MUSIC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASES = ("interpreter", "import", "init", "start", "first_update")
+
+def child(login_latency: float, assistants: int):
+    """Measure one cold start, runs in its own process"""
+    spawned = float(os.environ["STARTUP_SPAWNED"])
+    marks = {"interpreter": time.time()}
+
+    sys.path.insert(0, MUSIC_DIR)
+    import asyncio
+    from types import SimpleNamespace
+
+    import main
+    marks["import"] = time.time()
+
+    from utils import assistants as assistant_module
+
+    class FakeCalls:
+        """PyTgCalls that connects after the login latency"""
+
+        async def start(self):
+            await asyncio.sleep(login_latency)
+
+        async def stop(self):
+            pass
+
+        def on_stream_end(self):
+            return lambda func: func
+
+    class FakeAssistant(assistant_module.Assistant):
+        """Assistant without a Telegram account"""
+
+        def __init__(self, name: str, session_string: str):
+            self.name = name
+            self.client = SimpleNamespace(is_connected=True)
+            self.call_py = FakeCalls()
+            self.healthy = False
+            self.chats = set()
+
+    class FakeApp:
+        """Bot client that logs in after the login latency"""
+
+        is_connected = False
+
+        async def start(self):
+            await asyncio.sleep(login_latency)
+            self.me = SimpleNamespace(id=1, username="bench_bot")
+            self.is_connected = True
+
+        async def stop(self):
+            pass
+
+    class FakeMessage:
+        """Incoming /queue command"""
+
+        def __init__(self):
+            self.chat = SimpleNamespace(id=-100)
+            self.from_user = SimpleNamespace(id=1, first_name="bench")
+            self.text = "/queue"
+            self.command = ["queue"]
+
+        async def reply_text(self, text: str, **kwargs):
+            return self
+
+    assistant_module.Assistant = FakeAssistant
+    main.Config.SESSION_STRINGS = ["fake"] * (assistants - 1)
+
+    async def run():
+        bot = main.MusicBot()
+        bot.app = FakeApp()
+        marks["init"] = time.time()
+
+        await bot.start()
+        marks["start"] = time.time()
+
+        from handlers import control
+        await control.queue_command(bot.app, FakeMessage())
+        marks["first_update"] = time.time()
+        marks["yt_dlp_loaded"] = "yt_dlp" in sys.modules
+
+        bot.warm_up_task.cancel()
+
+    main.install_event_loop()
+    asyncio.run(run())
+
+    # Phase lengths in seconds, each from the end of the previous one
+    previous = spawned
+    result = {}
+    for phase in PHASES:
+        result[phase] = marks[phase] - previous
+        previous = marks[phase]
+    result["total"] = previous - spawned
+    result["yt_dlp_loaded"] = marks["yt_dlp_loaded"]
+    print(json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--login-latency", type=float, default=0.5, help="seconds each client takes to connect")
+    parser.add_argument("--assistants", type=int, default=2)
+    parser.add_argument("--uvloop", action="store_true", help="run the bot on uvloop")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.login_latency, args.assistants)
+        return
+
+    env = dict(
+        os.environ,
+        BOT_TOKEN="0:bench", API_ID="1", API_HASH="bench", SESSION_STRING="bench",
+        UVLOOP="true" if args.uvloop else "false", MONGO_URI="", METRICS_PORT="0", LOG_CHAT_ID="",
+    )
+    command = [sys.executable, os.path.abspath(__file__), "--child",
+               "--login-latency", str(args.login_latency), "--assistants", str(args.assistants)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(args.runs):
+            env["STARTUP_SPAWNED"] = repr(time.time())
+            output = subprocess.run(command, cwd=directory, env=env, capture_output=True, text=True, check=True)
+            results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print(f"{args.runs} runs, {args.assistants} assistants, login latency {args.login_latency}s, "
+          f"{'uvloop' if args.uvloop else 'asyncio'}")
+    print(f"{'phase':<16}{'median ms':>12}{'max ms':>12}")
+    for phase in PHASES + ("total",):
+        values = [r[phase] * 1000 for r in results]
+        print(f"{phase:<16}{statistics.median(values):>12.1f}{max(values):>12.1f}")
+    loaded = sum(r["yt_dlp_loaded"] for r in results)
+    print(f"yt-dlp already imported at first update in {loaded}/{args.runs} runs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Per-request YoutubeDL setup overhead: a new instance per call vs the pool.
+
+Usage:
+    python benchmarks/ytdl_pool.py [-n 200] [--url http://localhost:8000/song.mp3]
+
+Without --url only instance setup is measured for every profile. With --url
+each iteration also runs the info extraction get_info() does, on the info
+profile only.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from utils import ytworker
+from utils.yt import downloader
+
+def fresh_instance(profile: str, opts: dict, url: str = None):
+    """What every call did before pooling"""
+    with yt_dlp.YoutubeDL(dict(opts)) as ydl:
+        if url:
+            ydl.extract_info(url, download=False)
+
+def pooled_instance(profile: str, opts: dict, url: str = None):
+    """Check out a pooled instance"""
+    with ytworker.get_pool(profile, opts).acquire() as ydl:
+        if url:
+            ydl.extract_info(url, download=False)
+
+def measure(func, profile: str, opts: dict, iterations: int, url: str = None) -> list:
+    """Time func over a number of iterations, in milliseconds"""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func(profile, opts, url)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    parser.add_argument("--url", help="Media URL to extract on every iteration")
+    args = parser.parse_args()
+
+    # First construction loads the extractor list, keep it out of both runs
+    yt_dlp.YoutubeDL({'quiet': True}).close()
+    ytworker.warm_pools(downloader.profiles)
+
+    profiles = {'info': downloader.profiles['info']} if args.url else downloader.profiles
+
+    print(f"{'profile':<14}{'fresh ms':>12}{'pooled ms':>12}{'saved':>10}")
+    for profile, opts in profiles.items():
+        fresh = statistics.median(measure(fresh_instance, profile, opts, args.iterations, args.url))
+        pooled = statistics.median(measure(pooled_instance, profile, opts, args.iterations, args.url))
+        print(f"{profile:<14}{fresh:>12.3f}{pooled:>12.3f}{(1 - pooled / fresh) * 100:>9.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ class Config:
     API_ID = int(os.getenv("API_ID", 0))
     API_HASH = os.getenv("API_HASH")
     SESSION_STRING = os.getenv("SESSION_STRING")
+    SESSION_STRINGS = [x.strip() for x in os.getenv("SESSION_STRINGS", "").split(",") if x.strip()]  # Extra assistants
     
     # Optional Configuration
     LOG_CHAT_ID = int(os.getenv("LOG_CHAT_ID", 0)) if os.getenv("LOG_CHAT_ID") else None
@@ -18,15 +19,101 @@ class Config:
     
     # Database Configuration
     MONGO_URI = os.getenv("MONGO_URI")
+    MONGO_DB = os.getenv("MONGO_DB", "music_bot")
+    QUEUE_FLUSH_INTERVAL = 1.0  # Seconds queue changes are batched before being written
     
     # Bot Settings
     MAX_DURATION = 3600  # 1 hour max duration
     QUEUE_LIMIT = 50     # Max 50 songs in queue
+    GLOBAL_QUEUE_LIMIT = int(os.getenv("GLOBAL_QUEUE_LIMIT", 100000))  # Max songs queued across all chats
+    ADMIN_CACHE_TTL = 600  # Seconds group admin lists are trusted without a member update
     
     # Audio/Video Quality
     AUDIO_BITRATE = 512
     VIDEO_BITRATE = 1000
     
+    # Media Cache
+    DOWNLOAD_DIR = "downloads"
+    MEDIA_CACHE_SIZE = int(os.getenv("MEDIA_CACHE_SIZE", 2048)) * 1024 * 1024  # Disk budget, env value in MB
+    PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", 2))  # Queued tracks downloaded ahead of playback
+    
+    # PCM Cache (audio transcoded once, played without a per-stream ffmpeg)
+    PCM_CACHE = os.getenv("PCM_CACHE", "false").lower() == "true"  # About 11 MB of disk per minute of audio
+    PCM_SAMPLE_RATE = 48000
+    PCM_CHANNELS = 2
+    TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", 1))  # ffmpeg processes run at once
+    DECODE_FANOUT = os.getenv("DECODE_FANOUT", "false").lower() == "true"  # Chats playing a track share one decode
+    FANOUT_DIR = "temp/fanout"  # Per-chat pipes fed from shared decodes
+    FANOUT_WORKERS = 2          # Threads reading shared decodes for the pipes
+    
+    # Metadata Cache
+    INFO_CACHE_DB = "cache/info.db"
+    INFO_CACHE_TTL = int(os.getenv("INFO_CACHE_TTL", 6 * 3600))  # Seconds before track info is extracted again
+    INFO_CACHE_ENTRIES = 1000    # Entries kept in memory
+    INFO_CACHE_ROWS = 50000      # Rows kept in SQLite
+    STREAM_URL_TTL = 3600        # Assumed lifetime of media URLs without an expire parameter
+    
+    # Search Cache
+    SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 600))  # Seconds search results are reused
+    SEARCH_NEGATIVE_TTL = 60     # Seconds empty results are reused
+    SEARCH_CACHE_ENTRIES = 2000
+    
+    # Worker Pools
+    INFO_WORKERS = 2  # Threads for info cache reads and writes
+    REGISTRY_WORKERS = 1  # Threads for chat registry queries, which take turns on one connection
+    SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", 4))
+    EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", 4))
+    DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 4))
+    YTDL_BACKEND = os.getenv("YTDL_BACKEND", "thread")  # "thread", "process" or "broker"
+    PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", os.cpu_count() or 2))
+    YTDL_POOL_SIZE = 4  # Reusable YoutubeDL instances per option profile
+    
+    # Event Loop
+    UVLOOP = os.getenv("UVLOOP", "false").lower() == "true"  # Run on uvloop if it is installed
+    
+    # Worker Broker (YTDL_BACKEND=broker)
+    BROKER_SOCKET = os.getenv("BROKER_SOCKET", "cache/broker.sock")
+    BROKER_WORKERS = int(os.getenv("BROKER_WORKERS", 2))  # Worker processes started by the bot
+    WORKER_SLOTS = int(os.getenv("WORKER_SLOTS", 4))      # Concurrent jobs per worker process
+    JOB_RETRIES = 2              # Times a job is retried after its worker died
+    BROKER_PING_INTERVAL = 10    # Seconds between worker health checks
+    BROKER_JOB_WAIT = int(os.getenv("BROKER_JOB_WAIT", 60))  # Seconds a job waits for a worker before failing
+    
+    # HTTP Downloads
+    HTTP_POOL_SIZE = 100  # Connections kept by the shared HTTP session
+    DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", 4))  # Parallel range requests per direct download
+    
+    # Direct Streaming (play the remote URL while the cache download runs)
+    STREAM_AUDIO = os.getenv("STREAM_AUDIO", "false").lower() == "true"
+    STREAM_VIDEO = os.getenv("STREAM_VIDEO", "false").lower() == "true"
+    
+    # Broadcasts
+    CHATS_DB = "cache/chats.db"
+    BROADCAST_RATE = 20              # Messages per second across all broadcast workers
+    BROADCAST_CONCURRENCY = 10       # Sends in flight at once
+    BROADCAST_PROGRESS_INTERVAL = 5  # Seconds between progress updates
+    
+    # Message Edits
+    EDIT_CHAT_INTERVAL = 1.0  # Seconds between edits in one chat
+    EDIT_RATE = 20            # Edits per second across all chats
+    
+    # Metrics (METRICS_PORT=0 disables the HTTP endpoint)
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+    
+    # Tracing
+    TRACE_FILE = "cache/traces.jsonl"      # Finished traces, one JSON object per line
+    TRACE_FILE_SIZE = 10 * 1024 * 1024     # Bytes before the file is rotated
+    TRACE_KEEP = 200                       # Recent traces kept for /trace
+    
+    # Playback
+    COMPLETION_FALLBACK = 10  # Seconds past the track duration before assuming the stream ended
+    
+    # Assistants
+    ASSISTANT_LOAD_FACTOR = 1.25   # Max calls per assistant relative to the average
+    ASSISTANT_HEALTH_INTERVAL = 30 # Seconds between assistant connection checks
+    FAILOVER_CONCURRENCY = 10      # Calls moved at once off a dropped assistant
+    
     # Supported Platforms
     SUPPORTED_FORMATS = ['.mp3', '.mp4', '.wav', '.flac', '.m4a', '.webm', '.mkv']
     SUPPORTED_SOURCES = ['youtube', 'soundcloud', 'spotify']
@@ -1,11 +1,20 @@
 from pyrogram import Client, filters
-from pyrogram.types import Message
-from utils.queue import get_queue, queues
-from utils.helpers import is_admin
+from pyrogram.types import Message, ChatMemberUpdated
+from utils.queue import get_queue, queues, MusicQueue
+from utils.store import queue_store
+from utils.helpers import is_admin, format_bytes
+from utils.cache import media_cache, info_cache, search_cache
+from utils.executors import get_pools
+from utils.assistants import router
+from utils.admins import admin_cache
+from utils.broadcast import chat_registry, broadcaster
+from utils.editor import editor
+from utils.transcode import transcoder
+from utils.fanout import fanout
+from utils.yt import downloader
+from utils.tracing import tracer
 from config import Config
-import psutil
 import os
-import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +27,9 @@ async def stats_command(client: Client, message: Message):
             await message.reply_text("❌ **You don't have permission to use this command!**")
             return
         
+        # Imported on first use, it is slow to load
+        import psutil
+        
         # Get system stats
         cpu_percent = psutil.cpu_percent()
         memory = psutil.virtual_memory()
@@ -25,8 +37,37 @@ async def stats_command(client: Client, message: Message):
         
         # Get bot stats
         active_chats = len(queues)
-        total_tracks = sum(len(q.queue) + (1 if q.current else 0) for q in queues.values())
-        playing_chats = sum(1 for q in queues.values() if q.is_playing)
+        total_tracks = MusicQueue.total_queued + MusicQueue.total_playing
+        playing_chats = MusicQueue.total_playing
+        
+        # Get cache stats
+        cache_stats = media_cache.stats()
+        info_stats = info_cache.stats()
+        search_stats = search_cache.stats()
+        transcode_stats = transcoder.stats()
+        pcm_line = (
+            f"• PCM: {transcode_stats['completed']} transcoded, {transcode_stats['pending']} pending, "
+            f"{transcode_stats['failed']} failed\n"
+        ) if Config.PCM_CACHE or Config.DECODE_FANOUT else ""
+        fanout_stats = fanout.stats()
+        fanout_line = (
+            f"• Shared Decodes: {fanout_stats['feeds']} chats fed, {fanout_stats['shared']} joined a running decode\n"
+        ) if Config.DECODE_FANOUT else ""
+        
+        # Get worker pool gauges
+        pool_lines = "".join(
+            f"• {stats['name'].title()}: {stats['running']}/{stats['workers']} busy, "
+            f"{stats['queued']} queued, avg wait {stats['avg_wait']:.2f}s\n"
+            for stats in (pool.stats() for pool in get_pools().values())
+        )
+        
+        edit_stats = editor.stats()
+        
+        # Get assistant load
+        assistant_lines = "".join(
+            f"• {stats['name']}: {stats['calls']} calls{'' if stats['healthy'] else ' (down)'}\n"
+            for stats in router.stats()
+        )
         
         stats_text = (
             f"📊 **Bot Statistics**\n\n"
@@ -38,7 +79,26 @@ async def stats_command(client: Client, message: Message):
             f"• Active Chats: {active_chats}\n"
             f"• Playing Chats: {playing_chats}\n"
             f"• Total Tracks: {total_tracks}\n"
-            f"• Uptime: {get_uptime()}"
+            f"• Uptime: {get_uptime()}\n\n"
+            f"**Media Cache:**\n"
+            f"• Files: {cache_stats['files']} ({format_bytes(cache_stats['size'])} / {format_bytes(cache_stats['max_size'])})\n"
+            f"• Hit Ratio: {cache_stats['hit_ratio'] * 100:.1f}% ({cache_stats['hits']} hits, {cache_stats['misses']} misses)\n"
+            f"• Downloads: {len(downloader.downloads)} running, {downloader.coalesced} shared\n"
+            f"{pcm_line}"
+            f"{fanout_line}\n"
+            f"**Info Cache:**\n"
+            f"• Entries in memory: {info_stats['entries']}\n"
+            f"• Hit Ratio: {info_stats['hit_ratio'] * 100:.1f}% "
+            f"({info_stats['memory_hits']} memory, {info_stats['disk_hits']} disk, {info_stats['misses']} misses)\n\n"
+            f"**Search Cache:**\n"
+            f"• Hit Ratio: {search_stats['hit_ratio'] * 100:.1f}% "
+            f"({search_stats['hits']} hits, {search_stats['coalesced']} shared, {search_stats['misses']} misses)\n\n"
+            f"**Workers:**\n"
+            f"{pool_lines}\n"
+            f"**Assistants:**\n"
+            f"{assistant_lines}\n"
+            f"**Message Edits:**\n"
+            f"• Sent: {edit_stats['edits']} ({edit_stats['coalesced']} coalesced, {edit_stats['pending']} pending)"
         )
         
         await message.reply_text(stats_text)
@@ -47,6 +107,19 @@ async def stats_command(client: Client, message: Message):
         logger.error(f"Stats command error: {e}")
         await message.reply_text("❌ **Error:** Could not get statistics.")
 
+@Client.on_chat_member_updated()
+async def member_updated(client: Client, update: ChatMemberUpdated):
+    """Keep cached group admins in sync with promotions and demotions"""
+    member = update.new_chat_member or update.old_chat_member
+    if member and member.user:
+        admin_cache.update(
+            update.chat.id,
+            member.user.id,
+            update.new_chat_member.status if update.new_chat_member else None
+        )
+    else:
+        admin_cache.invalidate(update.chat.id)
+
 @Client.on_message(filters.command(["logs"]) & filters.private)
 async def logs_command(client: Client, message: Message):
     """Send bot logs (admin only)"""
@@ -74,35 +147,90 @@ async def broadcast_command(client: Client, message: Message):
             return
         
         if len(message.command) < 2:
-            await message.reply_text("**Usage:** `/broadcast <message>`")
+            await message.reply_text(
+                "**Usage:** `/broadcast <message>`\n\n"
+                "• `/broadcast resume` - Continue an interrupted broadcast\n"
+                "• `/broadcast cancel` - Stop the running broadcast"
+            )
             return
         
-        broadcast_text = message.text.split(None, 1)[1]
+        argument = message.text.split(None, 1)[1]
         
-        sent = 0
-        failed = 0
+        if argument == "cancel":
+            if broadcaster.cancel():
+                await message.reply_text("⏹️ **Stopping broadcast...**")
+            else:
+                await message.reply_text("❌ **No broadcast is running!**")
+            return
+        
+        if broadcaster.running:
+            await message.reply_text("❌ **A broadcast is already running!** Use `/broadcast cancel` to stop it.")
+            return
         
         status_msg = await message.reply_text("📡 **Broadcasting message...**")
         
-        for chat_id in queues.keys():
-            try:
-                await client.send_message(chat_id, f"📢 **Broadcast Message:**\n\n{broadcast_text}")
-                sent += 1
-            except:
-                failed += 1
+        if argument == "resume":
+            if not await broadcaster.start(client, status_msg):
+                editor.edit(status_msg, "❌ **No interrupted broadcast to resume!**")
+        else:
+            await broadcaster.start(client, status_msg, argument)
+    
+    except Exception as e:
+        logger.error(f"Broadcast command error: {e}")
+        await message.reply_text("❌ **Error:** Could not broadcast message.")
+
+@Client.on_message(filters.command(["trace"]) & filters.private)
+async def trace_command(client: Client, message: Message):
+    """Show the slowest recent requests by stage, or one trace (admin only)"""
+    try:
+        if not is_admin(message):
+            await message.reply_text("❌ **You don't have permission to use this command!**")
+            return
+        
+        # One trace with all its spans
+        if len(message.command) > 1:
+            trace = tracer.find(message.command[1])
+            if not trace:
+                await message.reply_text("❌ **Trace not found!**")
+                return
             
-            # Small delay to avoid rate limiting
-            await asyncio.sleep(0.1)
+            span_lines = "".join(
+                f"• {span['name']}: {span['duration']:.2f}s at +{span['start'] - trace.started:.2f}s"
+                f"{' (' + span['error'] + ')' if span['error'] else ''}\n"
+                for span in trace.spans
+            )
+            await message.reply_text(
+                f"🔎 **Trace** `{trace.id}`\n\n"
+                f"**Request:** /{trace.name} in `{trace.chat_id}`\n"
+                f"**Text:** {trace.detail}\n"
+                f"**Total:** {trace.duration:.2f}s\n\n"
+                f"{span_lines or 'No stages recorded.'}"
+            )
+            return
+        
+        traces = tracer.slowest(10)
+        if not traces:
+            await message.reply_text("🔎 **No requests traced yet!**")
+            return
+        
+        lines = []
+        for trace in traces:
+            stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in trace.stages().items())
+            lines.append(f"• **{trace.duration:.2f}s** /{trace.name} `{trace.id[:8]}`\n  {stages or 'no stages'}")
         
-        await status_msg.edit_text(
-            f"📡 **Broadcast Complete!**\n\n"
-            f"✅ **Sent:** {sent}\n"
-            f"❌ **Failed:** {failed}"
+        await message.reply_text(
+            "🔎 **Slowest Recent Requests**\n\n" + "\n".join(lines) +
+            "\n\nUse `/trace <id>` for details."
         )
     
     except Exception as e:
-        logger.error(f"Broadcast command error: {e}")
-        await message.reply_text("❌ **Error:** Could not broadcast message.")
+        logger.error(f"Trace command error: {e}")
+        await message.reply_text("❌ **Error:** Could not show traces.")
+
+@Client.on_message((filters.group | filters.private) & filters.incoming, group=-1)
+async def register_chat(client: Client, message: Message):
+    """Remember every chat the bot is used in as a broadcast target"""
+    chat_registry.add(message.chat.id)
 
 @Client.on_message(filters.command(["cleanup"]) & filters.private)
 async def cleanup_command(client: Client, message: Message):
@@ -112,18 +240,19 @@ async def cleanup_command(client: Client, message: Message):
             await message.reply_text("❌ **You don't have permission to use this command!**")
             return
         
-        # Clean up downloads directory
-        downloads_dir = "downloads"
+        # Clean up downloads directory, keeping files that are playing
+        cleaned_files, freed_space = media_cache.clear()
+        
         temp_dir = "temp"
         cache_dir = "cache"
         
-        cleaned_files = 0
-        freed_space = 0
-        
-        for directory in [downloads_dir, temp_dir, cache_dir]:
+        for directory in [temp_dir, cache_dir]:
             if os.path.exists(directory):
                 for filename in os.listdir(directory):
                     filepath = os.path.join(directory, filename)
+                    # Keep the metadata and chat databases, traces and the broker socket
+                    if filepath.startswith((Config.INFO_CACHE_DB, Config.CHATS_DB, Config.TRACE_FILE)) or filepath == Config.BROKER_SOCKET:
+                        continue
                     try:
                         file_size = os.path.getsize(filepath)
                         os.remove(filepath)
@@ -156,10 +285,13 @@ async def restart_command(client: Client, message: Message):
         for chat_id, queue in queues.items():
             try:
                 if queue.is_playing:
-                    await client.call_py.leave_group_call(chat_id)
+                    await router.leave(chat_id)
             except:
                 pass
         
+        # Save queues so they are restored after the restart
+        await queue_store.flush()
+        
         # Clear all queues
         queues.clear()
         
@@ -204,6 +336,7 @@ async def help_command(client: Client, message: Message):
             f"• `/np` - Now playing info\n"
             f"• `/loop` - Toggle loop mode\n"
             f"• `/shuffle` - Shuffle queue\n"
+            f"• `/move <from> <to>` - Move a queued track\n"
             f"• `/clear` - Clear queue\n\n"
             f"**🎯 Supported Sources:**\n"
             f"• YouTube (youtube.com, youtu.be)\n"
@@ -1,7 +1,10 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-from utils.queue import get_queue, clear_queue
-from utils.helpers import is_admin, is_group_admin
+from utils.queue import load_queue, clear_queue
+from utils.helpers import is_admin, is_group_admin, reply
+from utils.cache import media_cache
+from utils.tasks import playback_tasks
+from utils.assistants import router
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,20 +15,24 @@ async def pause_command(client: Client, message: Message):
     try:
         # Check admin permission
         if not await is_group_admin(message) and not is_admin(message):
-            await message.reply_text("❌ **You need to be an admin to control playback!**")
+            await reply(message, "❌ **You need to be an admin to control playback!**")
             return
         
         chat_id = message.chat.id
-        queue = get_queue(chat_id)
+        queue = await load_queue(chat_id)
         
         if not queue.is_playing or queue.is_paused:
-            await message.reply_text("❌ **Nothing is playing or already paused!**")
+            await reply(message, "❌ **Nothing is playing or already paused!**")
             return
         
-        await client.call_py.pause_stream(chat_id)
-        queue.is_paused = True
+        await router.call_py(chat_id).pause_stream(chat_id)
         
-        await message.reply_text(
+        # Import here to avoid circular imports
+        from handlers.play import pause_completion
+        pause_completion(chat_id)
+        
+        await reply(
+            message,
             f"⏸️ **Paused**\n\n🎵 **Track:** {queue.current.title if queue.current else 'Unknown'}",
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("▶️ Resume", callback_data="resume")]
@@ -34,7 +41,7 @@ async def pause_command(client: Client, message: Message):
     
     except Exception as e:
         logger.error(f"Pause command error: {e}")
-        await message.reply_text("❌ **Error:** Could not pause playback.")
+        await reply(message, "❌ **Error:** Could not pause playback.")
 
 @Client.on_message(filters.command(["resume"]) & filters.group)
 async def resume_command(client: Client, message: Message):
@@ -42,20 +49,24 @@ async def resume_command(client: Client, message: Message):
     try:
         # Check admin permission
         if not await is_group_admin(message) and not is_admin(message):
-            await message.reply_text("❌ **You need to be an admin to control playback!**")
+            await reply(message, "❌ **You need to be an admin to control playback!**")
             return
         
         chat_id = message.chat.id
-        queue = get_queue(chat_id)
+        queue = await load_queue(chat_id)
         
         if not queue.is_paused:
-            await message.reply_text("❌ **Nothing is paused!**")
+            await reply(message, "❌ **Nothing is paused!**")
             return
         
-        await client.call_py.resume_stream(chat_id)
-        queue.is_paused = False
+        await router.call_py(chat_id).resume_stream(chat_id)
+        
+        # Import here to avoid circular imports
+        from handlers.play import resume_completion
+        resume_completion(client, chat_id)
         
-        await message.reply_text(
+        await reply(
+            message,
             f"▶️ **Resumed**\n\n🎵 **Track:** {queue.current.title if queue.current else 'Unknown'}",
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("⏸️ Pause", callback_data="pause")]
@@ -64,7 +75,7 @@ async def resume_command(client: Client, message: Message):
     
     except Exception as e:
         logger.error(f"Resume command error: {e}")
-        await message.reply_text("❌ **Error:** Could not resume playback.")
+        await reply(message, "❌ **Error:** Could not resume playback.")
 
 @Client.on_message(filters.command(["skip", "next"]) & filters.group)
 async def skip_command(client: Client, message: Message):
@@ -72,41 +83,38 @@ async def skip_command(client: Client, message: Message):
     try:
         # Check admin permission
         if not await is_group_admin(message) and not is_admin(message):
-            await message.reply_text("❌ **You need to be an admin to control playback!**")
+            await reply(message, "❌ **You need to be an admin to control playback!**")
             return
         
         chat_id = message.chat.id
-        queue = get_queue(chat_id)
+        queue = await load_queue(chat_id)
         
         if not queue.is_playing and not queue.current:
-            await message.reply_text("❌ **Nothing is playing!**")
+            await reply(message, "❌ **Nothing is playing!**")
             return
         
         current_title = queue.current.title if queue.current else "Unknown"
+        playback_tasks.cancel(chat_id)
         
-        # Clean up current file
+        # Release current file back to the cache
         if queue.current and queue.current.filepath:
-            try:
-                import os
-                os.remove(queue.current.filepath)
-            except:
-                pass
+            media_cache.unpin(queue.current.filepath)
         
         if queue.queue:
             # Import here to avoid circular imports
-            from handlers.play import start_playback
+            from handlers.play import play_next
             
-            skip_msg = await message.reply_text(f"⏭️ **Skipped:** {current_title}\n\n🔄 **Loading next track...**")
-            await start_playback(client, chat_id, skip_msg)
+            skip_msg = await reply(message, f"⏭️ **Skipped:** {current_title}\n\n🔄 **Loading next track...**")
+            await play_next(client, chat_id, skip_msg)
         else:
             # No more tracks
-            await client.call_py.leave_group_call(chat_id)
+            await router.leave(chat_id)
             queue.clear()
-            await message.reply_text(f"⏭️ **Skipped:** {current_title}\n\n✅ **Queue finished!** Left voice chat.")
+            await reply(message, f"⏭️ **Skipped:** {current_title}\n\n✅ **Queue finished!** Left voice chat.")
     
     except Exception as e:
         logger.error(f"Skip command error: {e}")
-        await message.reply_text("❌ **Error:** Could not skip track.")
+        await reply(message, "❌ **Error:** Could not skip track.")
 
 @Client.on_message(filters.command(["stop", "end"]) & filters.group)
 async def stop_command(client: Client, message: Message):
@@ -114,27 +122,25 @@ async def stop_command(client: Client, message: Message):
     try:
         # Check admin permission
         if not await is_group_admin(message) and not is_admin(message):
-            await message.reply_text("❌ **You need to be an admin to control playback!**")
+            await reply(message, "❌ **You need to be an admin to control playback!**")
             return
         
         chat_id = message.chat.id
-        queue = get_queue(chat_id)
+        queue = await load_queue(chat_id)
         
         if not queue.is_playing and not queue.current:
-            await message.reply_text("❌ **Nothing is playing!**")
+            await reply(message, "❌ **Nothing is playing!**")
             return
         
-        # Clean up current file
+        playback_tasks.cancel(chat_id)
+        
+        # Release current file back to the cache
         if queue.current and queue.current.filepath:
-            try:
-                import os
-                os.remove(queue.current.filepath)
-            except:
-                pass
+            media_cache.unpin(queue.current.filepath)
         
         # Leave voice chat
         try:
-            await client.call_py.leave_group_call(chat_id)
+            await router.leave(chat_id)
         except:
             pass
         
@@ -142,7 +148,8 @@ async def stop_command(client: Client, message: Message):
         tracks_cleared = len(queue.queue)
         queue.clear()
         
-        await message.reply_text(
+        await reply(
+            message,
             f"⏹️ **Playback stopped!**\n\n"
             f"🗑️ **Cleared {tracks_cleared} tracks from queue**\n"
             f"✅ **Left voice chat**"
@@ -150,13 +157,13 @@ async def stop_command(client: Client, message: Message):
     
     except Exception as e:
         logger.error(f"Stop command error: {e}")
-        await message.reply_text("❌ **Error:** Could not stop playback.")
+        await reply(message, "❌ **Error:** Could not stop playback.")
 
 @Client.on_message(filters.command(["queue", "q"]) & filters.group)
 async def queue_command(client: Client, message: Message):
     """Show current queue"""
     try:
-        queue = get_queue(message.chat.id)
+        queue = await load_queue(message.chat.id)
         queue_text = queue.get_queue_text()
         
         keyboard = None
@@ -172,11 +179,11 @@ async def queue_command(client: Client, message: Message):
                 ]
             ])
         
-        await message.reply_text(queue_text, reply_markup=keyboard)
+        await reply(message, queue_text, reply_markup=keyboard)
     
     except Exception as e:
         logger.error(f"Queue command error: {e}")
-        await message.reply_text("❌ **Error:** Could not get queue information.")
+        await reply(message, "❌ **Error:** Could not get queue information.")
 
 @Client.on_message(filters.command(["loop"]) & filters.group)
 async def loop_command(client: Client, message: Message):
@@ -184,20 +191,21 @@ async def loop_command(client: Client, message: Message):
     try:
         # Check admin permission
         if not await is_group_admin(message) and not is_admin(message):
-            await message.reply_text("❌ **You need to be an admin to control playback!**")
+            await reply(message, "❌ **You need to be an admin to control playback!**")
             return
         
-        queue = get_queue(message.chat.id)
+        queue = await load_queue(message.chat.id)
         queue.loop_mode = not queue.loop_mode
+        queue.save()
         
         status = "**enabled**" if queue.loop_mode else "**disabled**"
         icon = "🔁" if queue.loop_mode else "➡️"
         
-        await message.reply_text(f"{icon} **Loop mode {status}**")
+        await reply(message, f"{icon} **Loop mode {status}**")
     
     except Exception as e:
         logger.error(f"Loop command error: {e}")
-        await message.reply_text("❌ **Error:** Could not toggle loop mode.")
+        await reply(message, "❌ **Error:** Could not toggle loop mode.")
 
 @Client.on_message(filters.command(["shuffle"]) & filters.group)
 async def shuffle_command(client: Client, message: Message):
@@ -205,23 +213,52 @@ async def shuffle_command(client: Client, message: Message):
     try:
         # Check admin permission
         if not await is_group_admin(message) and not is_admin(message):
-            await message.reply_text("❌ **You need to be an admin to control playback!**")
+            await reply(message, "❌ **You need to be an admin to control playback!**")
             return
         
-        queue = get_queue(message.chat.id)
+        queue = await load_queue(message.chat.id)
         
         if not queue.queue:
-            await message.reply_text("❌ **Queue is empty!**")
+            await reply(message, "❌ **Queue is empty!**")
             return
         
         queue.shuffle()
         status = "**enabled**" if queue.shuffle_mode else "**disabled**"
         
-        await message.reply_text(f"🔀 **Queue shuffled!** Shuffle mode {status}")
+        await reply(message, f"🔀 **Queue shuffled!** Shuffle mode {status}")
     
     except Exception as e:
         logger.error(f"Shuffle command error: {e}")
-        await message.reply_text("❌ **Error:** Could not shuffle queue.")
+        await reply(message, "❌ **Error:** Could not shuffle queue.")
+
+@Client.on_message(filters.command(["move"]) & filters.group)
+async def move_command(client: Client, message: Message):
+    """Move a queued track to another position"""
+    try:
+        # Check admin permission
+        if not await is_group_admin(message) and not is_admin(message):
+            await reply(message, "❌ **You need to be an admin to control playback!**")
+            return
+        
+        try:
+            source, target = (int(arg) for arg in message.command[1:])
+        except ValueError:
+            await reply(message, "❌ **Usage:** `/move <from> <to>`\n\nPositions are the numbers in /queue.")
+            return
+        
+        queue = await load_queue(message.chat.id)
+        
+        # Positions in /queue start at 1
+        if not queue.move(source - 1, target - 1):
+            await reply(message, f"❌ **Invalid position!** The queue has {len(queue.queue)} tracks.")
+            return
+        
+        track = queue.queue[target - 1]
+        await reply(message, f"↕️ **Moved:** {track.title} to position {target}")
+    
+    except Exception as e:
+        logger.error(f"Move command error: {e}")
+        await reply(message, "❌ **Error:** Could not move track.")
 
 @Client.on_message(filters.command(["clear", "clearqueue"]) & filters.group)
 async def clear_command(client: Client, message: Message):
@@ -229,21 +266,20 @@ async def clear_command(client: Client, message: Message):
     try:
         # Check admin permission
         if not await is_group_admin(message) and not is_admin(message):
-            await message.reply_text("❌ **You need to be an admin to control playback!**")
+            await reply(message, "❌ **You need to be an admin to control playback!**")
             return
         
         chat_id = message.chat.id
-        queue = get_queue(chat_id)
+        queue = await load_queue(chat_id)
         
         if not queue.queue:
-            await message.reply_text("❌ **Queue is already empty!**")
+            await reply(message, "❌ **Queue is already empty!**")
             return
         
-        tracks_cleared = len(queue.queue)
-        queue.queue.clear()
+        tracks_cleared = queue.clear_tracks()
         
-        await message.reply_text(f"🗑️ **Cleared {tracks_cleared} tracks from queue!**")
+        await reply(message, f"🗑️ **Cleared {tracks_cleared} tracks from queue!**")
     
     except Exception as e:
         logger.error(f"Clear command error: {e}")
-        await message.reply_text("❌ **Error:** Could not clear queue.")
\ No newline at end of file
+        await reply(message, "❌ **Error:** Could not clear queue.")
\ No newline at end of file
@@ -5,21 +5,37 @@ from pytgcalls.types import MediaStream
 from pytgcalls.exceptions import NoActiveGroupCall
 import asyncio
 import os
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Optional
 from utils.yt import downloader
-from utils.queue import get_queue, Track, MediaType
-from utils.helpers import is_admin, is_group_admin, Progress
+from utils.queue import get_queue, load_queue, Track, MediaType, QueueFull
+from utils.helpers import is_admin, is_group_admin, reply, send, Progress
+from utils.cache import media_cache
+from utils.transcode import transcoder
+from utils.fanout import fanout
+from utils.broker import WorkersUnavailable
+from utils.tasks import playback_tasks
+from utils.editor import editor
+from utils.metrics import timed
+from utils.tracing import tracer, traced
+from utils.assistants import router
 from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
+if TYPE_CHECKING:
+    from pytgcalls.types.raw import Stream
+
 @Client.on_message(filters.command(["play", "p"]) & filters.group)
+@traced("play")
 async def play_command(client: Client, message: Message):
     """Play audio in voice chat"""
     try:
         # Check if user provided query
         if len(message.command) < 2:
-            await message.reply_text(
+            await reply(
+                message,
                 "**Usage:** `/play <song name or URL>`\n\n"
                 "**Examples:**\n"
                 "• `/play Shape of You`\n"
@@ -33,16 +49,24 @@ async def play_command(client: Client, message: Message):
         chat_id = message.chat.id
         
         # Get queue
-        queue = get_queue(chat_id)
+        queue = await load_queue(chat_id)
+        
+        # Don't search for a track that can't be queued
+        try:
+            queue.check_room()
+        except QueueFull as e:
+            await reply(message, f"❌ **Error:** {e}")
+            return
         
         # Send processing message
-        processing_msg = await message.reply_text("🔍 **Searching...**")
+        with tracer.span("reply"):
+            processing_msg = await reply(message, "🔍 **Searching...**")
         
         # Search or get info
         if downloader.is_url(query):
             info = await downloader.get_info(query)
             if not info:
-                await processing_msg.edit_text("❌ **Error:** Invalid URL or video not found.")
+                editor.edit(processing_msg, "❌ **Error:** Invalid URL or video not found.")
                 return
             
             track_info = [info]
@@ -50,14 +74,14 @@ async def play_command(client: Client, message: Message):
             # Search for the query
             search_results = await downloader.search(query, limit=1)
             if not search_results:
-                await processing_msg.edit_text("❌ **Error:** No results found.")
+                editor.edit(processing_msg, "❌ **Error:** No results found.")
                 return
             
             # Get info for first result
             video_url = search_results[0]['link']
             info = await downloader.get_info(video_url)
             if not info:
-                await processing_msg.edit_text("❌ **Error:** Could not get video information.")
+                editor.edit(processing_msg, "❌ **Error:** Could not get video information.")
                 return
             
             track_info = [info]
@@ -73,21 +97,27 @@ async def play_command(client: Client, message: Message):
         
         # Check duration
         if track.duration > Config.MAX_DURATION:
-            await processing_msg.edit_text(
+            editor.edit(
+                processing_msg,
                 f"❌ **Error:** Track too long! Maximum duration is "
                 f"{Config.MAX_DURATION // 60} minutes."
             )
             return
         
         # Add to queue
-        position = queue.add(track)
+        try:
+            position = queue.add(track)
+        except QueueFull as e:
+            editor.edit(processing_msg, f"❌ **Error:** {e}")
+            return
         
         # If nothing is playing, start playing
         if not queue.is_playing and not queue.current:
             await start_playback(client, chat_id, processing_msg)
         else:
             # Just added to queue
-            await processing_msg.edit_text(
+            editor.edit(
+                processing_msg,
                 f"✅ **Added to queue at position {position}**\n\n"
                 f"🎵 **Title:** {track.title}\n"
                 f"⏰ **Duration:** {format_duration(track.duration)}\n"
@@ -96,76 +126,26 @@ async def play_command(client: Client, message: Message):
                 reply_markup=queue_keyboard()
             )
     
+    except WorkersUnavailable as e:
+        editor.edit(processing_msg, f"❌ **Error:** {e}")
+    
     except Exception as e:
         logger.error(f"Play command error: {e}")
         try:
-            await processing_msg.edit_text("❌ **Error:** Something went wrong while processing your request.")
+            editor.edit(processing_msg, "❌ **Error:** Something went wrong while processing your request.")
         except:
-            await message.reply_text("❌ **Error:** Something went wrong while processing your request.")
+            await reply(message, "❌ **Error:** Something went wrong while processing your request.")
 
 async def start_playback(client: Client, chat_id: int, message: Message):
     """Start playing the next track"""
     try:
-        queue = get_queue(chat_id)
-        
-        # Get next track
-        track = queue.get_next()
+        track = await start_track(client, chat_id, message, MediaType.AUDIO, audio_stream, start_playback)
         if not track:
-            await message.edit_text("❌ **Queue is empty!**")
             return
         
-        queue.current = track
-        
-        # Update message
-        await message.edit_text(f"⬇️ **Downloading:** {track.title}")
-        
-        # Progress callback
-        progress = Progress(message, "Downloading")
-        
-        # Download audio
-        filepath = await downloader.download_audio(
-            track.url,
-            progress_callback=progress.update
-        )
-        
-        if not filepath or not os.path.exists(filepath):
-            await message.edit_text("❌ **Error:** Download failed!")
-            # Try next track
-            await start_playback(client, chat_id, message)
-            return
-        
-        track.filepath = filepath
-        
-        # Join voice chat and play
-        try:
-            await client.call_py.join_group_call(
-                chat_id,
-                MediaStream(filepath, audio_bitrate=Config.AUDIO_BITRATE)
-            )
-        except NoActiveGroupCall:
-            await message.edit_text(
-                "❌ **Error:** No active voice chat found!\n\n"
-                "Please start a voice chat first, then use `/play` command."
-            )
-            return
-        except Exception as e:
-            if "already joined" in str(e).lower():
-                # Already joined, just change stream
-                await client.call_py.change_stream(
-                    chat_id,
-                    MediaStream(filepath, audio_bitrate=Config.AUDIO_BITRATE)
-                )
-            else:
-                logger.error(f"Join group call error: {e}")
-                await message.edit_text(f"❌ **Error:** Could not join voice chat!\n\n`{str(e)}`")
-                return
-        
-        # Update status
-        queue.is_playing = True
-        queue.is_paused = False
-        
         # Send now playing message
-        await message.edit_text(
+        editor.edit(
+            message,
             f"▶️ **Now Playing**\n\n"
             f"🎵 **Title:** {track.title}\n"
             f"⏰ **Duration:** {format_duration(track.duration)}\n"
@@ -174,54 +154,322 @@ async def start_playback(client: Client, chat_id: int, message: Message):
             reply_markup=playback_keyboard()
         )
         
-        # Auto-play next track when current ends
-        asyncio.create_task(wait_for_completion(client, chat_id))
-        
     except Exception as e:
         logger.error(f"Playback error: {e}")
-        await message.edit_text(f"❌ **Error:** {str(e)}")
+        editor.edit(message, f"❌ **Error:** {str(e)}")
+
+# Wording and settings that differ between audio and video playback
+PLAYBACK_OPTIONS = {
+    MediaType.AUDIO: {
+        'label': "",
+        'failed': "Download failed!",
+        'command': "/play",
+        'stream': Config.STREAM_AUDIO,
+        'download': downloader.download_audio,
+    },
+    MediaType.VIDEO: {
+        'label': " video",
+        'failed': "Video download failed!",
+        'command': "/video",
+        'stream': Config.STREAM_VIDEO,
+        'download': downloader.download_video,
+    },
+}
 
-async def wait_for_completion(client: Client, chat_id: int):
-    """Wait for current track to complete and play next"""
+async def start_track(client: Client, chat_id: int, message: Message, media_type: MediaType,
+                      build_stream: Callable[..., "Stream"], restart: Callable) -> Optional[Track]:
+    """Get the next track from disk or as a remote stream and join the call with it
+    
+    build_stream(chat_id, source, headers=None) makes the stream for a file, or for a
+    remote URL when headers are given. restart is called to try the next track when
+    the download fails. Returns the track once it plays, None otherwise.
+    """
+    options = PLAYBACK_OPTIONS[media_type]
+    label = options['label']
+    queue = get_queue(chat_id)
+    
+    # Get next track
+    track = queue.get_next()
+    if not track:
+        editor.edit(message, "❌ **Queue is empty!**")
+        return None
+    
+    queue.current = track
+    
+    # The previous track is over, ignore its late stream end updates
+    queue.is_playing = False
+    playback_tasks.cancel(chat_id, "completion")
+    playback_tasks.cancel(chat_id, "fanout")
+    
     try:
-        queue = get_queue(chat_id)
-        if not queue.current:
-            return
-        
-        # Wait for track duration
-        await asyncio.sleep(queue.current.duration + 5)  # Add 5 seconds buffer
+        # Stream the remote URL directly when enabled and the file is not on disk yet
+        stream = None
+        filepath = queue.prefetcher.ready(track)
+        if not filepath and options['stream'] and not downloader.is_cached(track.url, media_type.value):
+            editor.edit(message, f"📡 **Connecting{label}:** {track.title}")
+            stream = await downloader.get_stream_url(track.url, media_type)
+        
+        if stream:
+            # Keep filling the cache while the remote stream plays, until a skip or stop
+            cache_task = playback_tasks.start(chat_id, "cache", cache_download(options['download'], track.url))
+        else:
+            if not filepath:
+                # Update message
+                editor.edit(message, f"⬇️ **Downloading{label}:** {track.title}")
+                filepath = await queue.prefetcher.fetch(track)
+        
+            if not filepath:
+                # Progress callback
+                progress = Progress(message, f"Downloading{label}")
+                filepath = await options['download'](
+                    track.url,
+                    progress_callback=progress.update
+                )
+    except WorkersUnavailable as e:
+        # The next tracks would wait for the same workers, keep this one for a later try
+        queue.current = None
+        queue.requeue(track)
+        editor.edit(message, f"❌ **Error:** {e}")
+        return None
+    
+    # Start downloading the tracks after this one
+    queue.prefetcher.refresh()
+    
+    if not stream:
+        filepath = playable_file(filepath, media_type)
+        if not filepath:
+            editor.edit(message, f"❌ **Error:** {options['failed']}")
+            # Try next track
+            await restart(client, chat_id, message)
+            return None
         
-        # Check if still playing same track
-        if queue.is_playing and not queue.is_paused:
-            # Clean up current file
-            if queue.current and queue.current.filepath:
-                try:
-                    os.remove(queue.current.filepath)
-                except:
-                    pass
-            
-            # Play next track if available
-            if queue.queue or queue.loop_mode:
-                # Send message about next track
-                try:
-                    next_msg = await client.send_message(chat_id, "⏭️ **Playing next track...**")
-                    await start_playback(client, chat_id, next_msg)
-                except:
-                    pass
+        track.filepath = filepath
+        media_cache.pin(filepath)
+    
+    # Join voice chat and play
+    try:
+        try:
+            if stream:
+                await join_stream(client, chat_id, build_stream(chat_id, stream['url'], headers=stream['headers']))
             else:
-                # No more tracks, leave voice chat
-                try:
-                    await client.call_py.leave_group_call(chat_id)
-                    queue.clear()
-                    await client.send_message(
-                        chat_id, 
-                        "✅ **Playback finished!** Left voice chat."
-                    )
-                except:
-                    pass
+                await join_stream(client, chat_id, build_stream(chat_id, filepath))
+        except NoActiveGroupCall:
+            raise
+        except Exception as e:
+            if not stream:
+                raise
+            
+            # Remote stream failed, fall back to the downloaded file
+            logger.warning(f"Direct{label} stream failed, falling back to download: {e}")
+            editor.edit(message, f"⬇️ **Downloading{label}:** {track.title}")
+            await asyncio.wait({cache_task})
+            if cache_task.cancelled():
+                # Skipped or stopped meanwhile
+                return None
+            filepath = playable_file(cache_task.result(), media_type)
+            if not filepath:
+                raise
+            
+            track.filepath = filepath
+            media_cache.pin(filepath)
+            await join_stream(client, chat_id, build_stream(chat_id, filepath))
+    except WorkersUnavailable as e:
+        # Raised by the fallback download, keep the track for a later try
+        playback_tasks.cancel(chat_id, "fanout")
+        router.release(chat_id)
+        queue.current = None
+        queue.requeue(track)
+        editor.edit(message, f"❌ **Error:** {e}")
+        return None
+    except NoActiveGroupCall:
+        playback_tasks.cancel(chat_id, "fanout")
+        router.release(chat_id)
+        editor.edit(
+            message,
+            "❌ **Error:** No active voice chat found!\n\n"
+            f"Please start a voice chat first, then use `{options['command']}` command."
+        )
+        return None
+    except Exception as e:
+        playback_tasks.cancel(chat_id, "fanout")
+        router.release(chat_id)
+        logger.error(f"Join group call error: {e}")
+        editor.edit(message, f"❌ **Error:** Could not join voice chat!\n\n`{str(e)}`")
+        return None
+    
+    # Update status
+    queue.is_playing = True
+    watch_completion(client, chat_id)
+    return track
+
+def playable_file(filepath: Optional[str], media_type: MediaType) -> Optional[str]:
+    """Get the file to play for a download, None when it is missing"""
+    if not filepath or not os.path.exists(filepath):
+        return None
+    if media_type == MediaType.AUDIO:
+        # Play the transcoded copy once it exists, it needs no ffmpeg
+        filepath = transcoder.get(filepath) or filepath
+    return filepath
+
+async def cache_download(download: Callable, url: str) -> Optional[str]:
+    """Download a streamed track into the cache, stopping the download when cancelled"""
+    cancel_event = threading.Event()
+    try:
+        return await download(url, cancel_event=cancel_event)
+    except asyncio.CancelledError:
+        # The download thread checks this on its next progress tick
+        cancel_event.set()
+        raise
+
+def pcm_stream(path: str) -> "Stream":
+    """Build a raw input stream for a PCM file or pipe"""
+    # Imported here so only PCM_CACHE and DECODE_FANOUT depend on the raw stream API
+    from pytgcalls.types.raw import AudioParameters, AudioStream, Stream
+    from ntgcalls import InputMode
+    
+    return Stream(AudioStream(
+        InputMode.File,
+        path,
+        AudioParameters(Config.PCM_SAMPLE_RATE, Config.PCM_CHANNELS)
+    ))
+
+def audio_stream(chat_id: int, filepath: str, headers: Optional[Dict] = None) -> "Stream":
+    """Build the stream for a cached audio file, avoiding an ffmpeg decode of its own where possible"""
+    if headers is not None:
+        # Remote URL
+        return MediaStream(filepath, audio_bitrate=Config.AUDIO_BITRATE, headers=headers)
+    
+    if transcoder.is_pcm(filepath):
+        return pcm_stream(filepath)
+    
+    if Config.DECODE_FANOUT:
+        pipe = fanout.open(chat_id, filepath)
+        if pipe:
+            return pcm_stream(pipe)
+    
+    return MediaStream(filepath, audio_bitrate=Config.AUDIO_BITRATE)
+
+@timed("join")
+async def join_stream(client: Client, chat_id: int, stream: "Stream"):
+    """Join voice chat with stream, or change stream if already joined"""
+    assistant = await router.assign(client, chat_id)
+    try:
+        await assistant.call_py.join_group_call(chat_id, stream)
+    except NoActiveGroupCall:
+        raise
+    except Exception as e:
+        if "already joined" in str(e).lower():
+            # Already joined, just change stream
+            await assistant.call_py.change_stream(chat_id, stream)
+        else:
+            raise
+
+def watch_completion(client: Client, chat_id: int):
+    """Start the play clock and the fallback timer for the current track"""
+    queue = get_queue(chat_id)
+    queue.mark_started()
+    playback_tasks.start(chat_id, "completion", completion_fallback(client, chat_id))
+
+def pause_completion(chat_id: int):
+    """Stop the play clock while playback is paused"""
+    get_queue(chat_id).mark_paused()
+    playback_tasks.cancel(chat_id, "completion")
+
+def resume_completion(client: Client, chat_id: int):
+    """Restart the play clock and the fallback timer for the remaining time"""
+    get_queue(chat_id).mark_resumed()
+    playback_tasks.start(chat_id, "completion", completion_fallback(client, chat_id))
+
+async def completion_fallback(client: Client, chat_id: int):
+    """End the track if no stream end update arrives in time"""
+    queue = get_queue(chat_id)
+    if not queue.current or not queue.current.duration:
+        # Unknown length, rely on the stream end update alone
+        return
+    
+    remaining = queue.current.duration - queue.elapsed()
+    await asyncio.sleep(max(0, remaining) + Config.COMPLETION_FALLBACK)
+    
+    logger.warning(f"No stream end update in {chat_id}, advancing queue")
+    track_ended(client, chat_id)
+
+def track_ended(client: Client, chat_id: int):
+    """Advance the queue once per track, on stream end update or fallback timer"""
+    queue = get_queue(chat_id)
+    if not queue.is_playing or queue.is_paused:
+        return
+    
+    queue.is_playing = False
+    playback_tasks.cancel(chat_id, "completion")
+    playback_tasks.cancel(chat_id, "fanout")
+    playback_tasks.start(chat_id, "advance", advance_queue(client, chat_id))
+
+async def advance_queue(client: Client, chat_id: int):
+    """Play the next track, or leave voice chat when the queue is done"""
+    try:
+        queue = get_queue(chat_id)
+        
+        # Release current file back to the cache
+        if queue.current and queue.current.filepath:
+            media_cache.unpin(queue.current.filepath)
+        
+        # Play next track if available
+        if queue.queue or queue.loop_mode:
+            # Send message about next track
+            try:
+                next_msg = await send(client, chat_id, "⏭️ **Playing next track...**")
+                await play_next(client, chat_id, next_msg)
+            except Exception as e:
+                logger.error(f"Next track error: {e}")
+        else:
+            # No more tracks, leave voice chat
+            try:
+                await router.leave(chat_id)
+                queue.clear()
+                await send(
+                    client,
+                    chat_id, 
+                    "✅ **Playback finished!** Left voice chat."
+                )
+            except:
+                pass
     
     except Exception as e:
-        logger.error(f"Completion wait error: {e}")
+        logger.error(f"Completion error: {e}")
+
+async def play_next(client: Client, chat_id: int, message: Message):
+    """Start the next track with the player matching its media type"""
+    queue = get_queue(chat_id)
+    track = queue.current if queue.loop_mode and queue.current else (queue.queue[0] if queue.queue else None)
+    
+    if track and track.media_type == MediaType.VIDEO:
+        # Import here to avoid circular imports
+        from handlers.video import start_video_playback
+        await start_video_playback(client, chat_id, message)
+    else:
+        await start_playback(client, chat_id, message)
+
+async def move_playback(client: Client, chat_id: int):
+    """Restart the current track on another assistant after its own dropped"""
+    queue = get_queue(chat_id)
+    track = queue.current
+    if not track or not queue.is_playing:
+        return
+    
+    playback_tasks.cancel(chat_id)
+    if track.filepath:
+        media_cache.unpin(track.filepath)
+    
+    queue.requeue(track)
+    queue.current = None
+    queue.is_playing = False
+    
+    message = await send(client, chat_id, "🔄 **Assistant disconnected, resuming on another one...**")
+    await play_next(client, chat_id, message)
+
+async def on_stream_end(client: Client, chat_id: int):
+    """Handle PyTgCalls stream end update"""
+    track_ended(client, chat_id)
 
 def format_duration(seconds: int) -> str:
     """Format duration from seconds to MM:SS"""
@@ -268,12 +516,12 @@ async def playback_callbacks(client: Client, callback: CallbackQuery):
                 await callback.answer("❌ You need to be an admin to control playback!", show_alert=True)
                 return
         
-        queue = get_queue(chat_id)
+        queue = await load_queue(chat_id)
         
         if action == "pause":
             if queue.is_playing and not queue.is_paused:
-                await client.call_py.pause_stream(chat_id)
-                queue.is_paused = True
+                await router.call_py(chat_id).pause_stream(chat_id)
+                pause_completion(chat_id)
                 await callback.answer("⏸️ Paused")
                 
                 # Update keyboard
@@ -295,8 +543,8 @@ async def playback_callbacks(client: Client, callback: CallbackQuery):
         
         elif action == "resume":
             if queue.is_paused:
-                await client.call_py.resume_stream(chat_id)
-                queue.is_paused = False
+                await router.call_py(chat_id).resume_stream(chat_id)
+                resume_completion(client, chat_id)
                 await callback.answer("▶️ Resumed")
                 
                 # Update keyboard back to pause
@@ -306,43 +554,41 @@ async def playback_callbacks(client: Client, callback: CallbackQuery):
         
         elif action == "skip":
             if queue.is_playing or queue.queue:
-                # Clean up current file
+                playback_tasks.cancel(chat_id)
+                
+                # Release current file back to the cache
                 if queue.current and queue.current.filepath:
-                    try:
-                        os.remove(queue.current.filepath)
-                    except:
-                        pass
+                    media_cache.unpin(queue.current.filepath)
                 
                 if queue.queue:
-                    await start_playback(client, chat_id, callback.message)
+                    await play_next(client, chat_id, callback.message)
                     await callback.answer("⏭️ Skipped to next track")
                 else:
-                    await client.call_py.leave_group_call(chat_id)
+                    await router.leave(chat_id)
                     queue.clear()
-                    await callback.message.edit_text("⏹️ **Playback stopped!** No more tracks in queue.")
+                    editor.edit(callback.message, "⏹️ **Playback stopped!** No more tracks in queue.")
                     await callback.answer("⏭️ Skipped - Queue empty")
             else:
                 await callback.answer("❌ Nothing to skip!")
         
         elif action == "stop":
             if queue.is_playing:
-                await client.call_py.leave_group_call(chat_id)
+                playback_tasks.cancel(chat_id)
+                await router.leave(chat_id)
                 
-                # Clean up files
+                # Release current file back to the cache
                 if queue.current and queue.current.filepath:
-                    try:
-                        os.remove(queue.current.filepath)
-                    except:
-                        pass
+                    media_cache.unpin(queue.current.filepath)
                 
                 queue.clear()
-                await callback.message.edit_text("⏹️ **Playback stopped!**")
+                editor.edit(callback.message, "⏹️ **Playback stopped!**")
                 await callback.answer("⏹️ Stopped")
             else:
                 await callback.answer("❌ Nothing to stop!")
         
         elif action == "loop":
             queue.loop_mode = not queue.loop_mode
+            queue.save()
             status = "enabled" if queue.loop_mode else "disabled"
             await callback.answer(f"🔁 Loop {status}")
         
@@ -357,7 +603,7 @@ async def playback_callbacks(client: Client, callback: CallbackQuery):
         elif action == "queue":
             queue_text = queue.get_queue_text()
             await callback.answer()
-            await callback.message.reply_text(queue_text)
+            await reply(callback.message, queue_text)
     
     except Exception as e:
         logger.error(f"Callback error: {e}")
@@ -367,10 +613,10 @@ async def playback_callbacks(client: Client, callback: CallbackQuery):
 async def now_playing_command(client: Client, message: Message):
     """Show now playing info"""
     try:
-        queue = get_queue(message.chat.id)
+        queue = await load_queue(message.chat.id)
         
         if not queue.current:
-            await message.reply_text("❌ **Nothing is currently playing!**")
+            await reply(message, "❌ **Nothing is currently playing!**")
             return
         
         track = queue.current
@@ -387,8 +633,8 @@ async def now_playing_command(client: Client, message: Message):
             f"📋 **Queue:** {len(queue.queue)} tracks"
         )
         
-        await message.reply_text(text, reply_markup=playback_keyboard())
+        await reply(message, text, reply_markup=playback_keyboard())
     
     except Exception as e:
         logger.error(f"Now playing error: {e}")
-        await message.reply_text("❌ **Error:** Could not get current track info.")
\ No newline at end of file
+        await reply(message, "❌ **Error:** Could not get current track info.")
\ No newline at end of file
@@ -1,23 +1,28 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pytgcalls.types import MediaStream
-from pytgcalls.exceptions import NoActiveGroupCall
-import os
+from typing import Dict, Optional
 from utils.yt import downloader
-from utils.queue import get_queue, Track, MediaType
-from utils.helpers import is_admin, is_group_admin, Progress
+from utils.queue import load_queue, MediaType, QueueFull
+from utils.editor import editor
+from utils.broker import WorkersUnavailable
+from utils.helpers import reply
+from utils.tracing import tracer, traced
+from handlers.play import start_track
 from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
 @Client.on_message(filters.command(["video", "v"]) & filters.group)
+@traced("video")
 async def video_command(client: Client, message: Message):
     """Play video in voice chat"""
     try:
         # Check if user provided query
         if len(message.command) < 2:
-            await message.reply_text(
+            await reply(
+                message,
                 "**Usage:** `/video <video name or URL>`\n\n"
                 "**Examples:**\n"
                 "• `/video Despacito`\n"
@@ -31,29 +36,37 @@ async def video_command(client: Client, message: Message):
         chat_id = message.chat.id
         
         # Get queue
-        queue = get_queue(chat_id)
+        queue = await load_queue(chat_id)
+        
+        # Don't search for a track that can't be queued
+        try:
+            queue.check_room()
+        except QueueFull as e:
+            await reply(message, f"❌ **Error:** {e}")
+            return
         
         # Send processing message
-        processing_msg = await message.reply_text("🔍 **Searching for video...**")
+        with tracer.span("reply"):
+            processing_msg = await reply(message, "🔍 **Searching for video...**")
         
         # Search or get info
         if downloader.is_url(query):
             info = await downloader.get_info(query)
             if not info:
-                await processing_msg.edit_text("❌ **Error:** Invalid URL or video not found.")
+                editor.edit(processing_msg, "❌ **Error:** Invalid URL or video not found.")
                 return
         else:
             # Search for the query
             search_results = await downloader.search(query, limit=1)
             if not search_results:
-                await processing_msg.edit_text("❌ **Error:** No results found.")
+                editor.edit(processing_msg, "❌ **Error:** No results found.")
                 return
             
             # Get info for first result
             video_url = search_results[0]['link']
             info = await downloader.get_info(video_url)
             if not info:
-                await processing_msg.edit_text("❌ **Error:** Could not get video information.")
+                editor.edit(processing_msg, "❌ **Error:** Could not get video information.")
                 return
         
         # Create track
@@ -67,21 +80,27 @@ async def video_command(client: Client, message: Message):
         
         # Check duration
         if track.duration > Config.MAX_DURATION:
-            await processing_msg.edit_text(
+            editor.edit(
+                processing_msg,
                 f"❌ **Error:** Video too long! Maximum duration is "
                 f"{Config.MAX_DURATION // 60} minutes."
             )
             return
         
         # Add to queue
-        position = queue.add(track)
+        try:
+            position = queue.add(track)
+        except QueueFull as e:
+            editor.edit(processing_msg, f"❌ **Error:** {e}")
+            return
         
         # If nothing is playing, start playing
         if not queue.is_playing and not queue.current:
             await start_video_playback(client, chat_id, processing_msg)
         else:
             # Just added to queue
-            await processing_msg.edit_text(
+            editor.edit(
+                processing_msg,
                 f"✅ **Video added to queue at position {position}**\n\n"
                 f"🎬 **Title:** {track.title}\n"
                 f"⏰ **Duration:** {format_duration(track.duration)}\n"
@@ -90,84 +109,26 @@ async def video_command(client: Client, message: Message):
                 reply_markup=video_keyboard()
             )
     
+    except WorkersUnavailable as e:
+        editor.edit(processing_msg, f"❌ **Error:** {e}")
+    
     except Exception as e:
         logger.error(f"Video command error: {e}")
         try:
-            await processing_msg.edit_text("❌ **Error:** Something went wrong while processing your request.")
+            editor.edit(processing_msg, "❌ **Error:** Something went wrong while processing your request.")
         except:
-            await message.reply_text("❌ **Error:** Something went wrong while processing your request.")
+            await reply(message, "❌ **Error:** Something went wrong while processing your request.")
 
 async def start_video_playback(client: Client, chat_id: int, message: Message):
     """Start playing the next video"""
     try:
-        queue = get_queue(chat_id)
-        
-        # Get next track
-        track = queue.get_next()
+        track = await start_track(client, chat_id, message, MediaType.VIDEO, video_stream, start_video_playback)
         if not track:
-            await message.edit_text("❌ **Queue is empty!**")
             return
         
-        queue.current = track
-        
-        # Update message
-        await message.edit_text(f"⬇️ **Downloading video:** {track.title}")
-        
-        # Progress callback
-        progress = Progress(message, "Downloading video")
-        
-        # Download video
-        filepath = await downloader.download_video(
-            track.url,
-            progress_callback=progress.update
-        )
-        
-        if not filepath or not os.path.exists(filepath):
-            await message.edit_text("❌ **Error:** Video download failed!")
-            # Try next track
-            await start_video_playback(client, chat_id, message)
-            return
-        
-        track.filepath = filepath
-        
-        # Join voice chat and play video
-        try:
-            await client.call_py.join_group_call(
-                chat_id,
-                MediaStream(
-                    filepath,
-                    audio_bitrate=Config.AUDIO_BITRATE,
-                    video_bitrate=Config.VIDEO_BITRATE
-                )
-            )
-        except NoActiveGroupCall:
-            await message.edit_text(
-                "❌ **Error:** No active voice chat found!\n\n"
-                "Please start a voice chat first, then use `/video` command."
-            )
-            return
-        except Exception as e:
-            if "already joined" in str(e).lower():
-                # Already joined, just change stream
-                await client.call_py.change_stream(
-                    chat_id,
-                    MediaStream(
-                        filepath,
-                        audio_bitrate=Config.AUDIO_BITRATE,
-                        video_bitrate=Config.VIDEO_BITRATE
-                    )
-                )
-            else:
-                logger.error(f"Join group call error: {e}")
-                await message.edit_text(f"❌ **Error:** Could not join voice chat!\n\n`{str(e)}`")
-                return
-        
-        # Update status
-        queue.is_playing = True
-        queue.is_paused = False
-        
         # Send now playing message
-        await message.edit_text(
+        editor.edit(
+            message,
             f"🎬 **Now Playing Video**\n\n"
             f"🎬 **Title:** {track.title}\n"
             f"⏰ **Duration:** {format_duration(track.duration)}\n"
@@ -179,7 +140,16 @@ async def start_video_playback(client: Client, chat_id: int, message: Message):
         
     except Exception as e:
         logger.error(f"Video playback error: {e}")
-        await message.edit_text(f"❌ **Error:** {str(e)}")
+        editor.edit(message, f"❌ **Error:** {str(e)}")
+
+def video_stream(chat_id: int, source: str, headers: Optional[Dict] = None) -> MediaStream:
+    """Build the stream for a video file or remote URL"""
+    return MediaStream(
+        source,
+        audio_bitrate=Config.AUDIO_BITRATE,
+        video_bitrate=Config.VIDEO_BITRATE,
+        headers=headers
+    )
 
 def format_duration(seconds: int) -> str:
     """Format duration from seconds to MM:SS"""
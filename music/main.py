@@ -10,9 +10,21 @@ import logging
 import signal
 import sys
 from pyrogram import Client, idle
-from pytgcalls import PyTgCalls
+from pytgcalls.types import Update
 from config import Config
-from utils.helpers import setup_logging, create_directories
+from utils.helpers import setup_logging, create_directories, close_http_session
+from utils.cache import media_cache, info_cache, search_cache
+from utils.store import queue_store
+from utils.assistants import router
+from utils.broadcast import chat_registry
+from utils.editor import editor
+from utils.metrics import metrics
+from utils.queue import MusicQueue, queues
+from utils.executors import get_pools
+from utils.yt import downloader
+from utils.transcode import transcoder
+from utils.fanout import fanout
+from utils.tracing import tracer
 from handlers import play, video, control, admin
 
 # Setup logging
@@ -35,18 +47,22 @@ class MusicBot:
                 plugins=dict(root="handlers")
             )
             
-            # Initialize PyTgCalls client
-            self.call_py = PyTgCalls(
-                Client(
-                    "assistant",
-                    api_id=Config.API_ID,
-                    api_hash=Config.API_HASH,
-                    session_string=Config.SESSION_STRING
-                )
-            )
+            # Initialize one PyTgCalls client per assistant account
+            sessions = [Config.SESSION_STRING] + Config.SESSION_STRINGS
+            for index, session_string in enumerate(sessions):
+                # The first one keeps the session name used before multiple assistants
+                name = "assistant" if index == 0 else f"assistant{index + 1}"
+                assistant = router.add(name, session_string)
+                
+                # Advance queues as soon as a stream finishes
+                @assistant.call_py.on_stream_end()
+                async def stream_end_handler(_, update: Update):
+                    await play.on_stream_end(self.app, update.chat_id)
+            
+            # Restart calls of a dropped assistant on another one
+            router.on_failover = lambda chat_id: play.move_playback(self.app, chat_id)
             
-            # Store references globally
-            self.app.call_py = self.call_py
+            self.register_metrics()
             
             logger.info("✓ Music Bot initialized successfully")
             
@@ -54,22 +70,77 @@ class MusicBot:
             logger.error(f"✗ Failed to initialize bot: {e}")
             sys.exit(1)
     
+    def register_metrics(self):
+        """Expose component counters and readiness checks"""
+        @metrics.collector
+        def bot_gauges():
+            yield "music_chats", "gauge", {}, len(queues)
+            yield "music_chats_playing", "gauge", {}, MusicQueue.total_playing
+            yield "music_tracks_queued", "gauge", {}, MusicQueue.total_queued
+            
+            for name, cache in (("media", media_cache), ("search", search_cache)):
+                stats = cache.stats()
+                yield "music_cache_hits_total", "counter", {"cache": name}, stats['hits']
+                yield "music_cache_misses_total", "counter", {"cache": name}, stats['misses']
+            stats = info_cache.stats()
+            yield "music_cache_hits_total", "counter", {"cache": "info"}, stats['memory_hits'] + stats['disk_hits']
+            yield "music_cache_misses_total", "counter", {"cache": "info"}, stats['misses']
+            
+            for pool in get_pools().values():
+                stats = pool.stats()
+                yield "music_pool_queued", "gauge", {"pool": stats['name']}, stats['queued']
+                yield "music_pool_running", "gauge", {"pool": stats['name']}, stats['running']
+                yield "music_pool_completed_total", "counter", {"pool": stats['name']}, stats['completed']
+            
+            for stats in router.stats():
+                yield "music_assistant_calls", "gauge", {"assistant": stats['name']}, stats['calls']
+                yield "music_assistant_healthy", "gauge", {"assistant": stats['name']}, int(stats['healthy'])
+            
+            stats = editor.stats()
+            yield "music_edits_pending", "gauge", {}, stats['pending']
+            yield "music_edits_total", "counter", {}, stats['edits']
+            yield "music_edits_coalesced_total", "counter", {}, stats['coalesced']
+            
+            yield "music_downloads_running", "gauge", {}, len(downloader.downloads)
+            yield "music_downloads_shared_total", "counter", {}, downloader.coalesced
+            
+            stats = transcoder.stats()
+            yield "music_transcodes_pending", "gauge", {}, stats['pending']
+            yield "music_transcodes_total", "counter", {"result": "completed"}, stats['completed']
+            yield "music_transcodes_total", "counter", {"result": "failed"}, stats['failed']
+            
+            stats = fanout.stats()
+            yield "music_fanout_feeds", "gauge", {}, stats['feeds']
+            yield "music_fanout_shared_total", "counter", {}, stats['shared']
+        
+        metrics.check("bot", lambda: self.app.is_connected)
+        metrics.check("assistants", lambda: any(stats['healthy'] for stats in router.stats()))
+    
     async def start(self):
         """Start the bot and call client"""
         try:
             # Create required directories
             create_directories()
             
-            # Start PyTgCalls
-            await self.call_py.start()
-            logger.info("✓ PyTgCalls started")
+            # Rebuild media cache index from previous runs
+            media_cache.load()
             
-            # Start Pyrogram client
-            await self.app.start()
-            logger.info("✓ Pyrogram client started")
+            # Import yt-dlp and build its pools in the background, jobs that
+            # come sooner create their own instances
+            self.warm_up_task = asyncio.create_task(self.warm_up())
             
-            # Get bot info
-            bot_info = await self.app.get_me()
+            # None of these depend on each other, so they start together:
+            # saved queue index, broadcast targets, PyTgCalls and Pyrogram
+            await asyncio.gather(
+                queue_store.connect(),
+                chat_registry.load(),
+                router.start(),
+                self.app.start(),
+            )
+            logger.info("✓ PyTgCalls and Pyrogram client started")
+            
+            # Fetched by app.start()
+            bot_info = self.app.me
             logger.info(f"✓ Bot started as @{bot_info.username}")
             
             # Send startup message to log chat
@@ -85,13 +156,21 @@ class MusicBot:
                 except Exception as e:
                     logger.warning(f"Could not send startup message: {e}")
             
-            # Keep the bot running
-            await idle()
+            # Serve metrics and health probes
+            await metrics.start()
             
         except Exception as e:
             logger.error(f"✗ Error during startup: {e}")
             sys.exit(1)
     
+    async def warm_up(self):
+        """Start yt-dlp workers and pooled instances"""
+        try:
+            await downloader.warm_up()
+            logger.info("✓ yt-dlp workers ready")
+        except Exception as e:
+            logger.error(f"✗ yt-dlp warm-up failed: {e}")
+    
     async def stop(self):
         """Stop the bot and call client"""
         try:
@@ -109,9 +188,21 @@ class MusicBot:
                     pass
             
             # Stop clients
-            await self.call_py.stop()
+            await metrics.stop()
+            await router.stop()
             await self.app.stop()
             
+            # Write pending queue, chat and trace changes
+            await queue_store.close()
+            await chat_registry.flush()
+            await tracer.flush()
+            
+            # Drop queued downloads and lookups
+            for pool in get_pools().values():
+                pool.shutdown()
+            transcoder.cancel_all()
+            await close_http_session()
+            
             logger.info("✓ Bot stopped successfully")
             
         except Exception as e:
@@ -120,6 +211,17 @@ class MusicBot:
 # Global bot instance
 music_bot = None
 
+def install_event_loop():
+    """Use uvloop when enabled and installed"""
+    if not Config.UVLOOP:
+        return
+    try:
+        import uvloop
+        uvloop.install()
+        logger.info("✓ Using uvloop event loop")
+    except ImportError:
+        logger.warning("UVLOOP is enabled but uvloop is not installed, using asyncio")
+
 def signal_handler(signum, frame):
     """Handle shutdown signals"""
     logger.info(f"Received signal {signum}")
@@ -139,6 +241,9 @@ async def main():
     
     try:
         await music_bot.start()
+        
+        # Keep the bot running
+        await idle()
     except KeyboardInterrupt:
         logger.info("Received keyboard interrupt")
     except Exception as e:
@@ -154,6 +259,8 @@ if __name__ == "__main__":
     Starting bot... Please wait.
     """)
     
+    install_event_loop()
+    
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
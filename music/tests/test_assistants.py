@@ -0,0 +1,127 @@
+"""Assistant assignment and failover without Telegram"""
+
+import asyncio
+import pytest
+from utils import assistants
+from utils.assistants import AssistantRouter
+
+class FakeCalls:
+    def __init__(self):
+        self.left = []
+
+    async def leave_group_call(self, chat_id: int):
+        self.left.append(chat_id)
+
+class FakeAssistant:
+    """Assistant whose chat membership is a plain set"""
+
+    def __init__(self, name: str, session_string: str):
+        self.name = name
+        self.healthy = True
+        self.chats = set()
+        self.member_of = set()
+        self.joins = []
+        self.call_py = FakeCalls()
+
+    async def is_member(self, chat_id: int) -> bool:
+        return chat_id in self.member_of
+
+    async def join(self, bot, chat_id: int):
+        self.joins.append(chat_id)
+        self.member_of.add(chat_id)
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(assistants, 'Assistant', FakeAssistant)
+    router = AssistantRouter(load_factor=100)
+    for i in range(3):
+        router.add(f"assistant{i}", "")
+    return router
+
+def test_prefers_member(router):
+    chat_id = -100
+    first = router._pick(chat_id)
+    member = next(a for a in router.assistants if a is not first)
+    member.member_of.add(chat_id)
+
+    assistant = asyncio.run(router.assign(None, chat_id))
+    assert assistant is member
+    assert router.get(chat_id) is member
+    assert not any(a.joins for a in router.assistants)
+
+def test_joins_when_no_assistant_is_member(router):
+    chat_id = -100
+    first = router._pick(chat_id)
+
+    assistant = asyncio.run(router.assign(None, chat_id))
+    assert assistant is first
+    assert first.joins == [chat_id]
+
+    # The assignment is kept until the chat leaves its call
+    assert asyncio.run(router.assign(None, chat_id)) is first
+    assert first.joins == [chat_id]
+    router.release(chat_id)
+    assert chat_id not in first.chats
+
+def test_failover_moves_calls_concurrently(router, monkeypatch):
+    monkeypatch.setattr(assistants.Config, 'FAILOVER_CONCURRENCY', 4)
+    dropped = router.assistants[0]
+    chats = list(range(-1, -21, -1))
+    for chat_id in chats:
+        router._assign(chat_id, dropped)
+
+    running = 0
+    peak = 0
+    moved = []
+
+    async def on_failover(chat_id: int):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if chat_id == -5:
+            raise RuntimeError("send failed")
+        moved.append(await router.assign(None, chat_id))
+
+    router.on_failover = on_failover
+    asyncio.run(router._fail_over(dropped))
+
+    assert peak == 4
+    assert len(moved) == len(chats) - 1
+    assert dropped not in moved
+    assert not dropped.chats
+    assert router.failovers == len(chats)
+
+def test_lookups_do_not_assign(router):
+    assert router.get(-100) is None
+    with pytest.raises(RuntimeError):
+        router.call_py(-100)
+    asyncio.run(router.leave(-100))
+    assert not router.assignments
+
+def test_calls_move_back_to_recovered_assistant(monkeypatch):
+    monkeypatch.setattr(assistants, 'Assistant', FakeAssistant)
+    router = AssistantRouter()
+    for i in range(2):
+        router.add(f"assistant{i}", "")
+    busy, recovered = router.assistants
+    recovered.healthy = False
+
+    async def run():
+        chats = list(range(-1, -11, -1))
+        for chat_id in chats:
+            await router.assign(None, chat_id)
+        assert len(busy.chats) == len(chats)
+
+        # Each chat starting its next track may move, until the load is within bounds
+        recovered.healthy = True
+        for chat_id in chats:
+            await router.assign(None, chat_id)
+        return chats
+
+    chats = asyncio.run(run())
+    assert len(busy.chats) <= 7
+    assert len(busy.chats) + len(recovered.chats) == len(chats)
+    assert sorted(busy.call_py.left) == sorted(recovered.chats)
+    assert router.rebalanced == len(recovered.chats)
@@ -0,0 +1,61 @@
+"""Broker jobs when workers are missing"""
+
+import asyncio
+import pytest
+from utils import broker as broker_module
+from utils.broker import Broker, WorkerConnection, WorkersUnavailable
+
+class FakeWriter:
+    def __init__(self):
+        self.frames = []
+
+    def write(self, data: bytes):
+        self.frames.append(data)
+
+    async def drain(self):
+        await asyncio.sleep(0)
+
+    def close(self):
+        pass
+
+def test_job_fails_without_workers(monkeypatch):
+    monkeypatch.setattr(broker_module.Config, 'BROKER_JOB_WAIT', 0.05)
+
+    async def run():
+        broker = Broker("test", socket_path="unused")
+        with pytest.raises(WorkersUnavailable, match="no worker is connected"):
+            await asyncio.wait_for(broker.run('extract_info', 'info', 'url', {}), 5)
+        return broker
+
+    broker = asyncio.run(run())
+    assert not broker.pending
+
+def test_dispatched_job_keeps_running(monkeypatch):
+    monkeypatch.setattr(broker_module.Config, 'BROKER_JOB_WAIT', 0.05)
+
+    async def run():
+        broker = Broker("test", socket_path="unused")
+        writer = FakeWriter()
+        worker = WorkerConnection(None, writer, 1234, 1)
+        broker.workers.append(worker)
+
+        job = asyncio.create_task(broker.run('extract_info', 'info', 'url', {}))
+        await asyncio.sleep(0)
+        # The frame goes out on a task the broker keeps until it is sent
+        assert len(broker._sends) == 1
+        await asyncio.sleep(0.1)
+        assert not broker._sends
+        assert len(writer.frames) == 1
+
+        # Past the wait for a worker, but the worker has it
+        job_id = next(iter(worker.jobs))
+        broker._handle(worker, {'type': 'result', 'job': job_id, 'value': {'title': 'x'}})
+        result = await job
+
+        # A second job waits for the busy worker and gives up
+        with pytest.raises(WorkersUnavailable, match="busy"):
+            worker.jobs[0] = None
+            await broker.run('extract_info', 'info', 'url', {})
+        return result
+
+    assert asyncio.run(run()) == {'title': 'x'}
@@ -0,0 +1,101 @@
+"""Direct downloads against a local HTTP server, with and without Range support"""
+
+import os
+import asyncio
+from aiohttp import web
+from utils import helpers
+
+PAYLOAD = os.urandom(300 * 1024 + 123)
+
+class MediaServer:
+    """Serves PAYLOAD, honouring Range requests unless told not to"""
+
+    def __init__(self, ranges: bool = True, short_ranges: bool = False):
+        self.ranges = ranges
+        self.short_ranges = short_ranges
+        self.requests = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        header = request.headers.get('Range')
+        self.requests.append((request.method, header))
+
+        if not self.ranges:
+            return web.Response(body=PAYLOAD)
+
+        headers = {'Accept-Ranges': 'bytes'}
+        if request.method == 'HEAD' or not header:
+            return web.Response(body=PAYLOAD, headers=headers)
+
+        start, end = (int(x) for x in header.split('=')[1].split('-'))
+        body = PAYLOAD[start:end + 1]
+        if self.short_ranges:
+            # Complete as far as HTTP is concerned, but shorter than the range
+            body = body[:-100]
+        headers['Content-Range'] = f"bytes {start}-{end}/{len(PAYLOAD)}"
+        return web.Response(status=206, body=body, headers=headers)
+
+    def range_gets(self) -> int:
+        return sum(1 for method, header in self.requests if method == 'GET' and header)
+
+    def plain_gets(self) -> int:
+        return sum(1 for method, header in self.requests if method == 'GET' and not header)
+
+def download(server: MediaServer, filename: str, segments: int) -> bool:
+    """Serve on a free local port and download from it"""
+    async def run():
+        app = web.Application()
+        app.router.add_route('*', '/song.mp3', server.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await helpers.download_file(f"http://127.0.0.1:{port}/song.mp3", filename, segments)
+        finally:
+            await helpers.close_http_session()
+            await runner.cleanup()
+    return asyncio.run(run())
+
+def read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_segmented_download(tmp_path, monkeypatch):
+    monkeypatch.setattr(helpers, 'MIN_SEGMENT_SIZE', 1)
+    server = MediaServer()
+    target = str(tmp_path / "song.mp3")
+
+    assert download(server, target, segments=4)
+    assert read(target) == PAYLOAD
+    assert server.range_gets() == 4
+    assert server.plain_gets() == 0
+    assert not os.path.exists(target + ".part")
+
+def test_falls_back_without_range_support(tmp_path, monkeypatch):
+    monkeypatch.setattr(helpers, 'MIN_SEGMENT_SIZE', 1)
+    server = MediaServer(ranges=False)
+    target = str(tmp_path / "song.mp3")
+
+    assert download(server, target, segments=4)
+    assert read(target) == PAYLOAD
+    assert server.range_gets() == 0
+    assert server.plain_gets() == 1
+
+def test_short_range_bodies_are_not_published(tmp_path, monkeypatch):
+    monkeypatch.setattr(helpers, 'MIN_SEGMENT_SIZE', 1)
+    server = MediaServer(short_ranges=True)
+    target = str(tmp_path / "song.mp3")
+
+    # The short segments are rejected and the file comes from a single stream instead
+    assert download(server, target, segments=4)
+    assert read(target) == PAYLOAD
+    assert server.plain_gets() == 1
+
+def test_small_files_use_one_stream(tmp_path):
+    server = MediaServer()
+    target = str(tmp_path / "song.mp3")
+
+    assert download(server, target, segments=4)
+    assert read(target) == PAYLOAD
+    assert server.range_gets() == 0
@@ -0,0 +1,36 @@
+"""Edits of the same message"""
+
+import asyncio
+from types import SimpleNamespace
+from utils.editor import EditScheduler
+
+class FakeMessage:
+    def __init__(self):
+        self.chat = SimpleNamespace(id=-100)
+        self.id = 1
+        self.texts = []
+        self.editing = 0
+
+    async def edit_text(self, text, reply_markup=None):
+        self.editing += 1
+        assert self.editing == 1
+        await asyncio.sleep(0.02)
+        self.texts.append(text)
+        self.editing -= 1
+
+def test_edits_of_one_message_keep_their_order():
+    async def run():
+        editor = EditScheduler(chat_interval=0, rate=1000)
+        message = FakeMessage()
+        editor.edit(message, "first")
+        await asyncio.sleep(0.005)
+        # Sent after "first", and only the newest of these two
+        editor.edit(message, "second")
+        editor.edit(message, "third")
+        while editor.pending or editor.sending:
+            await asyncio.sleep(0.005)
+        return editor, message
+
+    editor, message = asyncio.run(run())
+    assert message.texts == ["first", "third"]
+    assert editor.coalesced == 1
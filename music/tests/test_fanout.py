@@ -0,0 +1,77 @@
+"""Per-chat pipes fed from a growing PCM file"""
+
+import os
+import asyncio
+from utils import fanout as fanout_module
+from utils.fanout import FanOut
+from utils.tasks import playback_tasks
+
+PCM = os.urandom(3 * 1024 * 1024)
+
+def start_feed(tmp_path, monkeypatch, transcode: asyncio.Future):
+    """Open a pipe for a chat while a fake transcode writes PCM"""
+    partial = tmp_path / "track.pcm"
+    partial.write_bytes(PCM)
+    monkeypatch.setattr(fanout_module.transcoder, 'running', lambda filepath: (str(partial), transcode))
+
+    fanout = FanOut(str(tmp_path / "fanout"))
+    path = fanout.open(-100, "track.webm")
+    # What the call does with the stream it was given
+    reader = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    return fanout, path, reader
+
+async def drain(reader: int) -> bytes:
+    """Read the pipe until the end of the stream"""
+    chunks = []
+    while True:
+        try:
+            data = os.read(reader, 65536)
+        except BlockingIOError:
+            await asyncio.sleep(0.001)
+            continue
+        if not data:
+            return b"".join(chunks)
+        chunks.append(data)
+
+def test_feed_copies_whole_file(tmp_path, monkeypatch):
+    async def run():
+        transcode = asyncio.get_running_loop().create_future()
+        transcode.set_result(None)
+        fanout, path, reader = start_feed(tmp_path, monkeypatch, transcode)
+        try:
+            data = await asyncio.wait_for(drain(reader), 10)
+        finally:
+            os.close(reader)
+        await asyncio.sleep(0)
+        return fanout, path, data
+
+    fanout, path, data = asyncio.run(run())
+    assert data == PCM
+    assert fanout.feeds == 0
+    assert not os.path.exists(path)
+
+def test_cancelled_feed_ends_the_stream(tmp_path, monkeypatch):
+    async def run():
+        # The decode is still running, so only cancelling ends the feed
+        transcode = asyncio.get_running_loop().create_future()
+        fanout, path, reader = start_feed(tmp_path, monkeypatch, transcode)
+        try:
+            # Let the feed fill the pipe and wait for room
+            await asyncio.sleep(0.2)
+            assert fanout.feeds == 1
+            assert os.path.exists(path)
+
+            playback_tasks.cancel(-100, "fanout")
+            await asyncio.sleep(0.1)
+            assert fanout.feeds == 0
+            assert not os.path.exists(path)
+
+            # The call gets what was written, then the end of the stream instead of waiting forever
+            data = await asyncio.wait_for(drain(reader), 5)
+        finally:
+            os.close(reader)
+        return data
+
+    data = asyncio.run(run())
+    assert 0 < len(data) < len(PCM)
+    assert PCM.startswith(data)
@@ -0,0 +1,54 @@
+"""Counters kept for handler sends and process pool waits"""
+
+import asyncio
+import time
+import pytest
+from pyrogram.errors import FloodWait, ChatWriteForbidden
+from utils.executors import ProcessPool
+from utils.helpers import reply, send
+from utils.metrics import TELEGRAM_ERRORS, FLOOD_WAIT_SECONDS
+
+class FailingMessage:
+    def __init__(self, error: Exception):
+        self.error = error
+
+    async def reply_text(self, text: str, **kwargs):
+        raise self.error
+
+class FailingClient(FailingMessage):
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        raise self.error
+
+def test_send_errors_are_counted():
+    floods = TELEGRAM_ERRORS.values.get(("FloodWait",), 0)
+    forbidden = TELEGRAM_ERRORS.values.get(("ChatWriteForbidden",), 0)
+    waited = FLOOD_WAIT_SECONDS.values.get((), 0)
+
+    with pytest.raises(FloodWait):
+        asyncio.run(reply(FailingMessage(FloodWait(value=7)), "hi"))
+    with pytest.raises(ChatWriteForbidden):
+        asyncio.run(send(FailingClient(ChatWriteForbidden()), -100, "hi"))
+    with pytest.raises(ValueError):
+        asyncio.run(reply(FailingMessage(ValueError()), "hi"))
+
+    assert TELEGRAM_ERRORS.values[("FloodWait",)] == floods + 1
+    assert TELEGRAM_ERRORS.values[("ChatWriteForbidden",)] == forbidden + 1
+    assert ("ValueError",) not in TELEGRAM_ERRORS.values
+    assert FLOOD_WAIT_SECONDS.values[()] == waited + 7
+
+def test_process_pool_waits():
+    async def run():
+        pool = ProcessPool("test", 1)
+        pool.start({})
+        try:
+            await pool.run(time.sleep, 0)
+            await asyncio.gather(*(pool.run(time.sleep, 0.2) for _ in range(3)))
+            return pool.stats()
+        finally:
+            pool.shutdown()
+
+    stats = asyncio.run(run())
+    assert stats['completed'] == 4
+    # The last of the three queued jobs waited for the other two
+    assert stats['max_wait'] >= 0.35
+    assert 0 < stats['avg_wait'] < stats['max_wait']
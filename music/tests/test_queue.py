@@ -0,0 +1,30 @@
+"""Queue reordering"""
+
+from utils.queue import MusicQueue, Track, MediaType
+
+def make_queue(count: int) -> MusicQueue:
+    queue = MusicQueue(limit=None)
+    for i in range(count):
+        queue.add(Track(f"Track {i}", 180, f"https://youtu.be/{i:011d}", "youtube", MediaType.AUDIO))
+    return queue
+
+def titles(queue: MusicQueue) -> list:
+    return [int(track.title.split()[1]) for track in queue.queue]
+
+def test_move_matches_list_moves():
+    size = 7
+    for source in range(size):
+        for target in range(size):
+            queue = make_queue(size)
+            expected = list(range(size))
+            expected.insert(target, expected.pop(source))
+            assert queue.move(source, target)
+            assert titles(queue) == expected
+            queue.clear()
+
+def test_move_rejects_bad_positions():
+    queue = make_queue(3)
+    assert not queue.move(3, 0)
+    assert not queue.move(0, -1)
+    assert titles(queue) == [0, 1, 2]
+    queue.clear()
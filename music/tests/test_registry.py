@@ -0,0 +1,64 @@
+"""Chat registry writes made in the background"""
+
+import asyncio
+from utils.broadcast import ChatRegistry
+from utils.executors import registry_pool
+
+def test_background_writes_persist(tmp_path):
+    db_path = str(tmp_path / "chats.db")
+
+    async def run():
+        registry = ChatRegistry(db_path)
+        completed = registry_pool.completed
+        for chat_id in (-100, -200, -300):
+            registry.add(chat_id)
+        registry.add(-100)
+        registry.deactivate(-200)
+        assert len(registry._writes) == 4
+
+        await registry.flush()
+        assert not registry._writes
+        assert registry_pool.completed - completed == 4
+
+        reloaded = ChatRegistry(db_path)
+        await reloaded.load()
+        return reloaded.chats
+
+    assert asyncio.run(run()) == {-100, -300}
+
+class FakeClient:
+    def __init__(self, errors):
+        self.errors = errors
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.errors:
+            raise self.errors[chat_id]
+
+def test_failed_chats_are_left_for_resume(tmp_path, monkeypatch):
+    from pyrogram.errors import UserIsBlocked
+    from utils import broadcast as broadcast_module
+    monkeypatch.setattr(broadcast_module.editor, 'edit', lambda *args, **kwargs: None)
+    db_path = str(tmp_path / "chats.db")
+
+    async def run():
+        registry = ChatRegistry(db_path)
+        for chat_id in (-100, -200, -300):
+            registry.add(chat_id)
+        broadcaster = broadcast_module.Broadcaster(registry, rate=1000, concurrency=2)
+        client = FakeClient({-200: UserIsBlocked(), -300: OSError("timed out")})
+
+        await broadcaster.start(client, None, "hello")
+        await broadcaster.task
+        unfinished = await registry.unfinished_broadcast()
+        delivered = await registry.delivered(unfinished[0])
+
+        # The resume only goes to the chat that failed for now
+        client.errors.clear()
+        await broadcaster.start(client, None)
+        await broadcaster.task
+        return delivered, registry.chats, await registry.unfinished_broadcast()
+
+    delivered, chats, unfinished = asyncio.run(run())
+    assert delivered == {-100, -200}
+    assert chats == {-100, -300}
+    assert unfinished is None
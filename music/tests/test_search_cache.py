@@ -0,0 +1,43 @@
+"""Searches shared between concurrent callers"""
+
+import asyncio
+from utils.cache import SearchCache
+
+def test_cancelled_leader_hands_over():
+    async def run():
+        cache = SearchCache()
+        calls = []
+
+        async def fetch():
+            calls.append(len(calls))
+            await asyncio.sleep(0.05)
+            return [{'title': f"result {len(calls)}"}]
+
+        leader = asyncio.create_task(cache.get_or_fetch("Song", 5, fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.get_or_fetch(" song ", 5, fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        assert leader.cancelled()
+        return cache, calls, results
+
+    cache, calls, results = asyncio.run(run())
+    # One follower ran the search again and the others shared it
+    assert len(calls) == 2
+    assert results == [[{'title': "result 2"}]] * 3
+    assert cache.inflight == {}
+
+def test_errors_reach_every_caller():
+    async def run():
+        cache = SearchCache()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("backend down")
+
+        return await asyncio.gather(*(cache.get_or_fetch("song", 5, fetch) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
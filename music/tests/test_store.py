@@ -0,0 +1,191 @@
+"""Write-behind queue persistence against an in-process collection"""
+
+import asyncio
+import copy
+import pytest
+from pymongo import DeleteOne, ReplaceOne
+from utils import queue as queue_module
+from utils.queue import MusicQueue, Track, MediaType
+from utils.store import QueueStore
+
+class FakeCollection:
+    """The part of a motor collection QueueStore uses, kept in a dict"""
+
+    def __init__(self, docs=None):
+        self.docs = dict(docs or {})
+        self.batches = []
+        self.failures = 0
+
+    async def distinct(self, key: str):
+        return [doc[key] for doc in self.docs.values()]
+
+    async def find_one(self, query: dict):
+        doc = self.docs.get(query['_id'])
+        return copy.deepcopy(doc) if doc else None
+
+    async def bulk_write(self, operations: list, ordered: bool = True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("not primary")
+
+        self.batches.append(operations)
+        for op in operations:
+            chat_id = op._filter['_id']
+            if isinstance(op, ReplaceOne):
+                self.docs[chat_id] = dict(copy.deepcopy(op._doc), _id=chat_id)
+            elif isinstance(op, DeleteOne):
+                self.docs.pop(chat_id, None)
+
+def make_track(i: int) -> Track:
+    return Track(f"Track {i}", 180, f"https://youtu.be/{i:011d}", "youtube", MediaType.AUDIO)
+
+def make_queue(store: QueueStore, chat_id: int, count: int) -> MusicQueue:
+    queue = MusicQueue()
+    queue.chat_id = chat_id
+    queue.store = store
+    for i in range(count):
+        queue.add(make_track(i))
+    return queue
+
+@pytest.fixture(autouse=True)
+def reset_queues():
+    yield
+    for queue in list(queue_module.queues.values()):
+        queue.clear()
+    queue_module.queues.clear()
+    MusicQueue.total_queued = 0
+
+def test_changes_are_batched():
+    async def run():
+        collection = FakeCollection()
+        store = QueueStore(collection, flush_interval=0.01)
+        queue = make_queue(store, -100, 3)
+        queue.skip()
+        queue.loop_mode = True
+        queue.save()
+        make_queue(store, -200, 1)
+
+        assert collection.batches == []
+        await asyncio.sleep(0.05)
+        return collection, store
+
+    collection, store = asyncio.run(run())
+    # Every change to both chats within the interval went out as one batch
+    assert len(collection.batches) == 1
+    assert len(collection.batches[0]) == 2
+    assert store.writes == 2
+    assert store.dirty == {}
+
+    doc = collection.docs[-100]
+    assert doc['current']['title'] == "Track 0"
+    assert [track['title'] for track in doc['tracks']] == ["Track 1", "Track 2"]
+    assert doc['loop_mode'] is True
+
+def test_empty_queue_is_deleted():
+    async def run():
+        collection = FakeCollection({-100: {'_id': -100, 'tracks': []}, -200: {'_id': -200, 'tracks': []}})
+        store = QueueStore(collection)
+        queue = make_queue(store, -100, 2)
+        queue.clear()
+        store.mark_dirty(-200, None)
+        await store.flush()
+        await store.close()
+        return collection
+
+    collection = asyncio.run(run())
+    assert collection.docs == {}
+    assert all(isinstance(op, DeleteOne) for op in collection.batches[0])
+
+def test_failed_flush_is_retried():
+    async def run():
+        collection = FakeCollection()
+        collection.failures = 1
+        store = QueueStore(collection)
+        queue = make_queue(store, -100, 2)
+
+        await store.flush()
+        assert store.errors == 1
+        assert -100 in store.dirty
+        assert collection.docs == {}
+
+        # A change made before the retry is what gets written
+        queue.add(make_track(2))
+        await store.flush()
+        await store.close()
+        return collection, store
+
+    collection, store = asyncio.run(run())
+    assert store.dirty == {}
+    assert store.writes == 1
+    assert len(collection.docs[-100]['tracks']) == 3
+
+def test_restore(monkeypatch):
+    saved = MusicQueue()
+    for i in range(3):
+        saved.add(make_track(i))
+    saved.skip()
+    saved.shuffle_mode = True
+    saved.position = 42
+    data = dict(saved.to_dict(), _id=-100)
+    saved.clear()
+
+    async def run():
+        collection = FakeCollection({-100: data})
+        store = QueueStore(collection)
+        monkeypatch.setattr(queue_module, 'queue_store', store)
+        await store.connect()
+        assert store.has(-100)
+        assert not store.has(-200)
+
+        queue = await queue_module.load_queue(-100)
+        assert not store.has(-100)
+        other = await queue_module.load_queue(-200)
+        await store.close()
+        return queue, other
+
+    queue, other = asyncio.run(run())
+    # The interrupted track is queued first
+    assert [track.title for track in queue.queue] == ["Track 0", "Track 1", "Track 2"]
+    assert queue.current is None
+    assert queue.shuffle_mode is True
+    assert queue.position == 42
+    assert queue.store is not None
+    assert len(other.queue) == 0
+
+def test_concurrent_loads_share_one_restore(monkeypatch):
+    saved = MusicQueue()
+    for i in range(2):
+        saved.add(make_track(i))
+    data = dict(saved.to_dict(), _id=-100)
+    saved.clear()
+
+    class SlowCollection(FakeCollection):
+        reads = 0
+
+        async def find_one(self, query: dict):
+            self.reads += 1
+            await asyncio.sleep(0.05)
+            return await super().find_one(query)
+
+    async def run():
+        collection = SlowCollection({-100: data})
+        store = QueueStore(collection)
+        monkeypatch.setattr(queue_module, 'queue_store', store)
+        await store.connect()
+
+        first = asyncio.create_task(queue_module.load_queue(-100))
+        await asyncio.sleep(0.01)
+        # Still saved while the first read runs, so this one waits for it
+        assert store.has(-100)
+        second = await queue_module.load_queue(-100)
+        first = await first
+        assert not store.has(-100)
+        await store.close()
+        return collection, first, second
+
+    collection, first, second = asyncio.run(run())
+    assert first is second
+    assert collection.reads == 1
+    assert [track.title for track in first.queue] == ["Track 0", "Track 1"]
+    # Nothing overwrote the saved document with an empty queue
+    assert len(collection.docs[-100]['tracks']) == 2
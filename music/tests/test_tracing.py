@@ -0,0 +1,26 @@
+"""Trace export"""
+
+import asyncio
+import json
+from utils.tracing import Tracer
+from utils.executors import trace_pool
+
+def test_finished_traces_are_written_in_order(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+
+    async def run():
+        tracer = Tracer(path)
+        completed = trace_pool.completed
+        traces = []
+        for i in range(100):
+            trace = tracer.start("play", -100, f"song {i}")
+            tracer.finish(trace)
+            traces.append(trace.id)
+        await tracer.flush()
+        assert trace_pool.completed - completed == 100
+        return traces
+
+    traces = asyncio.run(run())
+    with open(path) as f:
+        written = [json.loads(line)['trace_id'] for line in f]
+    assert written == traces
@@ -0,0 +1,85 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Optional, Set, Tuple
+from pyrogram import Client
+from pyrogram.enums import ChatMembersFilter, ChatMemberStatus
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Statuses that may control playback
+ADMIN_STATUSES = {ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR}
+
+class AdminCache:
+    """Admin ids per chat, filled by one administrators fetch and kept fresh by member updates"""
+
+    def __init__(self, ttl: int = Config.ADMIN_CACHE_TTL):
+        self.ttl = ttl
+        self.chats: Dict[int, Tuple[float, Set[int]]] = {}
+        self.inflight: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.fetches = 0
+
+    async def get(self, client: Client, chat_id: int) -> Optional[Set[int]]:
+        """Get admin ids of a chat, None if they could not be fetched"""
+        entry = self.chats.get(chat_id)
+        if entry and entry[0] > time.time():
+            self.hits += 1
+            return entry[1]
+
+        pending = self.inflight.get(chat_id)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_event_loop().create_future()
+        self.inflight[chat_id] = future
+        try:
+            admins = await self._fetch(client, chat_id)
+            if admins is not None:
+                self.chats[chat_id] = (time.time() + self.ttl, admins)
+            future.set_result(admins)
+            return admins
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        finally:
+            del self.inflight[chat_id]
+
+    async def _fetch(self, client: Client, chat_id: int) -> Optional[Set[int]]:
+        """Fetch all administrators of a chat in one request"""
+        self.fetches += 1
+        try:
+            admins = set()
+            async for member in client.get_chat_members(chat_id, filter=ChatMembersFilter.ADMINISTRATORS):
+                if member.user:
+                    admins.add(member.user.id)
+            return admins
+        except Exception as e:
+            logger.warning(f"Could not fetch admins of {chat_id}: {e}")
+            return None
+
+    def update(self, chat_id: int, user_id: int, status: Optional[ChatMemberStatus]):
+        """Apply a member status change to a cached chat"""
+        entry = self.chats.get(chat_id)
+        if not entry:
+            return
+        if status in ADMIN_STATUSES:
+            entry[1].add(user_id)
+        else:
+            entry[1].discard(user_id)
+
+    def invalidate(self, chat_id: int):
+        """Drop cached admins of a chat"""
+        self.chats.pop(chat_id, None)
+
+    def stats(self) -> Dict:
+        """Get cache statistics"""
+        return {
+            'chats': len(self.chats),
+            'hits': self.hits,
+            'fetches': self.fetches,
+        }
+
+# Global admin cache
+admin_cache = AdminCache()
@@ -0,0 +1,257 @@
+import math
+import bisect
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from pyrogram import Client
+from pyrogram.enums import ChatMemberStatus
+from pyrogram.errors import UserAlreadyParticipant
+from pytgcalls import PyTgCalls
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class Assistant:
+    """One assistant account with its own PyTgCalls client"""
+
+    def __init__(self, name: str, session_string: str):
+        self.name = name
+        self.client = Client(
+            name,
+            api_id=Config.API_ID,
+            api_hash=Config.API_HASH,
+            session_string=session_string
+        )
+        self.call_py = PyTgCalls(self.client)
+        self.healthy = False
+        self.chats = set()
+
+    async def start(self):
+        """Start the PyTgCalls client and its account"""
+        await self.call_py.start()
+        self.healthy = True
+        logger.info(f"✓ Assistant {self.name} started")
+
+    async def stop(self):
+        """Stop the PyTgCalls client"""
+        self.healthy = False
+        try:
+            await self.call_py.stop()
+        except Exception as e:
+            logger.warning(f"Could not stop assistant {self.name}: {e}")
+
+    def is_connected(self) -> bool:
+        """Check if the account is still connected"""
+        return bool(self.client.is_connected)
+
+    async def is_member(self, chat_id: int) -> bool:
+        """Check if the account is in a chat"""
+        try:
+            member = await self.client.get_chat_member(chat_id, "me")
+        except Exception:
+            # UserNotParticipant, or a chat the account has never seen
+            return False
+        return member.status not in (ChatMemberStatus.BANNED, ChatMemberStatus.LEFT)
+
+    async def join(self, bot: Client, chat_id: int):
+        """Join a chat through a single-use invite link made by the bot"""
+        link = await bot.create_chat_invite_link(chat_id, member_limit=1)
+        try:
+            await self.client.join_chat(link.invite_link)
+        except UserAlreadyParticipant:
+            pass
+        logger.info(f"Assistant {self.name} joined {chat_id}")
+
+class AssistantRouter:
+    """Assigns chats to assistants by consistent hashing with bounded load"""
+
+    def __init__(self, replicas: int = 100, load_factor: float = Config.ASSISTANT_LOAD_FACTOR):
+        self.replicas = replicas
+        self.load_factor = load_factor
+        self.assistants: List[Assistant] = []
+        self.ring: List[Tuple[int, int]] = []
+        self.assignments: Dict[int, Assistant] = {}
+        self.failovers = 0
+        self.rebalanced = 0
+        # Called with the chat id of every call moved off a dropped assistant
+        self.on_failover: Optional[Callable[[int], Awaitable]] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        """Stable hash, Python's hash() changes between runs"""
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    def add(self, name: str, session_string: str) -> Assistant:
+        """Add an assistant and its points on the ring"""
+        assistant = Assistant(name, session_string)
+        index = len(self.assistants)
+        self.assistants.append(assistant)
+        for replica in range(self.replicas):
+            bisect.insort(self.ring, (self._hash(f"{name}#{replica}"), index))
+        return assistant
+
+    def get(self, chat_id: int) -> Optional[Assistant]:
+        """Get the assistant serving a chat, None if the chat is not in a call"""
+        return self.assignments.get(chat_id)
+
+    async def assign(self, bot: Client, chat_id: int) -> Assistant:
+        """Get the assistant for a chat about to join its call, preferring one that is in the chat"""
+        assistant = self.assignments.get(chat_id)
+        if assistant and assistant.healthy:
+            if not self._overloaded(assistant):
+                return assistant
+
+            # Calls are only moved here, between tracks, so a recovered or idle
+            # assistant takes load back without cutting running tracks short
+            logger.info(f"Moving {chat_id} off overloaded assistant {assistant.name}")
+            try:
+                await assistant.call_py.leave_group_call(chat_id)
+            except Exception as e:
+                logger.warning(f"Could not leave {chat_id} on assistant {assistant.name}: {e}")
+            self.release(chat_id)
+            self.rebalanced += 1
+
+        candidates = self._candidates(chat_id)
+        members = await asyncio.gather(*(a.is_member(chat_id) for a in candidates))
+        assistant = next((a for a, member in zip(candidates, members) if member), None)
+        if assistant is None:
+            assistant = candidates[0]
+            await assistant.join(bot, chat_id)
+        return self._assign(chat_id, assistant)
+
+    def _assign(self, chat_id: int, assistant: Assistant) -> Assistant:
+        """Record that an assistant serves a chat"""
+        previous = self.assignments.get(chat_id)
+        if previous:
+            previous.chats.discard(chat_id)
+        assistant.chats.add(chat_id)
+        self.assignments[chat_id] = assistant
+        return assistant
+
+    def call_py(self, chat_id: int) -> PyTgCalls:
+        """Get the PyTgCalls client of the assistant in a chat's call"""
+        assistant = self.get(chat_id)
+        if assistant is None:
+            raise RuntimeError("No assistant is in this voice chat")
+        return assistant.call_py
+
+    async def leave(self, chat_id: int):
+        """Leave voice chat and free the assistant slot"""
+        assistant = self.get(chat_id)
+        if assistant is None:
+            return
+        try:
+            await assistant.call_py.leave_group_call(chat_id)
+        finally:
+            self.release(chat_id)
+
+    def release(self, chat_id: int):
+        """Forget the assignment of a chat that is no longer in a call"""
+        assistant = self.assignments.pop(chat_id, None)
+        if assistant:
+            assistant.chats.discard(chat_id)
+
+    def _pick(self, chat_id: int) -> Assistant:
+        """Get the first healthy assistant with spare capacity on the ring after the chat's point"""
+        return self._candidates(chat_id)[0]
+
+    def _capacity(self, calls: int) -> int:
+        """Get the most calls one healthy assistant should carry out of calls"""
+        healthy = sum(1 for a in self.assistants if a.healthy)
+        if not healthy:
+            raise RuntimeError("No assistant is available")
+
+        # Nobody gets more than load_factor times the average, so hot spots spill to the next node
+        return math.ceil(calls * self.load_factor / healthy)
+
+    def _overloaded(self, assistant: Assistant) -> bool:
+        """Check if an assistant carries more than its share of the running calls"""
+        return len(assistant.chats) > self._capacity(len(self.assignments))
+
+    def _candidates(self, chat_id: int) -> List[Assistant]:
+        """Walk the ring from the chat's point, collecting healthy assistants with spare capacity"""
+        capacity = self._capacity(len(self.assignments) + 1)
+        healthy = [a for a in self.assistants if a.healthy]
+
+        start = bisect.bisect(self.ring, (self._hash(str(chat_id)), -1))
+        seen = set()
+        candidates = []
+        for i in range(len(self.ring)):
+            _, index = self.ring[(start + i) % len(self.ring)]
+            if index in seen:
+                continue
+            seen.add(index)
+
+            assistant = self.assistants[index]
+            if assistant.healthy and len(assistant.chats) < capacity:
+                candidates.append(assistant)
+
+        return candidates or [min(healthy, key=lambda a: len(a.chats))]
+
+    async def start(self):
+        """Start every assistant and the health checks"""
+        results = await asyncio.gather(*(a.start() for a in self.assistants), return_exceptions=True)
+        for assistant, result in zip(self.assistants, results):
+            if isinstance(result, Exception):
+                logger.error(f"✗ Assistant {assistant.name} failed to start: {result}")
+
+        if not any(a.healthy for a in self.assistants):
+            raise RuntimeError("No assistant could be started")
+
+        if len(self.assistants) > 1:
+            self._health_task = asyncio.create_task(self._check_health())
+
+    async def stop(self):
+        """Stop health checks and every assistant"""
+        if self._health_task:
+            self._health_task.cancel()
+        await asyncio.gather(*(a.stop() for a in self.assistants))
+
+    async def _check_health(self):
+        """Move calls off assistants that lost their connection"""
+        while True:
+            await asyncio.sleep(Config.ASSISTANT_HEALTH_INTERVAL)
+            for assistant in self.assistants:
+                connected = assistant.is_connected()
+                if assistant.healthy and not connected:
+                    await self._fail_over(assistant)
+                elif not assistant.healthy and connected:
+                    # New calls spread back onto it, running ones move as their tracks end
+                    assistant.healthy = True
+                    logger.info(f"Assistant {assistant.name} is back")
+
+    async def _fail_over(self, assistant: Assistant):
+        """Reassign the chats of a dropped assistant"""
+        assistant.healthy = False
+        chats = list(assistant.chats)
+        logger.warning(f"Assistant {assistant.name} dropped, moving {len(chats)} calls")
+
+        for chat_id in chats:
+            self.release(chat_id)
+            self.failovers += 1
+        if not self.on_failover:
+            return
+
+        # Moves wait on Telegram, so run a few at once
+        semaphore = asyncio.Semaphore(Config.FAILOVER_CONCURRENCY)
+
+        async def move(chat_id: int):
+            async with semaphore:
+                try:
+                    await self.on_failover(chat_id)
+                except Exception as e:
+                    logger.error(f"Failover error in {chat_id}: {e}")
+
+        await asyncio.gather(*(move(chat_id) for chat_id in chats))
+
+    def stats(self) -> List[Dict]:
+        """Get per-assistant load"""
+        return [
+            {'name': a.name, 'healthy': a.healthy, 'calls': len(a.chats)}
+            for a in self.assistants
+        ]
+
+# Global assistant router
+router = AssistantRouter()
@@ -0,0 +1,324 @@
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from pyrogram import Client
+from pyrogram.types import Message
+from pyrogram.errors import (
+    FloodWait, ChatWriteForbidden, UserIsBlocked, PeerIdInvalid,
+    ChannelPrivate, ChatAdminRequired, InputUserDeactivated
+)
+from utils.editor import editor
+from utils.executors import registry_pool
+from utils.metrics import telegram_error
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a chat is taken out of the registry
+GONE_ERRORS = (
+    ChatWriteForbidden, UserIsBlocked, PeerIdInvalid,
+    ChannelPrivate, ChatAdminRequired, InputUserDeactivated
+)
+
+# Times a chat is retried after FloodWait before counting it as failed
+FLOOD_RETRIES = 3
+
+class ChatRegistry:
+    """Persisted set of chats the bot talks to, plus broadcast delivery state"""
+
+    def __init__(self, db_path: str = Config.CHATS_DB):
+        self.db_path = db_path
+        self.chats: Set[int] = set()
+        self._db = None
+        self._lock = threading.Lock()
+        self._writes: Set[asyncio.Task] = set()
+
+    async def load(self):
+        """Read active chats into memory"""
+        self.chats = await registry_pool.run(self._db_load)
+        logger.info(f"Chat registry loaded: {len(self.chats)} chats")
+
+    def add(self, chat_id: int):
+        """Remember a chat, writing only chats not seen before"""
+        if chat_id in self.chats:
+            return
+        self.chats.add(chat_id)
+        self._write_later("INSERT OR REPLACE INTO chats (chat_id, added, active) VALUES (?, ?, 1)", (chat_id, time.time()))
+
+    def deactivate(self, chat_id: int):
+        """Stop targeting a chat the bot can no longer write to"""
+        self.chats.discard(chat_id)
+        self._write_later("UPDATE chats SET active = 0 WHERE chat_id = ?", (chat_id,))
+
+    async def flush(self):
+        """Wait for background writes to finish"""
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    async def create_broadcast(self, text: str) -> int:
+        """Store a new broadcast and return its id"""
+        return await registry_pool.run(self._execute,
+            "INSERT INTO broadcasts (text, created) VALUES (?, ?)", (text, time.time()))
+
+    async def unfinished_broadcast(self) -> Optional[Tuple[int, str]]:
+        """Get the latest broadcast that did not complete"""
+        rows = await registry_pool.run(self._query,
+            "SELECT id, text FROM broadcasts WHERE finished IS NULL ORDER BY id DESC LIMIT 1", ())
+        return rows[0] if rows else None
+
+    async def delivered(self, broadcast_id: int) -> Set[int]:
+        """Get chats a broadcast already went to"""
+        rows = await registry_pool.run(self._query,
+            "SELECT chat_id FROM deliveries WHERE broadcast_id = ?", (broadcast_id,))
+        return {row[0] for row in rows}
+
+    async def record(self, broadcast_id: int, chat_ids: List[int]):
+        """Mark chats as done for a broadcast"""
+        if not chat_ids:
+            return
+        await registry_pool.run(self._executemany,
+            "INSERT OR IGNORE INTO deliveries (broadcast_id, chat_id) VALUES (?, ?)",
+            [(broadcast_id, chat_id) for chat_id in chat_ids])
+
+    async def finish(self, broadcast_id: int):
+        """Mark a broadcast as complete and drop its delivery rows"""
+        await registry_pool.run(self._execute,
+            "UPDATE broadcasts SET finished = ? WHERE id = ?", (time.time(), broadcast_id))
+        await registry_pool.run(self._execute,
+            "DELETE FROM deliveries WHERE broadcast_id = ?", (broadcast_id,))
+
+    def _write_later(self, sql: str, params: tuple):
+        """Run a write query in the background, keeping the task until it is done"""
+        task = asyncio.get_running_loop().create_task(registry_pool.run(self._execute, sql, params))
+        self._writes.add(task)
+        task.add_done_callback(self._written)
+
+    def _written(self, task: asyncio.Task):
+        """Drop a finished background write, logging failures outside the query itself"""
+        self._writes.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Chat registry write error: {task.exception()}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the SQLite database on first use"""
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS chats (chat_id INTEGER PRIMARY KEY, added REAL, active INTEGER)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS broadcasts "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT, created REAL, finished REAL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS deliveries "
+                "(broadcast_id INTEGER, chat_id INTEGER, PRIMARY KEY (broadcast_id, chat_id))"
+            )
+        return self._db
+
+    def _db_load(self) -> Set[int]:
+        """Read active chat ids"""
+        return {row[0] for row in self._query("SELECT chat_id FROM chats WHERE active = 1", ())}
+
+    def _query(self, sql: str, params: tuple) -> list:
+        """Run a read query"""
+        try:
+            with self._lock:
+                return self._connect().execute(sql, params).fetchall()
+        except Exception as e:
+            logger.error(f"Chat registry read error: {e}")
+            return []
+
+    def _execute(self, sql: str, params: tuple) -> Optional[int]:
+        """Run a write query, returns the last row id"""
+        try:
+            with self._lock:
+                db = self._connect()
+                with db:
+                    return db.execute(sql, params).lastrowid
+        except Exception as e:
+            logger.error(f"Chat registry write error: {e}")
+            return None
+
+    def _executemany(self, sql: str, rows: Iterable[tuple]):
+        """Run a write query for many rows in one transaction"""
+        try:
+            with self._lock:
+                db = self._connect()
+                with db:
+                    db.executemany(sql, rows)
+        except Exception as e:
+            logger.error(f"Chat registry write error: {e}")
+
+class TokenBucket:
+    """Global send rate limit that every broadcast worker draws from"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    async def acquire(self):
+        """Wait for a token"""
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds: float):
+        """Stop all sends for a while, FloodWait applies to the whole bot"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        # Start refilling from empty once the wait is over
+        self.tokens = 0
+        self.updated = self.blocked_until
+
+class Broadcaster:
+    """Sends a message to every registered chat under a global rate limit"""
+
+    def __init__(self, registry: ChatRegistry, rate: float = Config.BROADCAST_RATE,
+                 concurrency: int = Config.BROADCAST_CONCURRENCY):
+        self.registry = registry
+        # Small burst so the first second doesn't go far over the rate
+        self.bucket = TokenBucket(rate, burst=concurrency)
+        self.concurrency = concurrency
+        self.task: Optional[asyncio.Task] = None
+        self.progress: Dict = {}
+
+    @property
+    def running(self) -> bool:
+        """Check if a broadcast is in progress"""
+        return self.task is not None and not self.task.done()
+
+    async def start(self, client: Client, status: Message, text: Optional[str] = None) -> bool:
+        """Start a new broadcast, or resume the last unfinished one when text is None"""
+        if text is None:
+            unfinished = await self.registry.unfinished_broadcast()
+            if not unfinished:
+                return False
+            broadcast_id, text = unfinished
+            done = await self.registry.delivered(broadcast_id)
+        else:
+            broadcast_id = await self.registry.create_broadcast(text)
+            done = set()
+
+        targets = sorted(self.registry.chats - done)
+        self.task = asyncio.create_task(self._run(client, status, broadcast_id, text, targets))
+        return True
+
+    def cancel(self) -> bool:
+        """Stop the running broadcast, it can be resumed later"""
+        if not self.running:
+            return False
+        self.task.cancel()
+        return True
+
+    async def _run(self, client: Client, status: Message, broadcast_id: int, text: str, targets: List[int]):
+        """Deliver to targets with bounded concurrency and report progress"""
+        pending: asyncio.Queue = asyncio.Queue()
+        for chat_id in targets:
+            pending.put_nowait(chat_id)
+
+        self.progress = {'total': len(targets), 'sent': 0, 'failed': 0, 'removed': 0, 'started': time.monotonic()}
+        done: List[int] = []
+
+        async def worker():
+            while True:
+                try:
+                    chat_id = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                # Chats that failed for now stay out of done, so a resume retries them
+                if await self._deliver(client, chat_id, text):
+                    done.append(chat_id)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(self._report(status, broadcast_id, done))
+        try:
+            await asyncio.gather(*workers)
+            await self.registry.record(broadcast_id, done)
+            retry = self.progress['failed'] - self.progress['removed']
+            if retry:
+                editor.edit(
+                    status,
+                    f"⚠️ **Broadcast finished with errors!**\n\n{self._progress_text()}\n\n"
+                    f"Use `/broadcast resume` to retry {retry} failed chats."
+                )
+            else:
+                await self.registry.finish(broadcast_id)
+                editor.edit(status, f"📡 **Broadcast Complete!**\n\n{self._progress_text()}")
+        except asyncio.CancelledError:
+            for task in workers:
+                task.cancel()
+            await self.registry.record(broadcast_id, done)
+            editor.edit(
+                status,
+                f"⏹️ **Broadcast stopped!**\n\n{self._progress_text()}\n\n"
+                f"Use `/broadcast resume` to continue."
+            )
+        finally:
+            reporter.cancel()
+
+    async def _deliver(self, client: Client, chat_id: int, text: str) -> bool:
+        """Send to one chat, waiting out FloodWait, False if it should be retried"""
+        for _ in range(FLOOD_RETRIES + 1):
+            await self.bucket.acquire()
+            try:
+                await client.send_message(chat_id, f"📢 **Broadcast Message:**\n\n{text}")
+                self.progress['sent'] += 1
+                return True
+            except FloodWait as e:
+                telegram_error(e)
+                logger.warning(f"Broadcast FloodWait: {e.value}s")
+                self.bucket.block(e.value)
+            except GONE_ERRORS as e:
+                telegram_error(e)
+                self.registry.deactivate(chat_id)
+                self.progress['removed'] += 1
+                self.progress['failed'] += 1
+                # Gone for good, nothing to retry
+                return True
+            except Exception as e:
+                logger.debug(f"Broadcast to {chat_id} failed: {e}")
+                self.progress['failed'] += 1
+                return False
+        self.progress['failed'] += 1
+        return False
+
+    async def _report(self, status: Message, broadcast_id: int, done: List[int]):
+        """Edit the status message and save delivered chats now and then"""
+        while True:
+            await asyncio.sleep(Config.BROADCAST_PROGRESS_INTERVAL)
+            batch = done[:]
+            del done[:len(batch)]
+            await self.registry.record(broadcast_id, batch)
+            editor.edit(status, f"📡 **Broadcasting...**\n\n{self._progress_text()}")
+
+    def _progress_text(self) -> str:
+        """Format progress counters"""
+        p = self.progress
+        finished = p['sent'] + p['failed']
+        elapsed = time.monotonic() - p['started']
+        rate = finished / elapsed if elapsed else 0.0
+        eta = (p['total'] - finished) / rate if rate else 0
+        return (
+            f"✅ **Sent:** {p['sent']}\n"
+            f"❌ **Failed:** {p['failed']} ({p['removed']} removed)\n"
+            f"📊 **Progress:** {finished}/{p['total']}\n"
+            f"⚡ **Rate:** {rate:.1f}/s, ETA {int(eta)}s"
+        )
+
+# Global chat registry and broadcaster
+chat_registry = ChatRegistry()
+broadcaster = Broadcaster(chat_registry)
@@ -0,0 +1,328 @@
+"""
+Local job broker between the bot process and yt-dlp worker processes.
+
+Workers connect over a Unix socket and exchange newline-delimited JSON
+frames with the broker:
+
+    broker -> worker   welcome, job, cancel, ping
+    worker -> broker   hello, result, error, progress, pong
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Largest frame either side accepts
+FRAME_LIMIT = 16 * 1024 * 1024
+
+async def send_frame(writer: asyncio.StreamWriter, frame: Dict):
+    """Write one frame"""
+    writer.write(json.dumps(frame).encode() + b"\n")
+    await writer.drain()
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict]:
+    """Read one frame, None when the connection is closed"""
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+class JobFailed(Exception):
+    """Raised when a job failed in the worker or ran out of retries"""
+
+class JobCancelled(JobFailed):
+    """Raised when a job was cancelled through its cancel event"""
+
+class WorkersUnavailable(JobFailed):
+    """Raised when no worker picked a job up in time"""
+
+class Job:
+    """Job waiting for or running on a worker"""
+
+    def __init__(self, job_id: int, func: str, args: list, progress_callback=None, cancel_event=None):
+        self.id = job_id
+        self.func = func
+        self.args = args
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        self.future = asyncio.get_running_loop().create_future()
+        self.attempts = 0
+        self.cancelling = False
+        self.submitted = time.monotonic()
+        # Fails the job if it is still pending then
+        self.deadline: Optional[asyncio.TimerHandle] = None
+
+    def frame(self) -> Dict:
+        """Build the frame that hands the job to a worker"""
+        return {'type': 'job', 'job': self.id, 'func': self.func, 'args': self.args}
+
+class WorkerConnection:
+    """Broker side of one connected worker"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, pid: int, slots: int):
+        self.reader = reader
+        self.writer = writer
+        self.pid = pid
+        self.slots = slots
+        self.jobs: Dict[int, Job] = {}
+        self.last_seen = time.monotonic()
+
+    @property
+    def free(self) -> int:
+        """Get number of jobs the worker can still take"""
+        return self.slots - len(self.jobs)
+
+class Broker:
+    """Dispatches yt-dlp jobs to worker processes with retries and health checks"""
+
+    def __init__(self, name: str, socket_path: str = Config.BROKER_SOCKET, workers: int = Config.BROKER_WORKERS):
+        self.name = name
+        self.socket_path = socket_path
+        self.max_workers = workers
+        self.workers: List[WorkerConnection] = []
+        self.pending: Deque[Job] = deque()
+        self.completed = 0
+        self.retried = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.profiles: Dict[str, Dict] = {}
+        self._job_ids = itertools.count(1)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._processes: List[asyncio.subprocess.Process] = []
+        self._tasks: List[asyncio.Task] = []
+        self._sends: Set[asyncio.Task] = set()
+
+    async def start(self, profiles: Dict[str, Dict]):
+        """Listen for workers and spawn the local ones"""
+        self.profiles = profiles
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        self._server = await asyncio.start_unix_server(self._serve, path=self.socket_path, limit=FRAME_LIMIT)
+        self._tasks.append(asyncio.create_task(self._check_health()))
+        for index in range(self.max_workers):
+            self._tasks.append(asyncio.create_task(self._supervise(index)))
+        logger.info(f"✓ Broker listening on {self.socket_path} with {self.max_workers} local workers")
+
+    async def run(self, func: str, *args, progress_callback: Optional[Callable] = None, cancel_event=None):
+        """Run a worker job and wait for its result"""
+        job = Job(next(self._job_ids), func, list(args), progress_callback, cancel_event)
+        self._enqueue(job)
+        self._dispatch()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._cancel(job)
+            raise
+
+    def _enqueue(self, job: Job, retry: bool = False):
+        """Queue a job for the next free worker, retries go first"""
+        if retry:
+            self.pending.appendleft(job)
+        else:
+            self.pending.append(job)
+        job.deadline = asyncio.get_running_loop().call_later(Config.BROKER_JOB_WAIT, self._expire, job)
+
+    def _expire(self, job: Job):
+        """Fail a job no worker picked up in time"""
+        if job not in self.pending:
+            return
+        self.pending.remove(job)
+        if not job.future.done():
+            reason = "no worker is connected" if not self.workers else "all workers are busy"
+            logger.error(f"Job {job.id} waited {Config.BROKER_JOB_WAIT}s for a worker, {reason}")
+            job.future.set_exception(WorkersUnavailable(f"Download workers are unavailable ({reason}), try again later."))
+
+    def _dispatch(self):
+        """Hand pending jobs to the least busy workers"""
+        while self.pending:
+            worker = max(self.workers, key=lambda w: w.free, default=None)
+            if not worker or worker.free <= 0:
+                return
+
+            job = self.pending.popleft()
+            job.deadline.cancel()
+            if job.future.done():
+                continue
+
+            waited = time.monotonic() - job.submitted
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+            job.attempts += 1
+            worker.jobs[job.id] = job
+            self._send_later(worker, job.frame())
+
+    def _send_later(self, worker: WorkerConnection, frame: Dict):
+        """Send a frame in the background, keeping the task until it is done"""
+        task = asyncio.create_task(self._send(worker, frame))
+        self._sends.add(task)
+        task.add_done_callback(self._sent)
+
+    def _sent(self, task: asyncio.Task):
+        """Drop a finished send, _send() itself handles connection errors"""
+        self._sends.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Broker send error: {task.exception()}")
+
+    async def _send(self, worker: WorkerConnection, frame: Dict):
+        """Send a frame, dropping the worker if the connection is gone"""
+        try:
+            await send_frame(worker.writer, frame)
+        except (ConnectionError, RuntimeError) as e:
+            logger.warning(f"Lost worker {worker.pid}: {e}")
+            self._drop(worker)
+
+    def _cancel(self, job: Job):
+        """Stop a job wherever it is"""
+        if job in self.pending:
+            self.pending.remove(job)
+            job.deadline.cancel()
+            return
+        for worker in self.workers:
+            if worker.jobs.pop(job.id, None):
+                self._send_later(worker, {'type': 'cancel', 'job': job.id})
+                self._dispatch()
+                return
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handle one worker connection"""
+        worker = None
+        try:
+            hello = await read_frame(reader)
+            if not hello or hello.get('type') != 'hello':
+                return
+
+            worker = WorkerConnection(reader, writer, hello['pid'], hello['slots'])
+            await send_frame(writer, {'type': 'welcome', 'profiles': self.profiles})
+            self.workers.append(worker)
+            logger.info(f"Worker {worker.pid} connected with {worker.slots} slots")
+            self._dispatch()
+
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                worker.last_seen = time.monotonic()
+                self._handle(worker, frame)
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Worker connection error: {e}")
+        finally:
+            if worker:
+                self._drop(worker)
+            writer.close()
+
+    def _handle(self, worker: WorkerConnection, frame: Dict):
+        """Process a frame from a worker"""
+        kind = frame['type']
+        if kind == 'pong':
+            return
+
+        job = worker.jobs.get(frame.get('job'))
+        if not job:
+            return
+
+        if kind == 'progress':
+            if job.cancel_event and job.cancel_event.is_set():
+                # The worker answers with a cancelled error on its next progress tick
+                if not job.cancelling:
+                    job.cancelling = True
+                    self._send_later(worker, {'type': 'cancel', 'job': job.id})
+            elif job.progress_callback:
+                asyncio.ensure_future(job.progress_callback(frame['downloaded'], frame['total']))
+            return
+
+        worker.jobs.pop(job.id)
+        self.completed += 1
+        if not job.future.done():
+            if kind == 'result':
+                job.future.set_result(frame['value'])
+            elif frame.get('cancelled'):
+                job.future.set_exception(JobCancelled(frame['error']))
+            else:
+                job.future.set_exception(JobFailed(frame['error']))
+        self._dispatch()
+
+    def _drop(self, worker: WorkerConnection):
+        """Forget a worker and retry the jobs it was running"""
+        if worker not in self.workers:
+            return
+        self.workers.remove(worker)
+        worker.writer.close()
+
+        for job in worker.jobs.values():
+            if job.future.done():
+                continue
+            if job.attempts > Config.JOB_RETRIES:
+                job.future.set_exception(JobFailed(f"Worker lost {job.attempts} times"))
+            else:
+                self.retried += 1
+                self._enqueue(job, retry=True)
+        worker.jobs.clear()
+        self._dispatch()
+
+    async def _check_health(self):
+        """Ping workers and drop the ones that stopped answering"""
+        while True:
+            await asyncio.sleep(Config.BROKER_PING_INTERVAL)
+            deadline = time.monotonic() - Config.BROKER_PING_INTERVAL * 3
+            for worker in list(self.workers):
+                if worker.last_seen < deadline:
+                    logger.warning(f"Worker {worker.pid} stopped responding")
+                    self._drop(worker)
+                else:
+                    await self._send(worker, {'type': 'ping'})
+
+    async def _supervise(self, index: int):
+        """Keep a local worker process running"""
+        script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "worker.py")
+        while True:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, script, "--socket", self.socket_path
+            )
+            self._processes.append(process)
+            code = await process.wait()
+            self._processes.remove(process)
+            logger.warning(f"Worker process {index} exited with code {code}, restarting")
+            await asyncio.sleep(1)
+
+    def stats(self) -> Dict:
+        """Get broker gauges"""
+        running = sum(len(w.jobs) for w in self.workers)
+        return {
+            'name': self.name,
+            'workers': len(self.workers),
+            'queued': len(self.pending),
+            'running': running,
+            'completed': self.completed,
+            'retried': self.retried,
+            'avg_wait': self.total_wait / self.completed if self.completed else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+    def shutdown(self):
+        """Stop listening and stop local workers"""
+        for task in self._tasks:
+            task.cancel()
+        for process in self._processes:
+            if process.returncode is None:
+                process.terminate()
+        if self._server:
+            self._server.close()
+            self._server = None
+        for job in self.pending:
+            job.deadline.cancel()
+            job.future.cancel()
+        self.pending.clear()
+        for task in self._sends:
+            task.cancel()
+
+# Used instead of the local pools when YTDL_BACKEND is "broker"
+broker = Broker("broker")
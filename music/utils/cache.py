@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from utils.executors import info_pool
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Files yt-dlp leaves behind while a download is still running
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp', '.tmp')
+
+class MediaCache:
+    """Disk cache for downloaded media with LRU eviction under a byte budget"""
+
+    def __init__(self, directory: str = Config.DOWNLOAD_DIR, max_bytes: int = Config.MEDIA_CACHE_SIZE):
+        self.directory = directory
+        # Downloads in progress, moved into the directory once complete
+        self.partial_directory = os.path.join(directory, ".partial")
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self.pinned: Dict[str, int] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(source: str, video_id: str, fmt: str) -> str:
+        """Build cache key from source, video id and format"""
+        key = f"{source}-{video_id}-{fmt}"
+        for char in '<>:"/\\|?* ':
+            key = key.replace(char, '_')
+        return key
+
+    @staticmethod
+    def key_for_path(filepath: str) -> str:
+        """Get cache key from a cached file path"""
+        return os.path.splitext(os.path.basename(filepath))[0]
+
+    def load(self):
+        """Rebuild the index from the download directory"""
+        self.entries.clear()
+        self.size = 0
+
+        if not os.path.isdir(self.directory):
+            return
+
+        # Downloads interrupted by the last shutdown
+        if os.path.isdir(self.partial_directory):
+            for name in os.listdir(self.partial_directory):
+                try:
+                    os.remove(os.path.join(self.partial_directory, name))
+                except OSError:
+                    pass
+
+        files = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name.endswith(PARTIAL_SUFFIXES):
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_atime, entry.path, stat.st_size))
+
+        # Oldest access first so the most recently used files end up at the tail
+        for _, path, size in sorted(files):
+            self.entries[self.key_for_path(path)] = (path, size)
+            self.size += size
+
+        logger.info(f"Media cache loaded: {len(self.entries)} files, {self.size // (1024**2)} MB")
+        self.evict()
+
+    def get(self, key: str) -> Optional[str]:
+        """Get cached file path for key"""
+        entry = self.entries.get(key)
+        if entry and os.path.exists(entry[0]):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        if entry:
+            # File was removed behind our back
+            self._drop(key)
+
+        self.misses += 1
+        return None
+
+    def contains(self, key: str) -> bool:
+        """Check if key is cached without counting a lookup"""
+        entry = self.entries.get(key)
+        return entry is not None and os.path.exists(entry[0])
+
+    def put(self, key: str, filepath: str) -> str:
+        """Register a downloaded file in the cache"""
+        if key in self.entries:
+            self._drop(key)
+
+        size = os.path.getsize(filepath)
+        self.entries[key] = (filepath, size)
+        self.size += size
+        self.evict()
+        return filepath
+
+    def pin(self, filepath: str):
+        """Protect file from eviction while it is playing"""
+        key = self.key_for_path(filepath)
+        self.pinned[key] = self.pinned.get(key, 0) + 1
+
+    def unpin(self, filepath: str):
+        """Release a file pinned with pin()"""
+        key = self.key_for_path(filepath)
+        count = self.pinned.get(key, 0) - 1
+        if count > 0:
+            self.pinned[key] = count
+        else:
+            self.pinned.pop(key, None)
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used files until the cache fits its budget"""
+        if self.size <= self.max_bytes:
+            return
+
+        for key in list(self.entries):
+            if self.size <= self.max_bytes:
+                break
+            if key in self.pinned:
+                continue
+
+            path, _ = self.entries[key]
+            self._drop(key)
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self) -> Tuple[int, int]:
+        """Remove all unpinned files, returns (files removed, bytes freed)"""
+        removed = 0
+        freed = 0
+        for key in list(self.entries):
+            if key in self.pinned:
+                continue
+
+            path, size = self.entries[key]
+            self._drop(key)
+            try:
+                os.remove(path)
+                removed += 1
+                freed += size
+            except OSError:
+                pass
+        return removed, freed
+
+    def stats(self) -> Dict:
+        """Get cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'files': len(self.entries),
+            'size': self.size,
+            'max_size': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+    def _drop(self, key: str):
+        """Remove key from the index"""
+        _, size = self.entries.pop(key)
+        self.size -= size
+
+class InfoCache:
+    """Metadata cache with an in-memory LRU tier in front of SQLite"""
+
+    def __init__(self, db_path: str = Config.INFO_CACHE_DB, max_entries: int = Config.INFO_CACHE_ENTRIES,
+                 max_rows: int = Config.INFO_CACHE_ROWS, ttl: int = Config.INFO_CACHE_TTL):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.memory: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._db = None
+        self._lock = threading.Lock()
+        # Writes in flight, kept so they are not garbage collected
+        self._writes: Set[asyncio.Task] = set()
+
+    async def get(self, key: str) -> Optional[Dict]:
+        """Get cached info for key"""
+        entry = self.memory.get(key)
+        if entry:
+            if time.time() - entry[0] < self.ttl:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            del self.memory[key]
+
+        entry = await info_pool.run(self._db_get, key)
+        if entry and time.time() - entry[0] < self.ttl:
+            self._remember(key, entry[0], entry[1])
+            self.disk_hits += 1
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, info: Dict):
+        """Store info in memory now and in SQLite in the background"""
+        created = time.time()
+        self._remember(key, created, info)
+
+        task = asyncio.get_running_loop().create_task(info_pool.run(self._db_put, key, created, info))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def stats(self) -> Dict:
+        """Get cache statistics"""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            'entries': len(self.memory),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+        }
+
+    def _remember(self, key: str, created: float, info: Dict):
+        """Add entry to the memory tier"""
+        self.memory[key] = (created, info)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the SQLite database on first use"""
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, created REAL, data TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS info_created ON info (created)")
+        return self._db
+
+    def _db_get(self, key: str) -> Optional[Tuple[float, Dict]]:
+        """Read entry from SQLite"""
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT created, data FROM info WHERE key = ?", (key,)
+                ).fetchone()
+            return (row[0], json.loads(row[1])) if row else None
+        except Exception as e:
+            logger.error(f"Info cache read error: {e}")
+            return None
+
+    def _db_put(self, key: str, created: float, info: Dict):
+        """Write entry to SQLite, pruning expired and excess rows now and then"""
+        try:
+            with self._lock:
+                db = self._connect()
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO info (key, created, data) VALUES (?, ?, ?)",
+                        (key, created, json.dumps(info))
+                    )
+                    self.writes += 1
+                    if self.writes % 100 == 0:
+                        db.execute("DELETE FROM info WHERE created < ?", (created - self.ttl,))
+                        db.execute(
+                            "DELETE FROM info WHERE key NOT IN "
+                            "(SELECT key FROM info ORDER BY created DESC LIMIT ?)",
+                            (self.max_rows,)
+                        )
+        except Exception as e:
+            logger.error(f"Info cache write error: {e}")
+
+class FetchAbandoned(Exception):
+    """Raised to callers sharing a fetch whose own caller was cancelled"""
+
+class SearchCache:
+    """Short-lived search result cache that shares in-flight searches"""
+
+    def __init__(self, ttl: int = Config.SEARCH_CACHE_TTL, negative_ttl: int = Config.SEARCH_NEGATIVE_TTL,
+                 max_entries: int = Config.SEARCH_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.results: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def normalize(query: str, limit: int) -> str:
+        """Build cache key from query and result limit"""
+        return f"{' '.join(query.lower().split())}|{limit}"
+
+    async def get_or_fetch(self, query: str, limit: int, fetch: Callable[[], Awaitable[List[Dict]]]) -> List[Dict]:
+        """Get cached results, or run fetch once for all concurrent callers"""
+        key = self.normalize(query, limit)
+
+        while True:
+            entry = self.results.get(key)
+            if entry:
+                if entry[0] > time.time():
+                    self.results.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.results[key]
+
+            pending = self.inflight.get(key)
+            if not pending:
+                break
+
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except FetchAbandoned:
+                # The caller that ran the search was cancelled, the next one in line runs it
+                continue
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            results = await fetch()
+            # Empty results are kept for a shorter time so typos don't hit the backend repeatedly
+            ttl = self.ttl if results else self.negative_ttl
+            self.results[key] = (time.time() + ttl, results)
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+            future.set_result(results)
+            return results
+        except asyncio.CancelledError:
+            # Cancelling the future would cancel every waiting caller along with this one
+            future.set_exception(FetchAbandoned())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self.inflight[key]
+
+    def stats(self) -> Dict:
+        """Get cache statistics"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'entries': len(self.results),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_ratio': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+# Global cache instances
+media_cache = MediaCache()
+info_cache = InfoCache()
+search_cache = SearchCache()
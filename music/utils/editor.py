@@ -0,0 +1,114 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from pyrogram.types import Message, InlineKeyboardMarkup
+from pyrogram.errors import FloodWait, MessageNotModified, RPCError
+from utils.metrics import telegram_error
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class EditScheduler:
+    """Coalesces message edits and flushes them under per-chat and global rate budgets"""
+
+    def __init__(self, chat_interval: float = Config.EDIT_CHAT_INTERVAL, rate: float = Config.EDIT_RATE):
+        self.chat_interval = chat_interval
+        self.interval = 1 / rate
+        # Latest pending edit per message, oldest message first
+        self.pending: "OrderedDict[Tuple[int, int], Tuple[Message, str, Optional[InlineKeyboardMarkup]]]" = OrderedDict()
+        self.chat_ready: Dict[int, float] = {}
+        # Edit being sent per message, the next one for it waits for it
+        self.sending: Dict[Tuple[int, int], asyncio.Task] = {}
+        self.next_edit = 0.0
+        self.edits = 0
+        self.coalesced = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def edit(self, message: Message, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        """Schedule an edit, replacing any edit of the same message not sent yet"""
+        key = (message.chat.id, message.id)
+        if key in self.pending:
+            self.coalesced += 1
+        self.pending[key] = (message, text, reply_markup)
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self._flush())
+        self._wakeup.set()
+
+    async def _flush(self):
+        """Send pending edits as the budgets allow"""
+        while True:
+            if not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            if now < self.next_edit:
+                await asyncio.sleep(self.next_edit - now)
+                continue
+
+            waiting = [k for k in self.pending if k not in self.sending]
+            if not waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Oldest pending message whose chat is within its budget
+            key = next((k for k in waiting if self.chat_ready.get(k[0], 0) <= now), None)
+            if key is None:
+                wait = min(self.chat_ready[k[0]] for k in waiting) - now
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            message, text, reply_markup = self.pending.pop(key)
+            self.chat_ready[key[0]] = now + self.chat_interval
+            self.next_edit = now + self.interval
+            self.sending[key] = asyncio.create_task(self._apply(key, message, text, reply_markup))
+
+            # Forget budgets that ran out long ago
+            if len(self.chat_ready) > 1000:
+                self.chat_ready = {c: t for c, t in self.chat_ready.items() if t > now}
+
+    async def _apply(self, key: Tuple[int, int], message: Message, text: str,
+                     reply_markup: Optional[InlineKeyboardMarkup]):
+        """Send one edit"""
+        try:
+            await message.edit_text(text, reply_markup=reply_markup)
+            self.edits += 1
+        except MessageNotModified:
+            pass
+        except FloodWait as e:
+            telegram_error(e)
+            logger.warning(f"Edit FloodWait in {key[0]}: {e.value}s")
+            self.chat_ready[key[0]] = time.monotonic() + e.value
+            # Retry unless a newer text came in meanwhile
+            if key not in self.pending:
+                self.edit(message, text, reply_markup)
+        except RPCError as e:
+            telegram_error(e)
+            logger.debug(f"Edit failed in {key[0]}: {e}")
+        except Exception as e:
+            logger.debug(f"Edit failed in {key[0]}: {e}")
+        finally:
+            del self.sending[key]
+            self._wakeup.set()
+
+    def stats(self) -> Dict:
+        """Get scheduler statistics"""
+        return {
+            'pending': len(self.pending),
+            'edits': self.edits,
+            'coalesced': self.coalesced,
+        }
+
+# Global edit scheduler
+editor = EditScheduler()
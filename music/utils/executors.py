@@ -0,0 +1,206 @@
+import time
+import asyncio
+import itertools
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+from utils import ytworker
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def dispatch_progress(progress_callback: Callable, downloaded: int, total: int):
+    """Call progress callback on the event loop, scheduled from worker threads"""
+    asyncio.ensure_future(progress_callback(downloaded, total))
+
+class WorkloadPool:
+    """Bounded thread pool for one kind of blocking work"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    async def run(self, func: Callable, *args):
+        """Run func(*args) in the pool and wait for the result"""
+        submitted = time.monotonic()
+        with self._lock:
+            self.queued += 1
+
+        def call():
+            waited = time.monotonic() - submitted
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        future = self.executor.submit(call)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        """Account for jobs cancelled before they started"""
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def stats(self) -> Dict:
+        """Get pool gauges"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'workers': self.max_workers,
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'avg_wait': self.total_wait / self.completed if self.completed else 0.0,
+                'max_wait': self.max_wait,
+            }
+
+    def shutdown(self):
+        """Stop accepting work and drop queued jobs"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class ProcessPool:
+    """Pool of warm worker processes for CPU-heavy yt-dlp jobs"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.inflight = 0
+        self.completed = 0
+        self.total_time = 0.0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.jobs: Dict[int, tuple] = {}
+        self._job_ids = itertools.count(1)
+        self._progress_queue = None
+        self._cancelled = None
+        self._reader = None
+
+    def start(self, profiles: Dict[str, Dict]):
+        """Start worker processes and the progress reader"""
+        # Forking a process that runs an event loop and threads is unsafe
+        ctx = multiprocessing.get_context("spawn")
+        self._progress_queue = ctx.Queue()
+        self._cancelled = ctx.Array('q', ytworker.CANCEL_SLOTS)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=ctx,
+            initializer=ytworker.init_worker,
+            initargs=(self._progress_queue, self._cancelled, profiles)
+        )
+
+        # Spawn every worker now rather than on the first requests
+        for _ in range(self.max_workers):
+            self.executor.submit(ytworker.warm_up)
+
+        self._reader = threading.Thread(target=self._read_progress, name=f"{self.name}-progress", daemon=True)
+        self._reader.start()
+        logger.info(f"✓ Started {self.max_workers} {self.name} worker processes")
+
+    async def run(self, func: Callable, *args):
+        """Run func(*args) in a worker process"""
+        self.inflight += 1
+        submitted = time.monotonic()
+        try:
+            started, result = await asyncio.wrap_future(self.executor.submit(ytworker.timed_call, func, *args))
+            waited = max(0.0, started - submitted)
+            self.started += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            return result
+        finally:
+            self.inflight -= 1
+            self.completed += 1
+            self.total_time += time.monotonic() - submitted
+
+    async def run_job(self, func: Callable, *args, progress_callback=None, cancel_event=None):
+        """Run func(job_id, *args) in a worker process with progress forwarding"""
+        job_id = next(self._job_ids)
+        self.jobs[job_id] = (asyncio.get_running_loop(), progress_callback, cancel_event)
+        try:
+            return await self.run(func, job_id, *args)
+        finally:
+            del self.jobs[job_id]
+
+    def _read_progress(self):
+        """Forward progress events from workers to the event loop"""
+        while True:
+            item = self._progress_queue.get()
+            if item is None:
+                return
+
+            job_id, downloaded, total = item
+            job = self.jobs.get(job_id)
+            if not job:
+                continue
+
+            loop, progress_callback, cancel_event = job
+            if cancel_event and cancel_event.is_set():
+                # Worker checks this slot on its next progress tick
+                self._cancelled[job_id % ytworker.CANCEL_SLOTS] = job_id
+            elif progress_callback:
+                loop.call_soon_threadsafe(dispatch_progress, progress_callback, downloaded, total)
+
+    def stats(self) -> Dict:
+        """Get pool gauges"""
+        return {
+            'name': self.name,
+            'workers': self.max_workers,
+            'queued': max(0, self.inflight - self.max_workers),
+            'running': min(self.inflight, self.max_workers),
+            'completed': self.completed,
+            # Start times come back with results, so failed jobs are not included
+            'avg_wait': self.total_wait / self.started if self.started else 0.0,
+            'max_wait': self.max_wait,
+            'avg_time': self.total_time / self.completed if self.completed else 0.0,
+        }
+
+    def shutdown(self):
+        """Stop worker processes"""
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self._progress_queue.put(None)
+            self.executor = None
+
+# Global pools, sized so slow downloads can't starve interactive lookups
+info_pool = WorkloadPool("info", Config.INFO_WORKERS)
+registry_pool = WorkloadPool("registry", Config.REGISTRY_WORKERS)
+fanout_pool = WorkloadPool("fanout", Config.FANOUT_WORKERS)
+# One thread, so trace file appends and rotation never overlap
+trace_pool = WorkloadPool("trace", 1)
+search_pool = WorkloadPool("search", Config.SEARCH_WORKERS)
+extract_pool = WorkloadPool("extract", Config.EXTRACT_WORKERS)
+download_pool = WorkloadPool("download", Config.DOWNLOAD_WORKERS)
+
+# Used instead of the extract and download pools when YTDL_BACKEND is "process"
+process_pool = ProcessPool("ytdl", Config.PROCESS_WORKERS)
+
+def get_pools() -> Dict[str, WorkloadPool]:
+    """Get all workload pools by name"""
+    pools = [info_pool, registry_pool, fanout_pool, trace_pool, search_pool, extract_pool, download_pool]
+    if Config.YTDL_BACKEND == "process":
+        pools.append(process_pool)
+    elif Config.YTDL_BACKEND == "broker":
+        # Imported here, the broker module is only needed in this mode
+        from utils.broker import broker
+        pools.append(broker)
+    return {pool.name: pool for pool in pools}
@@ -0,0 +1,130 @@
+"""
+Shared decoding for chats that play the same track.
+
+A file passed to MediaStream gets an ffmpeg decode of its own in every
+chat that plays it. With DECODE_FANOUT on, a track without a PCM copy is
+transcoded once (see utils.transcode) and each chat plays a pipe of its
+own, fed from the growing PCM file at the chat's own offset. The decode
+cost follows unique tracks instead of playing chats, the feeds all read
+the same pages of the OS page cache, and the finished file stays in the
+media cache for later plays.
+"""
+
+import os
+import asyncio
+import itertools
+import logging
+from typing import Dict, Optional
+from utils.transcode import transcoder
+from utils.tasks import playback_tasks
+from utils.executors import fanout_pool
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the PCM file at a time, about 5 seconds of audio
+READ_SIZE = 1024 * 1024
+
+# Seconds a feed waits after catching up with the decode
+CATCH_UP_DELAY = 0.05
+
+class FanOut:
+    """Feeds per-chat pipes from shared transcodes"""
+
+    def __init__(self, directory: str = Config.FANOUT_DIR):
+        self.directory = directory
+        self.feeds = 0
+        self.shared = 0
+        self._ids = itertools.count(1)
+
+    def open(self, chat_id: int, filepath: str) -> Optional[str]:
+        """Start feeding a chat from the shared decode of a cached file, returns the pipe to play"""
+        running = transcoder.running(filepath)
+        if running:
+            self.shared += 1
+        else:
+            transcoder.submit(filepath, urgent=True)
+            running = transcoder.running(filepath)
+        if not running:
+            return None
+
+        partial, transcode = running
+        try:
+            source = os.open(partial, os.O_RDONLY)
+        except OSError:
+            # Finished and moved into the cache in the meantime
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{chat_id}-{next(self._ids)}.fifo")
+        os.mkfifo(path)
+        # Opened for reading too, so neither end waits for the other to be opened
+        pipe = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+        # Replaced by the next track and cancelled with the other playback tasks
+        playback_tasks.start(chat_id, "fanout", self._feed(source, pipe, path, transcode))
+        return path
+
+    async def _feed(self, source: int, pipe: int, path: str, transcode: asyncio.Task):
+        """Copy the PCM file into one pipe as fast as the call reads it"""
+        self.feeds += 1
+        offset = 0
+        reading = None
+        try:
+            while True:
+                # Checked first so data written just before the end is not missed
+                finished = transcode.done()
+                # Reads can block on a busy disk, so they run in a worker thread
+                reading = asyncio.ensure_future(fanout_pool.run(os.pread, source, READ_SIZE, offset))
+                data = await asyncio.shield(reading)
+                if not data:
+                    if finished:
+                        break
+                    await asyncio.sleep(CATCH_UP_DELAY)
+                    continue
+
+                offset += len(data)
+                await self._write(pipe, data)
+        finally:
+            self.feeds -= 1
+            if reading and not reading.done():
+                # Cancelled mid-read, the descriptor stays open until the thread is done with it
+                reading.add_done_callback(lambda _: os.close(source))
+            else:
+                os.close(source)
+            # The call reads what is left in the pipe, then sees the end of the stream
+            os.close(pipe)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def _write(self, pipe: int, data: bytes):
+        """Write all of data to a non-blocking pipe"""
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(pipe, view):]
+            except BlockingIOError:
+                await self._writable(pipe)
+
+    @staticmethod
+    async def _writable(fd: int):
+        """Wait until a pipe has room"""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_writer(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_writer(fd)
+
+    def stats(self) -> Dict:
+        """Get feed counters"""
+        return {
+            'feeds': self.feeds,
+            'shared': self.shared,
+        }
+
+# Global fan-out instance
+fanout = FanOut()
@@ -4,7 +4,12 @@ import asyncio
 import aiohttp
 import aiofiles
 from typing import Union, Optional
+from pyrogram import Client
 from pyrogram.types import Message
+from pyrogram.errors import RPCError
+from utils.admins import admin_cache, ADMIN_STATUSES
+from utils.editor import editor
+from utils.metrics import telegram_error
 from config import Config
 
 def setup_logging():
@@ -20,35 +25,49 @@ def setup_logging():
 
 def create_directories():
     """Create required directories"""
-    directories = ['downloads', 'cache', 'logs', 'temp']
+    directories = [Config.DOWNLOAD_DIR, 'cache', 'logs', 'temp']
     for directory in directories:
         os.makedirs(directory, exist_ok=True)
 
+# Bot admins: owner and sudo users
+BOT_ADMINS = set(Config.SUDO_USERS) | ({Config.OWNER_ID} if Config.OWNER_ID else set())
+
 def is_admin(message: Message) -> bool:
     """Check if user is admin"""
-    user_id = message.from_user.id
-    
-    # Owner is always admin
-    if Config.OWNER_ID and user_id == Config.OWNER_ID:
-        return True
-    
-    # Sudo users are admins
-    if user_id in Config.SUDO_USERS:
-        return True
-    
-    return False
+    return message.from_user.id in BOT_ADMINS
 
 async def is_group_admin(message: Message, user_id: int = None) -> bool:
     """Check if user is group admin"""
     if not user_id:
         user_id = message.from_user.id
     
+    admins = await admin_cache.get(message._client, message.chat.id)
+    if admins is not None:
+        return user_id in admins
+    
+    # Admin list is not available, ask about this user only
     try:
         chat_member = await message.chat.get_member(user_id)
-        return chat_member.status in ["administrator", "creator"]
+        return chat_member.status in ADMIN_STATUSES
     except:
         return False
 
+async def reply(message: Message, text: str, **kwargs) -> Message:
+    """Reply to a message, counting Telegram errors"""
+    try:
+        return await message.reply_text(text, **kwargs)
+    except RPCError as e:
+        telegram_error(e)
+        raise
+
+async def send(client: Client, chat_id: int, text: str, **kwargs) -> Message:
+    """Send a message to a chat, counting Telegram errors"""
+    try:
+        return await client.send_message(chat_id, text, **kwargs)
+    except RPCError as e:
+        telegram_error(e)
+        raise
+
 def format_duration(seconds: int) -> str:
     """Format duration from seconds to MM:SS or HH:MM:SS"""
     if seconds < 3600:
@@ -69,20 +88,119 @@ def format_bytes(bytes_size: int) -> str:
         bytes_size /= 1024.0
     return f"{bytes_size:.1f} TB"
 
-async def download_file(url: str, filename: str) -> bool:
-    """Download file from URL"""
+# Shared HTTP session, created on first use
+_http_session: Optional[aiohttp.ClientSession] = None
+
+# Read size for HTTP downloads, and the smallest file worth splitting into ranges
+CHUNK_SIZE = 256 * 1024
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Get the process-wide pooled HTTP session"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=Config.HTTP_POOL_SIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=60)
+        )
+    return _http_session
+
+async def close_http_session():
+    """Close the shared HTTP session"""
+    global _http_session
+    if _http_session and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+async def download_file(url: str, filename: str, segments: int = None) -> bool:
+    """Download file from URL, using parallel range requests when the server allows it"""
+    if segments is None:
+        segments = Config.DOWNLOAD_SEGMENTS
+    
+    temp_file = f"{filename}.part"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    async with aiofiles.open(filename, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            await f.write(chunk)
-                    return True
-        return False
+        session = get_http_session()
+        
+        size = 0
+        if segments > 1:
+            try:
+                async with session.head(url, allow_redirects=True) as response:
+                    if response.status == 200 and response.headers.get('Accept-Ranges') == 'bytes':
+                        size = int(response.headers.get('Content-Length', 0))
+            except aiohttp.ClientError:
+                pass
+        
+        done = False
+        if size >= MIN_SEGMENT_SIZE:
+            done = await _download_segmented(session, url, temp_file, size, segments)
+        if not done:
+            done = await _download_single(session, url, temp_file)
+        
+        if done:
+            os.replace(temp_file, filename)
+        return done
     except Exception as e:
         logging.error(f"Download error: {e}")
         return False
+    finally:
+        cleanup_file(temp_file)
+
+async def _download_single(session: aiohttp.ClientSession, url: str, filename: str) -> bool:
+    """Download file over a single connection"""
+    async with session.get(url) as response:
+        if response.status != 200:
+            return False
+        received = 0
+        async with aiofiles.open(filename, 'wb') as f:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                received += len(chunk)
+                await f.write(chunk)
+        
+        # Content-Length counts encoded bytes, which only match when the body is not compressed
+        expected = response.content_length
+        if expected is not None and 'Content-Encoding' not in response.headers and received != expected:
+            logging.warning(f"Download ended after {received} of {expected} bytes: {url}")
+            return False
+    return True
+
+async def _download_segmented(session: aiohttp.ClientSession, url: str, filename: str,
+                              size: int, segments: int) -> bool:
+    """Download file as parallel byte ranges into a preallocated file"""
+    async with aiofiles.open(filename, 'wb') as f:
+        await f.truncate(size)
+    
+    segment_size = -(-size // segments)
+    
+    async def fetch(start: int, end: int) -> bool:
+        headers = {'Range': f'bytes={start}-{end}'}
+        async with session.get(url, headers=headers) as response:
+            # A 200 here means the range was ignored
+            if response.status != 206:
+                return False
+            if not response.headers.get('Content-Range', '').startswith(f"bytes {start}-{end}/"):
+                return False
+            
+            expected = end - start + 1
+            received = 0
+            async with aiofiles.open(filename, 'r+b') as f:
+                await f.seek(start)
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > expected:
+                        return False
+                    await f.write(chunk)
+        # A short body would leave a zero-filled hole in the preallocated file
+        return received == expected
+    
+    results = await asyncio.gather(
+        *(fetch(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)),
+        return_exceptions=True
+    )
+    if all(result is True for result in results):
+        return True
+    
+    logging.warning(f"Range download failed, retrying as single stream: {url}")
+    return False
 
 def clean_filename(filename: str) -> str:
     """Clean filename for filesystem"""
@@ -125,24 +243,13 @@ class Progress:
     def __init__(self, message: Message, action: str = "Downloading"):
         self.message = message
         self.action = action
-        self.last_update = 0
     
     async def update(self, current: int, total: int):
-        """Update progress"""
-        import time
-        
-        now = time.time()
-        if now - self.last_update < 2:  # Update every 2 seconds
-            return
-        
-        self.last_update = now
+        """Update progress, the edit scheduler keeps only the latest value"""
         percentage = (current / total) * 100
-        
-        try:
-            await self.message.edit_text(
-                f"**{self.action}...**\n\n"
-                f"**Progress:** {percentage:.1f}%\n"
-                f"**Size:** {format_bytes(current)} / {format_bytes(total)}"
-            )
-        except:
-            pass
\ No newline at end of file
+        editor.edit(
+            self.message,
+            f"**{self.action}...**\n\n"
+            f"**Progress:** {percentage:.1f}%\n"
+            f"**Size:** {format_bytes(current)} / {format_bytes(total)}"
+        )
@@ -0,0 +1,211 @@
+"""
+Prometheus-style metrics and health probes.
+
+Counters and histograms are updated where things happen, and component
+gauges are read from the stats() counters the components already keep,
+so a scrape never walks per-chat state. With METRICS_PORT set, they are
+served over local HTTP:
+
+    /metrics   text exposition format
+    /healthz   liveness, the event loop is answering
+    /readyz    readiness, every registered check passes
+"""
+
+import time
+import bisect
+import logging
+import functools
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from aiohttp import web
+from pyrogram.errors import FloodWait
+from utils.tracing import tracer
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    """Format a label set"""
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        """Increase the counter of a label set"""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        """Format the counter"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+class Histogram:
+    """Latency histogram with fixed buckets and optional labels"""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = buckets
+        # Per label set: counts per bucket (last is +Inf), sum
+        self.values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels):
+        """Record one observation"""
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def render(self) -> List[str]:
+        """Format the histogram with cumulative buckets"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket_labels = _labels(self.label_names + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {total[0]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class Metrics:
+    """Metric registry with gauge collectors and readiness checks"""
+
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, Dict, float]]]] = []
+        self.checks: Dict[str, Callable[[], bool]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        """Create and register a counter"""
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Histogram:
+        """Create and register a histogram"""
+        metric = Histogram(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable[[], Iterable[Tuple[str, str, Dict, float]]]):
+        """Register a function yielding (name, type, labels, value) samples at scrape time"""
+        self.collectors.append(func)
+        return func
+
+    def check(self, name: str, func: Callable[[], bool]):
+        """Register a readiness check"""
+        self.checks[name] = func
+
+    def render(self) -> str:
+        """Format all metrics in the text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        typed = set()
+        for collect in self.collectors:
+            try:
+                for name, kind, labels, value in collect():
+                    if name not in typed:
+                        typed.add(name)
+                        lines.append(f"# TYPE {name} {kind}")
+                    lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+            except Exception as e:
+                logger.debug(f"Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+    def readiness(self) -> Dict[str, bool]:
+        """Run readiness checks"""
+        results = {}
+        for name, func in self.checks.items():
+            try:
+                results[name] = bool(func())
+            except Exception:
+                results[name] = False
+        return results
+
+    async def start(self, host: str = Config.METRICS_HOST, port: int = Config.METRICS_PORT):
+        """Serve metrics and probes over HTTP, disabled when port is 0"""
+        if not port:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+        app.router.add_get("/healthz", self._healthz)
+        app.router.add_get("/readyz", self._readyz)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"✓ Metrics listening on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        """Stop the HTTP endpoint"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def _healthz(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def _readyz(self, request: web.Request) -> web.Response:
+        results = self.readiness()
+        body = "".join(f"{name}: {'ok' if ok else 'failing'}\n" for name, ok in results.items())
+        return web.Response(text=body or "ok\n", status=200 if all(results.values()) else 503)
+
+# Global metrics registry
+metrics = Metrics()
+
+STAGE_SECONDS = metrics.histogram("music_stage_seconds", "Time spent per pipeline stage", ["stage"])
+STAGE_ERRORS = metrics.counter("music_stage_errors_total", "Failed pipeline stage runs", ["stage"])
+TELEGRAM_ERRORS = metrics.counter("music_telegram_errors_total", "Telegram API errors", ["error"])
+FLOOD_WAIT_SECONDS = metrics.counter("music_flood_wait_seconds_total", "Seconds Telegram asked to wait")
+
+def timed(stage: str):
+    """Record latency and failures of an async pipeline stage, also as a span of the current trace"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            started = time.time()
+            error = None
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                error = type(e).__name__
+                STAGE_ERRORS.inc(stage)
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                STAGE_SECONDS.observe(duration, stage)
+                tracer.record(stage, started, duration, error)
+        return wrapper
+    return decorator
+
+def telegram_error(error: Exception):
+    """Count a Telegram API error"""
+    TELEGRAM_ERRORS.inc(type(error).__name__)
+    if isinstance(error, FloodWait):
+        FLOOD_WAIT_SECONDS.inc(amount=error.value)
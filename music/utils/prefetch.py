@@ -0,0 +1,94 @@
+import os
+import asyncio
+import threading
+import logging
+from typing import Dict, Optional, Tuple
+from utils.queue import MusicQueue, Track, MediaType
+from utils.yt import downloader
+from utils.broker import WorkersUnavailable
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class Prefetcher:
+    """Downloads the next tracks of a queue in the background"""
+
+    def __init__(self, queue: MusicQueue, depth: int = Config.PREFETCH_DEPTH):
+        self.queue = queue
+        self.depth = depth
+        # Keyed by id(track), the entry keeps the track alive so ids stay unique
+        self.tasks: Dict[int, Tuple[Track, asyncio.Task, threading.Event]] = {}
+
+    def refresh(self):
+        """Start downloads for upcoming tracks and cancel the ones no longer queued"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        upcoming = {id(track): track for track in self.queue.upcoming(self.depth)}
+
+        for key, (track, _, _) in list(self.tasks.items()):
+            if key not in upcoming and track is not self.queue.current:
+                self.cancel(track)
+
+        for key, track in upcoming.items():
+            if key in self.tasks or (track.filepath and os.path.exists(track.filepath)):
+                continue
+            self._start(track)
+
+    def ready(self, track: Track) -> Optional[str]:
+        """Get file path if the track has already been downloaded"""
+        if track.filepath and os.path.exists(track.filepath):
+            return track.filepath
+        return None
+
+    async def fetch(self, track: Track) -> Optional[str]:
+        """Wait for a pending prefetch of the track, if any"""
+        entry = self.tasks.pop(id(track), None)
+        if not entry:
+            return self.ready(track)
+
+        try:
+            return await entry[1]
+        except asyncio.CancelledError:
+            return None
+
+    def cancel(self, track: Track):
+        """Cancel the prefetch of a track"""
+        entry = self.tasks.pop(id(track), None)
+        if entry:
+            _, task, cancel_event = entry
+            # The download thread checks this on its next progress tick
+            cancel_event.set()
+            if not task.done():
+                logger.debug(f"Cancelled prefetch: {track.title}")
+
+    def cancel_all(self):
+        """Cancel every pending prefetch"""
+        for track, _, _ in list(self.tasks.values()):
+            if track is not self.queue.current:
+                self.cancel(track)
+
+    def _start(self, track: Track):
+        """Start background download of a track"""
+        cancel_event = threading.Event()
+        task = asyncio.create_task(self._download(track, cancel_event))
+        self.tasks[id(track)] = (track, task, cancel_event)
+
+    async def _download(self, track: Track, cancel_event: threading.Event) -> Optional[str]:
+        """Download a track and remember its file"""
+        try:
+            if track.media_type == MediaType.VIDEO:
+                filepath = await downloader.download_video(track.url, cancel_event=cancel_event)
+            else:
+                filepath = await downloader.download_audio(track.url, cancel_event=cancel_event)
+        except WorkersUnavailable as e:
+            # Playback downloads the track itself and reports this
+            logger.warning(f"Prefetch of {track.title} skipped: {e}")
+            return None
+
+        if filepath and not cancel_event.is_set():
+            track.filepath = filepath
+            logger.info(f"Prefetched: {track.title}")
+        return filepath
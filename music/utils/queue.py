@@ -1,7 +1,13 @@
+import time
+import random
 import asyncio
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional
+from dataclasses import dataclass, asdict
 from enum import Enum
+from utils.store import queue_store
+from config import Config
 
 class MediaType(Enum):
     AUDIO = "audio"
@@ -20,32 +26,88 @@ class Track:
     requested_by: str = None
     user_id: int = None
     chat_id: int = None
+    
+    def to_dict(self) -> Dict:
+        """Convert to a document that can be stored"""
+        data = asdict(self)
+        data['media_type'] = self.media_type.value
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Track":
+        """Build track from a stored document"""
+        data = dict(data)
+        data['media_type'] = MediaType(data['media_type'])
+        return cls(**data)
+
+class QueueFull(Exception):
+    """Raised when a chat queue or all queues together are at their limit"""
 
 class MusicQueue:
     """Music queue manager for each chat"""
     
-    def __init__(self):
-        self.queue: List[Track] = []
+    # Tracks queued and chats playing across all chats
+    total_queued: int = 0
+    total_playing: int = 0
+    
+    def __init__(self, limit: Optional[int] = Config.QUEUE_LIMIT):
+        self.queue: Deque[Track] = deque()
+        self.limit = limit
         self.current: Optional[Track] = None
-        self.is_playing: bool = False
+        self._playing: bool = False
         self.is_paused: bool = False
         self.loop_mode: bool = False
         self.shuffle_mode: bool = False
         self.volume: int = 100
         self.position: int = 0
+        self.prefetcher = None
+        self.started_at: float = 0.0
+        self.paused_at: float = 0.0
+        self.paused_time: float = 0.0
+        self.chat_id: Optional[int] = None
+        self.store = None
         
+    @property
+    def is_playing(self) -> bool:
+        """Check if a track is playing"""
+        return self._playing
+    
+    @is_playing.setter
+    def is_playing(self, value: bool):
+        if value != self._playing:
+            MusicQueue.total_playing += 1 if value else -1
+            self._playing = value
+    
     def add(self, track: Track) -> int:
         """Add track to queue"""
+        self.check_room()
         self.queue.append(track)
+        self._resize(1)
+        self._changed()
         return len(self.queue)
     
+    def requeue(self, track: Track):
+        """Put a track back at the head of the queue, ignoring limits"""
+        self.queue.appendleft(track)
+        self._resize(1)
+        self._changed()
+    
+    def check_room(self, count: int = 1):
+        """Raise QueueFull if adding count tracks would exceed a limit"""
+        if self.limit is not None and len(self.queue) + count > self.limit:
+            raise QueueFull(f"Queue is full! Maximum {self.limit} tracks per chat.")
+        if MusicQueue.total_queued + count > Config.GLOBAL_QUEUE_LIMIT:
+            raise QueueFull("The bot is at capacity right now, try again later.")
+    
     def get_next(self) -> Optional[Track]:
         """Get next track"""
         if self.loop_mode and self.current:
             return self.current
         
         if self.queue:
-            return self.queue.pop(0)
+            self._resize(-1)
+            self.save()
+            return self.queue.popleft()
         return None
     
     def skip(self) -> Optional[Track]:
@@ -55,26 +117,126 @@ class MusicQueue:
     
     def clear(self):
         """Clear queue"""
+        self._resize(-len(self.queue))
         self.queue.clear()
         self.current = None
         self.is_playing = False
         self.is_paused = False
+        if self.prefetcher:
+            self.prefetcher.cancel_all()
+        self.save()
+    
+    def clear_tracks(self) -> int:
+        """Clear upcoming tracks, keeping the current one"""
+        count = len(self.queue)
+        self._resize(-count)
+        self.queue.clear()
+        self._changed()
+        return count
     
     def remove(self, index: int) -> bool:
         """Remove track by index"""
-        try:
-            if 0 <= index < len(self.queue):
-                self.queue.pop(index)
-                return True
-        except:
-            pass
+        if 0 <= index < len(self.queue):
+            del self.queue[index]
+            self._resize(-1)
+            self._changed()
+            return True
         return False
     
+    def move(self, source: int, target: int) -> bool:
+        """Move track from one index to another"""
+        if not (0 <= source < len(self.queue) and 0 <= target < len(self.queue)):
+            return False
+        
+        # Rotations take the shorter way round, so only the tracks between the
+        # ends and the two positions are walked, once each
+        self.queue.rotate(-source)
+        track = self.queue.popleft()
+        self.queue.rotate(source - target)
+        self.queue.appendleft(track)
+        self.queue.rotate(target)
+        self._changed()
+        return True
+    
     def shuffle(self):
         """Shuffle queue"""
-        import random
-        random.shuffle(self.queue)
+        # Indexing into the middle of a deque is O(n), shuffle a list instead
+        tracks = list(self.queue)
+        random.shuffle(tracks)
+        self.queue = deque(tracks)
         self.shuffle_mode = not self.shuffle_mode
+        self._changed()
+    
+    def mark_started(self):
+        """Start the play clock for the current track"""
+        self.started_at = time.monotonic()
+        self.paused_at = 0.0
+        self.paused_time = 0.0
+        self.is_paused = False
+    
+    def mark_paused(self):
+        """Stop the play clock"""
+        self.is_paused = True
+        self.paused_at = time.monotonic()
+    
+    def mark_resumed(self):
+        """Restart the play clock"""
+        if self.paused_at:
+            self.paused_time += time.monotonic() - self.paused_at
+            self.paused_at = 0.0
+        self.is_paused = False
+    
+    def elapsed(self) -> float:
+        """Get seconds the current track has been playing, excluding pauses"""
+        if not self.started_at:
+            return 0.0
+        now = self.paused_at or time.monotonic()
+        return now - self.started_at - self.paused_time
+    
+    def upcoming(self, count: int) -> List[Track]:
+        """Get the next tracks without removing them"""
+        return list(islice(self.queue, count))
+    
+    @staticmethod
+    def _resize(delta: int):
+        """Track the number of tracks queued across all chats"""
+        MusicQueue.total_queued += delta
+    
+    def save(self):
+        """Schedule a write-behind save of the queue state"""
+        if self.store and self.chat_id is not None:
+            self.store.mark_dirty(self.chat_id, self)
+    
+    def to_dict(self) -> Optional[Dict]:
+        """Get state to persist, None when there is nothing to keep"""
+        if not self.current and not self.queue:
+            return None
+        return {
+            'current': self.current.to_dict() if self.current else None,
+            'tracks': [track.to_dict() for track in self.queue],
+            'loop_mode': self.loop_mode,
+            'shuffle_mode': self.shuffle_mode,
+            'position': self.position,
+        }
+    
+    def restore(self, data: Dict):
+        """Load persisted state, queueing the interrupted track first"""
+        tracks = [Track.from_dict(track) for track in data.get('tracks', [])]
+        if data.get('current'):
+            # Playback did not survive the restart, start it over
+            tracks.insert(0, Track.from_dict(data['current']))
+        
+        self.queue.extend(tracks)
+        self._resize(len(tracks))
+        self.loop_mode = data.get('loop_mode', False)
+        self.shuffle_mode = data.get('shuffle_mode', False)
+        self.position = data.get('position', 0)
+    
+    def _changed(self):
+        """Let the prefetcher follow queue changes"""
+        if self.prefetcher:
+            self.prefetcher.refresh()
+        self.save()
     
     def get_queue_text(self) -> str:
         """Get formatted queue text"""
@@ -95,7 +257,7 @@ class MusicQueue:
         # Queue
         if self.queue:
             text += f"**📋 Queue ({len(self.queue)} tracks):**\n"
-            for i, track in enumerate(self.queue[:10], 1):  # Show first 10
+            for i, track in enumerate(islice(self.queue, 10), 1):  # Show first 10
                 text += f"`{i}.` **{track.title}** - {self._format_duration(track.duration)}\n"
             
             if len(self.queue) > 10:
@@ -121,9 +283,43 @@ queues: Dict[int, MusicQueue] = {}
 def get_queue(chat_id: int) -> MusicQueue:
     """Get or create queue for chat"""
     if chat_id not in queues:
-        queues[chat_id] = MusicQueue()
+        # Imported here to avoid circular imports
+        from utils.prefetch import Prefetcher
+        
+        queue = MusicQueue()
+        queue.prefetcher = Prefetcher(queue)
+        queue.chat_id = chat_id
+        queue.store = queue_store
+        queues[chat_id] = queue
     return queues[chat_id]
 
+# Restores in progress, so handlers of the same chat wait for one read
+restoring: Dict[int, asyncio.Task] = {}
+
+async def load_queue(chat_id: int) -> MusicQueue:
+    """Get queue for chat, restoring its saved state on first access"""
+    if chat_id in queues or not queue_store.has(chat_id):
+        return get_queue(chat_id)
+    
+    task = restoring.get(chat_id)
+    if task is None:
+        task = restoring[chat_id] = asyncio.ensure_future(_restore_queue(chat_id))
+        task.add_done_callback(lambda _: restoring.pop(chat_id, None))
+    # Finished for the other callers even if this one is cancelled
+    return await asyncio.shield(task)
+
+async def _restore_queue(chat_id: int) -> MusicQueue:
+    """Read the saved state of a chat into its queue"""
+    try:
+        data = await queue_store.load(chat_id)
+        queue = get_queue(chat_id)
+        # A queue made meanwhile without load_queue() only takes the saved state while it is unused
+        if data and not queue.current and not queue.queue:
+            queue.restore(data)
+        return queue
+    finally:
+        queue_store.restored(chat_id)
+
 def clear_queue(chat_id: int):
     """Clear queue for chat"""
     if chat_id in queues:
@@ -132,4 +328,6 @@ def clear_queue(chat_id: int):
 def remove_queue(chat_id: int):
     """Remove queue for chat"""
     if chat_id in queues:
-        del queues[chat_id]
\ No newline at end of file
+        queues[chat_id].clear()
+        del queues[chat_id]
+        queue_store.mark_dirty(chat_id, None)
\ No newline at end of file
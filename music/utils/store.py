@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class QueueStore:
+    """Write-behind MongoDB persistence for chat queues"""
+
+    def __init__(self, collection=None, flush_interval: float = Config.QUEUE_FLUSH_INTERVAL):
+        # Any motor-compatible collection works, e.g. an in-process fake in tests
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.dirty: Dict[int, object] = {}
+        self.saved: Set[int] = set()
+        self.writes = 0
+        self.errors = 0
+        self._client = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Check if a collection is configured"""
+        return self.collection is not None
+
+    async def connect(self):
+        """Connect to MongoDB and index chats that have saved queues"""
+        if self.collection is None:
+            if not Config.MONGO_URI:
+                return
+
+            from motor.motor_asyncio import AsyncIOMotorClient
+            self._client = AsyncIOMotorClient(Config.MONGO_URI)
+            self.collection = self._client[Config.MONGO_DB].queues
+
+        # Only ids are read now, the queues themselves on first access
+        self.saved = set(await self.collection.distinct('_id'))
+        logger.info(f"✓ Queue store connected: {len(self.saved)} saved queues")
+
+    def has(self, chat_id: int) -> bool:
+        """Check if chat has a saved queue that was not restored yet"""
+        return chat_id in self.saved
+
+    def restored(self, chat_id: int):
+        """Forget the saved queue of a chat once it is back in memory"""
+        self.saved.discard(chat_id)
+
+    async def load(self, chat_id: int) -> Optional[Dict]:
+        """Read saved queue state of a chat"""
+        try:
+            return await self.collection.find_one({'_id': chat_id})
+        except Exception as e:
+            logger.error(f"Queue store read error: {e}")
+            return None
+
+    def mark_dirty(self, chat_id: int, queue):
+        """Schedule a write of the queue, or a delete if queue is None"""
+        if not self.enabled:
+            return
+
+        self.dirty[chat_id] = queue
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+            except RuntimeError:
+                # No event loop, the next change or flush() picks it up
+                pass
+
+    async def flush(self):
+        """Write all pending changes in one batch"""
+        if not self.dirty:
+            return
+
+        # Imported here so pymongo is only needed with a database configured
+        from pymongo import DeleteOne, ReplaceOne
+
+        dirty, self.dirty = self.dirty, {}
+        operations = []
+        for chat_id, queue in dirty.items():
+            # Snapshot now, so changes made since mark_dirty() are included
+            data = queue.to_dict() if queue is not None else None
+            if data:
+                operations.append(ReplaceOne({'_id': chat_id}, data, upsert=True))
+            else:
+                operations.append(DeleteOne({'_id': chat_id}))
+
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+            self.writes += len(operations)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Queue store write error: {e}")
+            # Retry with the next batch unless a newer change replaced them
+            for chat_id, queue in dirty.items():
+                self.dirty.setdefault(chat_id, queue)
+
+    async def close(self):
+        """Flush pending changes and disconnect"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        if self.enabled:
+            await self.flush()
+        if self._client:
+            self._client.close()
+
+    def stats(self) -> Dict:
+        """Get store statistics"""
+        return {
+            'enabled': self.enabled,
+            'pending': len(self.dirty),
+            'writes': self.writes,
+            'errors': self.errors,
+        }
+
+    async def _flush_later(self):
+        """Coalesce changes made within the flush interval into one batch"""
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+# Global queue store
+queue_store = QueueStore()
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+from typing import Coroutine, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class TaskRegistry:
+    """Background tasks per chat, at most one task for each name"""
+
+    def __init__(self):
+        self.tasks: Dict[int, Dict[str, asyncio.Task]] = {}
+
+    def start(self, chat_id: int, name: str, coro: Coroutine) -> asyncio.Task:
+        """Start a task, cancelling the one it replaces"""
+        self.cancel(chat_id, name)
+        task = asyncio.create_task(coro)
+        self.tasks.setdefault(chat_id, {})[name] = task
+        task.add_done_callback(lambda t: self._discard(chat_id, name, t))
+        return task
+
+    def cancel(self, chat_id: int, name: Optional[str] = None):
+        """Cancel one named task of a chat, or all of them"""
+        chat_tasks = self.tasks.get(chat_id)
+        if not chat_tasks:
+            return
+
+        for task_name in [name] if name else list(chat_tasks):
+            task = chat_tasks.pop(task_name, None)
+            # A task may replace itself, e.g. a watcher that starts the next track
+            if task and task is not asyncio.current_task():
+                task.cancel()
+
+        if not chat_tasks:
+            del self.tasks[chat_id]
+
+    def count(self) -> int:
+        """Get number of running tasks"""
+        return sum(len(chat_tasks) for chat_tasks in self.tasks.values())
+
+    def _discard(self, chat_id: int, name: str, task: asyncio.Task):
+        """Forget a finished task unless it was already replaced"""
+        chat_tasks = self.tasks.get(chat_id)
+        if chat_tasks and chat_tasks.get(name) is task:
+            del chat_tasks[name]
+            if not chat_tasks:
+                del self.tasks[chat_id]
+
+        if not task.cancelled() and task.exception():
+            logger.error(f"Task {name} failed in {chat_id}: {task.exception()}")
+
+# Global task registry for playback
+playback_tasks = TaskRegistry()
@@ -0,0 +1,158 @@
+"""
+Per-request latency tracing.
+
+A trace is started for each traced command and kept in a context variable,
+so every span recorded while handling the command, including in tasks it
+starts, lands in the same trace. Finished traces are kept in memory for
+/trace and appended to TRACE_FILE as one JSON object per line.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+from utils.executors import trace_pool
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    """Timed stages of one request"""
+
+    def __init__(self, name: str, chat_id: Optional[int] = None, detail: str = ""):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.chat_id = chat_id
+        self.detail = detail
+        self.started = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.spans: List[Dict] = []
+
+    def add_span(self, stage: str, start: float, duration: float, error: Optional[str] = None):
+        """Record a finished stage"""
+        self.spans.append({
+            'span_id': uuid.uuid4().hex[:16],
+            'name': stage,
+            'start': start,
+            'duration': duration,
+            'error': error,
+        })
+
+    def stages(self) -> Dict[str, float]:
+        """Get total time per stage"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span['name']] = totals.get(span['name'], 0.0) + span['duration']
+        return totals
+
+    def to_dict(self) -> Dict:
+        """Convert to a JSON-ready dict"""
+        return {
+            'trace_id': self.id,
+            'name': self.name,
+            'chat_id': self.chat_id,
+            'detail': self.detail,
+            'start': self.started,
+            'duration': self.duration,
+            'error': self.error,
+            'spans': self.spans,
+        }
+
+# Trace of the request being handled
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+class Tracer:
+    """Keeps recent traces and exports finished ones"""
+
+    def __init__(self, path: str = Config.TRACE_FILE, keep: int = Config.TRACE_KEEP):
+        self.path = path
+        self.recent: Deque[Trace] = deque(maxlen=keep)
+        self._writes: Set[asyncio.Task] = set()
+
+    def start(self, name: str, chat_id: Optional[int] = None, detail: str = "") -> Trace:
+        """Start a trace"""
+        return Trace(name, chat_id, detail)
+
+    def finish(self, trace: Trace, error: Optional[str] = None):
+        """Close a trace and export it"""
+        trace.duration = time.time() - trace.started
+        trace.error = error
+        self.recent.append(trace)
+        line = json.dumps(trace.to_dict())
+        task = asyncio.get_running_loop().create_task(trace_pool.run(self._write, line))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def flush(self):
+        """Wait for trace lines still being written"""
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def record(self, stage: str, start: float, duration: float, error: Optional[str] = None):
+        """Add a span to the current trace, if the request is still being handled"""
+        trace = current_trace.get()
+        if trace and trace.duration is None:
+            trace.add_span(stage, start, duration, error)
+
+    @contextmanager
+    def span(self, stage: str):
+        """Time a block as a stage of the current trace"""
+        start = time.time()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(stage, start, time.time() - start, error)
+
+    def slowest(self, count: int) -> List[Trace]:
+        """Get the slowest recent traces"""
+        return sorted(self.recent, key=lambda t: t.duration, reverse=True)[:count]
+
+    def find(self, trace_id: str) -> Optional[Trace]:
+        """Find a recent trace by id or id prefix"""
+        return next((t for t in reversed(self.recent) if t.id.startswith(trace_id)), None)
+
+    def _write(self, line: str):
+        """Append a trace line, starting a new file when the current one is full"""
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > Config.TRACE_FILE_SIZE:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+        except Exception as e:
+            logger.debug(f"Trace export failed: {e}")
+
+# Global tracer
+tracer = Tracer()
+
+def traced(name: str):
+    """Trace a (client, message) command handler"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(client, message, *args, **kwargs):
+            text = message.text or ""
+            trace = tracer.start(name, message.chat.id, text[:100])
+            # Handlers share dispatcher tasks, so the trace is unset afterwards
+            token = current_trace.set(trace)
+            error = None
+            try:
+                return await func(client, message, *args, **kwargs)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                current_trace.reset(token)
+                tracer.finish(trace, error)
+        return wrapper
+    return decorator
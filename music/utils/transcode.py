@@ -0,0 +1,184 @@
+"""
+Background transcoding of cached audio to raw PCM.
+
+A file passed to MediaStream is decoded and resampled by ffmpeg in real
+time, once per chat and per play. Downloaded audio is converted once to
+the signed 16-bit PCM calls are sent at (PCM_SAMPLE_RATE, PCM_CHANNELS)
+and stored in the media cache next to its source, so later plays hand the
+file to the call as raw input and no ffmpeg runs for them. Transcodes a
+chat is waiting for skip the queue, and the file they write can be read
+while it grows (see utils.fanout).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+from utils.cache import media_cache
+from utils.metrics import timed
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PCM_EXT = ".pcm"
+
+class Transcoder:
+    """Converts cached audio files to raw PCM, a few at a time"""
+
+    def __init__(self, workers: int = Config.TRANSCODE_WORKERS):
+        self.workers = workers
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # Output files of the transcodes that are running, by key
+        self.partials: Dict[str, str] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.completed = 0
+        self.failed = 0
+        self.total_time = 0.0
+
+    @staticmethod
+    def is_pcm(filepath: str) -> bool:
+        """Check if path is a transcoded file"""
+        return filepath.endswith(PCM_EXT)
+
+    @staticmethod
+    def pcm_key(filepath: str) -> str:
+        """Get cache key of the PCM version of a cached file"""
+        return f"{media_cache.key_for_path(filepath)}-pcm"
+
+    def get(self, filepath: str) -> Optional[str]:
+        """Get the PCM version of a cached audio file, if it has been made"""
+        if self.is_pcm(filepath):
+            return filepath if os.path.exists(filepath) else None
+
+        key = self.pcm_key(filepath)
+        return media_cache.get(key) if media_cache.contains(key) else None
+
+    def submit(self, filepath: str, urgent: bool = False):
+        """Start transcoding a cached audio file in the background, urgent ones start now"""
+        if self.is_pcm(filepath) or not (Config.PCM_CACHE or urgent):
+            return
+
+        key = self.pcm_key(filepath)
+        if media_cache.contains(key):
+            return
+
+        task = self.tasks.get(key)
+        if task and urgent and key not in self.partials:
+            # Still waiting for a worker slot
+            task.cancel()
+            task = None
+        if task:
+            return
+
+        if urgent:
+            # Started here so the output can be read as soon as this returns
+            self._prepare(key)
+        task = asyncio.create_task(self._ingest(key, filepath, urgent))
+        self.tasks[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+
+    def running(self, filepath: str) -> Optional[Tuple[str, asyncio.Task]]:
+        """Get output file and task of a running transcode of filepath"""
+        key = self.pcm_key(filepath)
+        if key not in self.partials:
+            return None
+        return self.partials[key], self.tasks[key]
+
+    def _prepare(self, key: str) -> str:
+        """Create the output file of a transcode, moved into the cache once complete"""
+        os.makedirs(media_cache.partial_directory, exist_ok=True)
+        partial = os.path.join(media_cache.partial_directory, key + PCM_EXT)
+        # ffmpeg truncates rather than replaces it, so readers that opened it stay attached
+        open(partial, "wb").close()
+        self.partials[key] = partial
+        return partial
+
+    def _forget(self, key: str, task: asyncio.Task):
+        """Drop a finished transcode"""
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+            # Set up in submit() for a task cancelled before it ran
+            if key in self.partials:
+                self._remove(self.partials.pop(key))
+
+    async def _ingest(self, key: str, filepath: str, urgent: bool = False):
+        """Transcode one file once a worker slot is free"""
+        if urgent:
+            await self._run(key, filepath)
+            return
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        async with self._semaphore:
+            self._prepare(key)
+            await self._run(key, filepath)
+
+    async def _run(self, key: str, filepath: str):
+        """Transcode one file, failures are logged"""
+        # Keep the source on disk until ffmpeg is done with it
+        media_cache.pin(filepath)
+        started = time.monotonic()
+        try:
+            await self._transcode(filepath, self.partials[key], key)
+            self.completed += 1
+            self.total_time += time.monotonic() - started
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Transcode failed for {filepath}: {e}")
+        finally:
+            # Already moved into the cache when the transcode succeeded
+            self._remove(self.partials.pop(key))
+            media_cache.unpin(filepath)
+
+    @timed("transcode")
+    async def _transcode(self, source: str, partial: str, key: str):
+        """Run ffmpeg and register the finished file in the media cache"""
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", source,
+            "-vn", "-f", "s16le", "-acodec", "pcm_s16le",
+            "-ar", str(Config.PCM_SAMPLE_RATE), "-ac", str(Config.PCM_CHANNELS), partial,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+
+        if process.returncode != 0:
+            raise RuntimeError(stderr.decode(errors="replace").strip()[-200:] or f"ffmpeg exited with {process.returncode}")
+
+        target = os.path.join(media_cache.directory, key + PCM_EXT)
+        os.replace(partial, target)
+        media_cache.put(key, target)
+        logger.info(f"Transcoded to PCM: {os.path.basename(source)}")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cancel_all(self):
+        """Stop pending and running transcodes"""
+        for task in list(self.tasks.values()):
+            task.cancel()
+
+    def stats(self) -> Dict:
+        """Get transcoder counters"""
+        return {
+            'pending': len(self.tasks),
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_time': self.total_time / self.completed if self.completed else 0.0,
+        }
+
+# Global transcoder instance
+transcoder = Transcoder()
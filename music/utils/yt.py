@@ -1,15 +1,78 @@
 import os
 import re
+import time
+import hashlib
 import asyncio
-import yt_dlp
-from typing import Dict, List, Optional, Tuple
-from youtubesearchpython import VideosSearch
+from urllib.parse import urlparse
+from typing import Callable, Dict, List, Optional, Tuple
 from utils.queue import Track, MediaType
-from utils.helpers import clean_filename, format_duration
+from utils.helpers import clean_filename, format_duration, download_file
+from utils.cache import media_cache, info_cache, search_cache
+from utils.transcode import transcoder
+from utils.executors import search_pool, extract_pool, download_pool, process_pool, dispatch_progress
+from utils import ytworker
+from utils.broker import broker, JobCancelled, WorkersUnavailable
+from utils.metrics import timed
+from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
+YOUTUBE_ID_PATTERN = re.compile(r'(?:v=|youtu\.be/|shorts/|embed/|live/)([\w-]{11})')
+
+URL_PATTERN = re.compile(
+    r'^https?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain...
+    r'localhost|'  # localhost...
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or ip
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+
+# Seconds of validity a cached stream URL must have left to be reused
+STREAM_URL_MARGIN = 300
+
+def search_videos(query: str, limit: int) -> List[Dict]:
+    """Search YouTube, the search library is imported on first use since it is slow to load"""
+    from youtubesearchpython import VideosSearch
+    
+    return VideosSearch(query, limit=limit).result()['result']
+
+class SharedDownload:
+    """One running download, shared by every request for the same file"""
+    
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.callbacks: List[Callable] = []
+        # None for requesters that can't cancel, which keeps the download going
+        self.cancel_events: List = []
+        self.last_progress: Optional[Tuple[int, int]] = None
+    
+    def join(self, progress_callback=None, cancel_event=None):
+        """Subscribe a requester to progress and cancellation"""
+        self.cancel_events.append(cancel_event)
+        if progress_callback:
+            self.callbacks.append(progress_callback)
+            if self.last_progress:
+                # Late joiners start from where the download is now
+                asyncio.ensure_future(progress_callback(*self.last_progress))
+    
+    def leave(self, progress_callback=None):
+        """Stop sending progress to a requester"""
+        if progress_callback in self.callbacks:
+            self.callbacks.remove(progress_callback)
+    
+    def is_set(self) -> bool:
+        """Cancel event of the shared job, set once every requester has cancelled"""
+        return all(event is not None and event.is_set() for event in self.cancel_events)
+    
+    async def progress(self, downloaded: int, total: int):
+        """Pass a progress event on to every requester"""
+        self.last_progress = (downloaded, total)
+        await asyncio.gather(
+            *(callback(downloaded, total) for callback in list(self.callbacks)),
+            return_exceptions=True
+        )
+
 class YouTubeDownloader:
     """YouTube and other platform downloader"""
     
@@ -40,113 +103,220 @@ class YouTubeDownloader:
             'quiet': True,
             'extractflat': False,
         }
+        
+        self.info_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extractflat': False,
+        }
+        
+        # Option profiles, each backed by its own pool of YoutubeDL instances
+        self.profiles = {
+            'info': self.info_opts,
+            'audio': self.audio_opts,
+            'video': self.video_opts,
+            'stream-audio': dict(self.info_opts, format=self.audio_opts['format']),
+            'stream-video': dict(self.info_opts, format=self.video_opts['format']),
+        }
+        
+        # Running downloads by cache key
+        self.downloads: Dict[str, SharedDownload] = {}
+        self.coalesced = 0
     
     async def search(self, query: str, limit: int = 5) -> List[Dict]:
         """Search for videos"""
         try:
-            loop = asyncio.get_event_loop()
-            search = await loop.run_in_executor(
-                None, lambda: VideosSearch(query, limit=limit)
+            return await search_cache.get_or_fetch(
+                query, limit, lambda: self._search(query, limit)
             )
-            results = search.result()['result']
-            return results
         except Exception as e:
             logger.error(f"Search error: {e}")
             return []
     
+    @timed("search")
+    async def _search(self, query: str, limit: int) -> List[Dict]:
+        """Run search on the backend"""
+        return await search_pool.run(search_videos, query, limit)
+    
     async def get_info(self, url: str) -> Optional[Dict]:
         """Get video/audio info"""
         try:
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extractflat': False,
-            }
-            
-            loop = asyncio.get_event_loop()
+            key = self.get_cache_key(url, 'info')
+            cached = await info_cache.get(key)
+            if cached:
+                return cached
             
-            def extract_info():
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    return ydl.extract_info(url, download=False)
+            info = await self._extract(ytworker.extract_info, 'info', url)
+            if not info:
+                return None
             
-            info = await loop.run_in_executor(None, extract_info)
+            info_cache.put(key, info)
             return info
+        except WorkersUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Info extraction error: {e}")
             return None
     
-    async def download_audio(self, url: str, progress_callback=None) -> Optional[str]:
-        """Download audio from URL"""
+    async def get_stream_url(self, url: str, media_type: MediaType) -> Optional[Dict]:
+        """Resolve direct media URL for streaming without downloading"""
         try:
-            def progress_hook(d):
-                if progress_callback and d['status'] == 'downloading':
-                    if 'downloaded_bytes' in d and 'total_bytes' in d:
-                        asyncio.create_task(progress_callback(
-                            d['downloaded_bytes'], 
-                            d['total_bytes']
-                        ))
-            
-            opts = self.audio_opts.copy()
-            opts['progress_hooks'] = [progress_hook]
-            
-            loop = asyncio.get_event_loop()
-            
-            def download():
-                with yt_dlp.YoutubeDL(opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    filename = ydl.prepare_filename(info)
-                    # Change extension to mp3 if needed
-                    base_name = os.path.splitext(filename)[0]
-                    mp3_file = f"{base_name}.mp3"
-                    if os.path.exists(filename) and filename != mp3_file:
-                        os.rename(filename, mp3_file)
-                    return mp3_file if os.path.exists(mp3_file) else filename
-            
-            filepath = await loop.run_in_executor(None, download)
-            return filepath if os.path.exists(filepath) else None
+            # Reuse the format URL picked at extraction time while it is still valid
+            info = await info_cache.get(self.get_cache_key(url, 'info'))
+            stream = info and info.get('streams', {}).get(media_type.value)
+            if stream and stream['expires'] - STREAM_URL_MARGIN > time.time():
+                return stream
             
+            return await self._extract(ytworker.resolve_stream, f"stream-{media_type.value}", url)
+        except WorkersUnavailable:
+            raise
         except Exception as e:
-            logger.error(f"Audio download error: {e}")
+            logger.error(f"Stream URL error: {e}")
             return None
     
-    async def download_video(self, url: str, progress_callback=None) -> Optional[str]:
+    async def download_audio(self, url: str, progress_callback=None, cancel_event=None) -> Optional[str]:
+        """Download audio from URL"""
+        filepath = await self._fetch(url, 'audio', progress_callback, cancel_event)
+        if filepath:
+            # Also covers files cached before the PCM cache was enabled, or whose PCM was evicted
+            transcoder.submit(filepath)
+        return filepath
+    
+    async def download_video(self, url: str, progress_callback=None, cancel_event=None) -> Optional[str]:
         """Download video from URL"""
+        return await self._fetch(url, 'video', progress_callback, cancel_event)
+    
+    async def _fetch(self, url: str, fmt: str, progress_callback=None, cancel_event=None) -> Optional[str]:
+        """Get a file from the cache, or from the download of it that is running or gets started"""
         try:
-            def progress_hook(d):
-                if progress_callback and d['status'] == 'downloading':
-                    if 'downloaded_bytes' in d and 'total_bytes' in d:
-                        asyncio.create_task(progress_callback(
-                            d['downloaded_bytes'], 
-                            d['total_bytes']
-                        ))
-            
-            opts = self.video_opts.copy()
-            opts['progress_hooks'] = [progress_hook]
+            key = self.get_cache_key(url, fmt)
+            cached = media_cache.get(key)
+            if cached:
+                return cached
             
-            loop = asyncio.get_event_loop()
+            shared = self.downloads.get(key)
+            if shared:
+                self.coalesced += 1
+            else:
+                shared = self.downloads[key] = SharedDownload()
+                shared.task = asyncio.create_task(self._download_to_cache(url, fmt, key, shared))
+                shared.task.add_done_callback(lambda task: self._download_done(key, shared))
             
-            def download():
-                with yt_dlp.YoutubeDL(opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    return ydl.prepare_filename(info)
-            
-            filepath = await loop.run_in_executor(None, download)
-            return filepath if os.path.exists(filepath) else None
+            shared.join(progress_callback, cancel_event)
+            try:
+                # Requesters that go away must not cancel the download for the others
+                return await asyncio.shield(shared.task)
+            finally:
+                shared.leave(progress_callback)
             
+        except (ytworker.Cancelled, JobCancelled):
+            logger.info(f"{fmt.title()} download cancelled: {url}")
+            return None
+        except WorkersUnavailable:
+            raise
         except Exception as e:
-            logger.error(f"Video download error: {e}")
+            logger.error(f"{fmt.title()} download error: {e}")
+            return None
+    
+    def _download_done(self, key: str, shared: SharedDownload):
+        """Forget a finished download"""
+        if self.downloads.get(key) is shared:
+            del self.downloads[key]
+        # Mark the error as seen in case every requester left before it came
+        if not shared.task.cancelled():
+            shared.task.exception()
+    
+    async def _download_to_cache(self, url: str, fmt: str, key: str, shared: SharedDownload) -> Optional[str]:
+        """Download a file under a temporary name and move it into the cache when complete"""
+        if self.is_direct_link(url):
+            filepath = await self._download_direct(url, key)
+        else:
+            outtmpl = os.path.join(media_cache.partial_directory, f"{key}.%(ext)s")
+            filepath = await self._download(fmt, url, outtmpl, fmt == 'audio', shared.progress, shared)
+            if filepath and os.path.exists(filepath):
+                filepath = self._publish(filepath)
+        
+        if not filepath or not os.path.exists(filepath):
             return None
+        return media_cache.put(key, filepath)
+    
+    def _publish(self, partial: str) -> str:
+        """Move a finished download into the cache directory"""
+        filepath = os.path.join(media_cache.directory, os.path.basename(partial))
+        os.replace(partial, filepath)
+        return filepath
+    
+    @timed("extract")
+    async def _extract(self, func, profile: str, url: str):
+        """Run an extraction job on the configured backend"""
+        opts = self.profiles[profile]
+        if Config.YTDL_BACKEND == "process":
+            return await process_pool.run(func, profile, url, opts)
+        if Config.YTDL_BACKEND == "broker":
+            return await broker.run(func.__name__, profile, url, opts)
+        return await extract_pool.run(func, profile, url, opts)
+    
+    @timed("download")
+    async def _download(self, profile: str, url: str, outtmpl: str, convert_mp3: bool,
+                        progress_callback=None, cancel_event=None) -> str:
+        """Run a download job on the configured backend"""
+        opts = self.profiles[profile]
+        if Config.YTDL_BACKEND == "process":
+            return await process_pool.run_job(
+                ytworker.download_job, profile, url, opts, outtmpl, convert_mp3,
+                progress_callback=progress_callback,
+                cancel_event=cancel_event
+            )
+        if Config.YTDL_BACKEND == "broker":
+            return await broker.run(
+                'download', profile, url, opts, outtmpl, convert_mp3,
+                progress_callback=progress_callback,
+                cancel_event=cancel_event
+            )
+        
+        # The hook runs in a pool thread, progress is handed to the loop thread
+        loop = asyncio.get_running_loop()
+        last_sent = 0.0
+        
+        def progress_hook(d):
+            nonlocal last_sent
+            if cancel_event and cancel_event.is_set():
+                # Runs inside yt-dlp, which is loaded by now
+                import yt_dlp
+                raise yt_dlp.utils.DownloadCancelled("Download cancelled")
+            if progress_callback and d['status'] == 'downloading':
+                if 'downloaded_bytes' in d and 'total_bytes' in d:
+                    now = time.monotonic()
+                    if now - last_sent >= ytworker.PROGRESS_INTERVAL:
+                        last_sent = now
+                        loop.call_soon_threadsafe(
+                            dispatch_progress, progress_callback,
+                            d['downloaded_bytes'], d['total_bytes']
+                        )
+        
+        return await download_pool.run(
+            ytworker.download, profile, url, opts, outtmpl, convert_mp3, progress_hook
+        )
+    
+    @timed("download")
+    async def _download_direct(self, url: str, key: str) -> Optional[str]:
+        """Download a direct media link over the shared HTTP session"""
+        ext = os.path.splitext(urlparse(url).path)[1].lower()
+        filepath = os.path.join(media_cache.directory, f"{key}{ext}")
+        return filepath if await download_file(url, filepath) else None
+    
+    async def warm_up(self):
+        """Create pooled YoutubeDL instances ahead of the first request"""
+        if Config.YTDL_BACKEND == "process":
+            process_pool.start(self.profiles)
+        elif Config.YTDL_BACKEND == "broker":
+            await broker.start(self.profiles)
+        else:
+            await extract_pool.run(ytworker.warm_pools, self.profiles)
     
     def is_url(self, text: str) -> bool:
         """Check if text is a valid URL"""
-        url_pattern = re.compile(
-            r'^https?://'  # http:// or https://
-            r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain...
-            r'localhost|'  # localhost...
-            r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or ip
-            r'(?::\d+)?'  # optional port
-            r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-        return url_pattern.match(text) is not None
+        return URL_PATTERN.match(text) is not None
     
     def get_platform(self, url: str) -> str:
         """Get platform from URL"""
@@ -159,6 +329,29 @@ class YouTubeDownloader:
         else:
             return 'direct'
     
+    def is_direct_link(self, url: str) -> bool:
+        """Check if URL points straight at a supported media file"""
+        ext = os.path.splitext(urlparse(url).path)[1].lower()
+        return self.get_platform(url) == 'direct' and ext in Config.SUPPORTED_FORMATS
+    
+    def get_video_id(self, url: str) -> str:
+        """Get video id from URL without network access"""
+        if self.get_platform(url) == 'youtube':
+            match = YOUTUBE_ID_PATTERN.search(url)
+            if match:
+                return match.group(1)
+        
+        # Other platforms are keyed by a hash of the URL itself
+        return hashlib.sha1(url.encode()).hexdigest()[:16]
+    
+    def get_cache_key(self, url: str, fmt: str) -> str:
+        """Get media cache key for URL and format"""
+        return media_cache.make_key(self.get_platform(url), self.get_video_id(url), fmt)
+    
+    def is_cached(self, url: str, fmt: str) -> bool:
+        """Check if URL is already downloaded in the given format"""
+        return media_cache.contains(self.get_cache_key(url, fmt))
+    
     async def create_track_from_info(self, info: Dict, media_type: MediaType, 
                                    requested_by: str, user_id: int, chat_id: int) -> Track:
         """Create track object from video info"""
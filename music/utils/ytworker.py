@@ -0,0 +1,227 @@
+"""
+yt-dlp jobs that run in worker threads or worker processes.
+Everything here only takes and returns plain, picklable data.
+
+yt-dlp itself is slow to import, so it is imported by the first job or
+pool warm-up rather than when the bot starts.
+"""
+
+import os
+import re
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+from config import Config
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+EXPIRE_PATTERN = re.compile(r'[?&/]expire[=/](\d+)')
+
+# Slots in the shared array parent processes use to cancel jobs
+CANCEL_SLOTS = 256
+
+# Seconds between progress events sent to the parent process
+PROGRESS_INTERVAL = 0.5
+
+# Set in worker processes by init_worker()
+_progress_queue = None
+_cancelled = None
+
+class Cancelled(Exception):
+    """Raised by download() when a progress hook cancelled the download"""
+
+class YDLPool:
+    """Reusable YoutubeDL instances for one option profile"""
+
+    def __init__(self, opts: Dict, size: int):
+        self.opts = opts
+        self.size = size
+        self.idle: "queue.LifoQueue[yt_dlp.YoutubeDL]" = queue.LifoQueue()
+        self.created = 0
+
+    def warm(self):
+        """Create instances up to the pool size ahead of time"""
+        while self.idle.qsize() < self.size:
+            self.idle.put(self._create())
+
+    @contextmanager
+    def acquire(self, outtmpl: Optional[str] = None, progress_hook: Optional[Callable] = None):
+        """Check out an instance with per-call output template and progress hook"""
+        try:
+            ydl = self.idle.get_nowait()
+        except queue.Empty:
+            ydl = self._create()
+
+        default_outtmpl = ydl.params['outtmpl']['default']
+        if outtmpl:
+            ydl.params['outtmpl']['default'] = outtmpl
+        if progress_hook:
+            ydl.add_progress_hook(progress_hook)
+
+        try:
+            yield ydl
+        except BaseException:
+            # State after a failed or cancelled download is unknown, don't reuse it
+            ydl.close()
+            raise
+        else:
+            if progress_hook:
+                ydl._progress_hooks.remove(progress_hook)
+            ydl.params['outtmpl']['default'] = default_outtmpl
+            if self.idle.qsize() < self.size:
+                self.idle.put(ydl)
+            else:
+                ydl.close()
+
+    def _create(self) -> "yt_dlp.YoutubeDL":
+        """Create a new instance"""
+        import yt_dlp
+        
+        self.created += 1
+        return yt_dlp.YoutubeDL(dict(self.opts))
+
+_pools: Dict[str, YDLPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(profile: str, opts: Dict) -> YDLPool:
+    """Get the instance pool for an option profile"""
+    pool = _pools.get(profile)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(profile)
+            if pool is None:
+                pool = _pools[profile] = YDLPool(opts, Config.YTDL_POOL_SIZE)
+    return pool
+
+def warm_pools(profiles: Dict[str, Dict]):
+    """Pre-create instances for each profile"""
+    for profile, opts in profiles.items():
+        get_pool(profile, opts).warm()
+
+def init_worker(progress_queue, cancelled, profiles: Dict[str, Dict]):
+    """Set up a worker process and warm up yt-dlp"""
+    global _progress_queue, _cancelled
+    _progress_queue = progress_queue
+    _cancelled = cancelled
+
+    # Build instances now so the first request doesn't pay for it
+    warm_pools(profiles)
+
+def warm_up() -> int:
+    """No-op job used to start worker processes ahead of time"""
+    return os.getpid()
+
+def timed_call(func: Callable, *args):
+    """Run func(*args), returning when it started along with its result"""
+    # The monotonic clock is shared by all processes on the machine
+    started = time.monotonic()
+    return started, func(*args)
+
+def get_url_expiry(url: str) -> float:
+    """Get expiry time of a media URL"""
+    match = EXPIRE_PATTERN.search(url)
+    if match:
+        return float(match.group(1))
+    return time.time() + Config.STREAM_URL_TTL
+
+def stream_entry(fmt: Dict, info: Dict) -> Dict:
+    """Build stream entry from a yt-dlp format"""
+    return {
+        'url': fmt['url'],
+        'headers': fmt.get('http_headers') or info.get('http_headers', {}),
+        'expires': get_url_expiry(fmt['url']),
+    }
+
+def compact_info(info: Dict) -> Dict:
+    """Keep only the fields needed to build and stream a track"""
+    formats = info.get('formats') or [info]
+
+    # Best audio-only format, and best progressive format up to 720p
+    audio = [
+        f for f in formats
+        if f.get('url') and f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')
+    ]
+    video = [
+        f for f in formats
+        if f.get('url') and f.get('vcodec') not in (None, 'none') and f.get('acodec') not in (None, 'none')
+        and (f.get('height') or 0) <= 720
+    ]
+
+    streams = {}
+    if audio:
+        best = max(audio, key=lambda f: f.get('abr') or f.get('tbr') or 0)
+        streams['audio'] = stream_entry(best, info)
+    if video:
+        best = max(video, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0))
+        streams['video'] = stream_entry(best, info)
+
+    return {
+        'id': info.get('id'),
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration') or 0,
+        'thumbnail': info.get('thumbnail', ''),
+        'webpage_url': info.get('webpage_url', info.get('url', '')),
+        'streams': streams,
+    }
+
+def extract_info(profile: str, url: str, opts: Dict) -> Optional[Dict]:
+    """Extract info and return its compact form"""
+    with get_pool(profile, opts).acquire() as ydl:
+        info = ydl.extract_info(url, download=False)
+    return compact_info(info) if info else None
+
+def resolve_stream(profile: str, url: str, opts: Dict) -> Optional[Dict]:
+    """Resolve the direct URL of the format selected by opts"""
+    with get_pool(profile, opts).acquire() as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    # Merged formats have no single URL that can be streamed
+    if not info or not info.get('url'):
+        return None
+    return stream_entry(info, info)
+
+def download(profile: str, url: str, opts: Dict, outtmpl: str, convert_mp3: bool = False,
+             progress_hook: Optional[Callable] = None) -> str:
+    """Download media and return the file path"""
+    import yt_dlp
+    
+    try:
+        with get_pool(profile, opts).acquire(outtmpl, progress_hook) as ydl:
+            info = ydl.extract_info(url, download=True)
+            filename = ydl.prepare_filename(info)
+    except yt_dlp.utils.DownloadCancelled as e:
+        # Callers don't need yt-dlp loaded to catch this one
+        raise Cancelled(str(e)) from None
+
+    if not convert_mp3:
+        return filename
+
+    # Change extension to mp3 if needed
+    base_name = os.path.splitext(filename)[0]
+    mp3_file = f"{base_name}.mp3"
+    if os.path.exists(filename) and filename != mp3_file:
+        os.rename(filename, mp3_file)
+    return mp3_file if os.path.exists(mp3_file) else filename
+
+def download_job(job_id: int, profile: str, url: str, opts: Dict, outtmpl: str,
+                 convert_mp3: bool = False) -> str:
+    """Download in a worker process, reporting progress to the parent"""
+    import yt_dlp
+    
+    last_sent = 0.0
+
+    def progress_hook(d):
+        nonlocal last_sent
+        if _cancelled[job_id % CANCEL_SLOTS] == job_id:
+            raise yt_dlp.utils.DownloadCancelled("Download cancelled")
+
+        if d['status'] == 'downloading' and 'downloaded_bytes' in d and 'total_bytes' in d:
+            now = time.monotonic()
+            if now - last_sent >= PROGRESS_INTERVAL:
+                last_sent = now
+                _progress_queue.put((job_id, d['downloaded_bytes'], d['total_bytes']))
+
+    return download(profile, url, opts, outtmpl, convert_mp3, progress_hook)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+yt-dlp worker process for the "broker" backend.
+
+The bot starts BROKER_WORKERS of these itself. More can be started by hand,
+on the same machine, pointing at the broker socket:
+
+    python worker.py --socket cache/broker.sock --slots 4
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import yt_dlp
+from utils import ytworker
+from utils.broker import FRAME_LIMIT, send_frame, read_frame
+from config import Config
+
+logger = logging.getLogger("worker")
+
+class Worker:
+    """Runs jobs received from the broker"""
+
+    # Jobs a broker may ask for
+    JOBS = {
+        'extract_info': ytworker.extract_info,
+        'resolve_stream': ytworker.resolve_stream,
+        'download': ytworker.download,
+    }
+
+    def __init__(self, socket_path: str, slots: int):
+        self.socket_path = socket_path
+        self.slots = slots
+        self.executor = ThreadPoolExecutor(max_workers=slots, thread_name_prefix="job")
+        self.cancelled = set()
+        self.writer = None
+        self._write_lock = asyncio.Lock()
+
+    async def run(self):
+        """Connect to the broker and serve jobs until it goes away"""
+        reader, self.writer = await asyncio.open_unix_connection(self.socket_path, limit=FRAME_LIMIT)
+        await self.send({'type': 'hello', 'pid': os.getpid(), 'slots': self.slots})
+
+        welcome = await read_frame(reader)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, ytworker.warm_pools, welcome['profiles'])
+        logger.info(f"Worker {os.getpid()} ready with {self.slots} slots")
+
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                return
+
+            kind = frame['type']
+            if kind == 'ping':
+                await self.send({'type': 'pong'})
+            elif kind == 'cancel':
+                self.cancelled.add(frame['job'])
+            elif kind == 'job':
+                asyncio.create_task(self.execute(frame))
+
+    async def send(self, frame: Dict):
+        """Send a frame to the broker"""
+        async with self._write_lock:
+            await send_frame(self.writer, frame)
+
+    async def execute(self, frame: Dict):
+        """Run one job and report its result"""
+        job_id = frame['job']
+        func = self.JOBS.get(frame['func'])
+        args = frame['args']
+        loop = asyncio.get_running_loop()
+
+        if func is ytworker.download:
+            args = args + [self.progress_hook(job_id, loop)]
+
+        try:
+            if func is None:
+                raise ValueError(f"Unknown job: {frame['func']}")
+            value = await loop.run_in_executor(self.executor, func, *args)
+            await self.send({'type': 'result', 'job': job_id, 'value': value})
+        except ytworker.Cancelled as e:
+            await self.send({'type': 'error', 'job': job_id, 'error': str(e), 'cancelled': True})
+        except Exception as e:
+            await self.send({'type': 'error', 'job': job_id, 'error': str(e)})
+        finally:
+            self.cancelled.discard(job_id)
+
+    def progress_hook(self, job_id: int, loop: asyncio.AbstractEventLoop):
+        """Build a yt-dlp hook that reports throttled progress and honours cancels"""
+        last_sent = 0.0
+
+        def hook(d):
+            nonlocal last_sent
+            if job_id in self.cancelled:
+                raise yt_dlp.utils.DownloadCancelled("Download cancelled")
+
+            if d['status'] == 'downloading' and 'downloaded_bytes' in d and 'total_bytes' in d:
+                now = time.monotonic()
+                if now - last_sent >= ytworker.PROGRESS_INTERVAL:
+                    last_sent = now
+                    frame = {
+                        'type': 'progress',
+                        'job': job_id,
+                        'downloaded': d['downloaded_bytes'],
+                        'total': d['total_bytes'],
+                    }
+                    asyncio.run_coroutine_threadsafe(self.send(frame), loop)
+
+        return hook
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=Config.BROKER_SOCKET)
+    parser.add_argument("--slots", type=int, default=Config.WORKER_SLOTS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(Worker(args.socket, args.slots).run())
+    except (ConnectionError, FileNotFoundError) as e:
+        logger.error(f"Broker connection failed: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()